@@ -1,14 +1,56 @@
 from typing import Dict, Tuple, List
 import json, codecs
+import argparse
 import os
+import random
 import re
+import time
+from .diagnostics import EquationDiagnostics
+from .budget import BudgetMeter
+from .braceIndex import BraceIndex
 
 listLengthLimit = 1000
 
-def insertList (index: int, origin: List[str], lst: List[str]) -> List[str]:
-    beforePart = origin[0:index]
-    afterPart = origin[index:]
-    return beforePart + lst + afterPart
+_asciiRegex = re.compile("[\x00-\x7F]*")
+_textSegmentRegex = re.compile("[\x00-\x7F]+|[^\x00-\x7F]+")
+
+# Keywords taking limits, regularized by sumRegularizer.
+# A keyword containing another one comes first, ex) coprod before prod, dint before int.
+integralOperators = ["odint", "otint", "dint", "tint", "oint", "int"]
+bigOperators = ["sum", "SMALLSUM", "coprod", "SMCOPROD", "prod", "SMALLPROD",
+                "inter", "union", "BIGSQCUP", "BIGSQCAP", "BIGOPLUS", "BIGOTIMES",
+                "BIGODOT", "BIGUPLUS", "BIGOMINUS", "BIGODIV"] + integralOperators
+
+_bigOperatorRegex = re.compile("|".join(bigOperators))
+_bigOperatorRegexes = [(rt, (re.compile("^" + rt + "_.+\^.+$"),
+                             re.compile("^.+" + rt + "_.+\^.+$"),
+                             re.compile("^.*" + rt + "$")))
+                       for rt in bigOperators]
+
+def _lengthLimitExceeded (strList: List[str], stage: str, idx: int,
+                          diagnostics: EquationDiagnostics) -> List[str]:
+    '''
+    Handle a list grown over listLengthLimit.
+    Without diagnostics, the whole list is replaced with "ERROR".
+    With lenient diagnostics, the partial list is kept as it is,
+    and only the first pass to find it too long reports it.
+    '''
+    reason = "List exceeded length limit of " + str(listLengthLimit) + "."
+    if diagnostics is None:
+        print("Equation parser error. " + reason)
+        return ["ERROR"]
+    if not diagnostics.lengthExceeded:
+        diagnostics.lengthExceeded = True
+        diagnostics.report(stage, reason, idx)
+    return strList
+
+def _unmatchedBrace (stage: str, idx: int,
+                     diagnostics: EquationDiagnostics) -> None:
+    '''
+    Report a brace group which is not closed. The tokens are left as they are.
+    '''
+    if diagnostics is not None:
+        diagnostics.report(stage, "Unmatched brace.", idx)
 
 def matchCurlyBraces (strList: List[str]) -> List[str]:
     '''
@@ -24,30 +66,11 @@ def matchCurlyBraces (strList: List[str]) -> List[str]:
     out : List[str]
         Curly bracket matched string list.
     '''
-    isMatched = 0
-    for idx, elem in enumerate(strList):
-        if elem == "{":
-            isMatched = isMatched + 1
-        elif elem == "}":
-            isMatched = isMatched - 1
-        
-    if isMatched > 0:
-        while isMatched > 0:
-            strList.insert(idx+1, "}")
-            isMatched = isMatched - 1
-    
-    
-    isMatched = 0
-    for idx, elem in reversed(list(enumerate(strList))):
-        if elem == "}":
-            isMatched = isMatched + 1
-        elif elem == "{":
-            isMatched = isMatched - 1
-        
-    if isMatched > 0:
-        while isMatched > 0:
-            strList.insert(idx, "{")
-            isMatched = isMatched - 1
+    unmatched = BraceIndex(strList).net
+    if unmatched > 0:
+        strList[len(strList):] = ["}"] * unmatched
+    elif unmatched < 0:
+        strList[0:0] = ["{"] * -unmatched
     
     return strList
 
@@ -69,89 +92,59 @@ def matchBraces (strList: List[str]) -> List[str]:
     out : List[str]
         Bracket matched(except curly ones) string list.
     '''
-    bracketCount = 0
-    for idx, elem in enumerate(strList):
-        if elem == "\\left":
-            bracketCount = bracketCount + 1
-        elif elem == "\\right":
-            bracketCount = bracketCount - 1
-    if bracketCount > 0:
-        while bracketCount > 0:
-            strList.insert(len(strList), "\\right")
-            strList.insert(len(strList), ".")
-            bracketCount = bracketCount - 1
-    bracketCount = 0
-    for idx, elem in reversed(list(enumerate(strList))):
-        if elem == "\\left":
-            bracketCount = bracketCount - 1
-        elif elem == "\\right":
-            bracketCount = bracketCount + 1
-    if bracketCount > 0:
-        while bracketCount > 0:
-            strList.insert(0, ".")
-            strList.insert(0, "\\left")
-            bracketCount = bracketCount - 1
+    unmatched = BraceIndex(strList, "\\left", "\\right").net
+    if unmatched > 0:
+        strList[len(strList):] = ["\\right", "."] * unmatched
+    elif unmatched < 0:
+        strList[0:0] = ["\\left", "."] * -unmatched
     return strList
 
-def textRegularizer (strList: List[str]) -> List[str]:
+def textRegularizer (strList: List[str], diagnostics: EquationDiagnostics = None,
+                     budget: BudgetMeter = None) -> List[str]:
     '''
     Regularize texts.
     This includes rounding strings containing only non-ascii characters in "\\text" keyword.
+    Strings mixing ascii and non-ascii characters are split into runs in one pass,
+    and non-ascii runs are rounded in the same way.
 
     Parameters
     ----------------------
     strList : List[str]
         List of strings, splitted by whitespace from hml equation string.
+    diagnostics : EquationDiagnostics, optional
+        Receives a record if the list exceeds listLengthLimit.
+    budget : BudgetMeter, optional
+        Raises BudgetExceeded if the equation runs over its budget.
     
     Returns
     ----------------------
     out : List[str]
         Text regularized string list.
     '''
+    textList = []
     for idx, elem in enumerate(strList):
-        if re.match("^[^\x00-\x7F]+$", elem) != None:
-            targetString = elem
-            del strList[idx]
-            strList.insert(idx, "\\text{"+targetString+"}")
-        elif re.match("^[ -~]*$", elem) == None:
-            target = elem
-            del strList[idx]
-            cnt = 0
-            nonAsciiCnt = 0
-            prevAsciiStart = 0
-            tempList = []
-            while cnt < len(target):
-                if re.match("^[ -~]$", target[cnt]) == None:
-                    nonAsciiCnt = nonAsciiCnt + 1
-                    cnt = cnt + 1
+        if _asciiRegex.fullmatch(elem) != None:
+            textList.append(elem)
+        else:
+            segments = _textSegmentRegex.findall(elem)
+            if _asciiRegex.fullmatch(segments[0]) == None and len(segments) > 1:
+                textList.append("")
+            for segment in segments:
+                if _asciiRegex.fullmatch(segment) != None:
+                    textList.append(segment)
                 else:
-                    if nonAsciiCnt > 0:
-                        asciiPart = target[prevAsciiStart:cnt-nonAsciiCnt]
-                        nonAsciiPart = target[cnt-nonAsciiCnt:cnt]
-                        tempList.insert(0, asciiPart)
-                        tempList.insert(0, nonAsciiPart)
-                        prevAsciiStart = cnt
-                        nonAsciiCnt = 0
-                        cnt = cnt + 1
-                    else:
-                        cnt = cnt + 1
-            if nonAsciiCnt > 0:
-                asciiPart = target[prevAsciiStart:cnt-nonAsciiCnt]
-                nonAsciiPart = target[cnt-nonAsciiCnt:cnt]
-                tempList.insert(0, asciiPart)
-                tempList.insert(0, nonAsciiPart)
-            else:
-                asciiPart = target[prevAsciiStart:cnt]
-                tempList.insert(0, asciiPart)
-            for ts in tempList:
-                strList.insert(idx, ts)
-        if len(strList) > listLengthLimit:
-            print("Equation parser error. List exceeded length limit of " + str(listLengthLimit) + ".")
-            strList = ["ERROR"]
-            break
+                    textList.append("\\text{" + segment + "}")
+        if budget is not None:
+            budget.step("textRegularizer", len(textList) + len(strList) - idx - 1)
+        if len(textList) + len(strList) - idx - 1 > listLengthLimit:
+            textList.extend(strList[idx+1:])
+            strList[:] = textList
+            return _lengthLimitExceeded(strList, "textRegularizer", idx, diagnostics)
+    strList[:] = textList
     return strList
 
-def fontRegularizer (strList: List[str]) -> List[str]:
+def fontRegularizer (strList: List[str], diagnostics: EquationDiagnostics = None,
+                     budget: BudgetMeter = None) -> List[str]:
     '''
     Regularize fonts.
     Target font is roman, bold, italic.
@@ -161,6 +154,10 @@ def fontRegularizer (strList: List[str]) -> List[str]:
     ----------------------
     strList : List[str]
         List of strings, splitted by whitespace from hml equation string.
+    diagnostics : EquationDiagnostics, optional
+        Receives a record if the list exceeds listLengthLimit.
+    budget : BudgetMeter, optional
+        Raises BudgetExceeded if the equation runs over its budget.
     
     Returns
     ----------------------
@@ -172,10 +169,7 @@ def fontRegularizer (strList: List[str]) -> List[str]:
         for idx, elem in enumerate(strList):
             if re.match("^" + tf + ".+$", elem) != None:
                 afterPart = elem[len(tf):]
-                del strList[idx]
-                strList.insert(idx, "}")
-                strList.insert(idx, afterPart)
-                strList.insert(idx, "{")
+                strList[idx:idx+1] = ["{", afterPart, "}"]
                 if tf == "rm" or tf == "RM":
                     strList.insert(idx, "\\mathrm")
                 elif tf == "bold" or tf == "BOLD":
@@ -202,10 +196,10 @@ def fontRegularizer (strList: List[str]) -> List[str]:
                         strList.insert(idx, "\\mathbf")
                     elif tf == "it" or tf == "IT":
                         strList.insert(idx, "\\mathit")
+            if budget is not None:
+                budget.step("fontRegularizer", len(strList))
             if len(strList) > listLengthLimit:
-                print("Equation parser error. List exceeded length limit of " + str(listLengthLimit) + ".")
-                strList = ["ERROR"]
-                break
+                return _lengthLimitExceeded(strList, "fontRegularizer", idx, diagnostics)
     specialKeywords = ["sin", "cos", "tan", "ln", "log", "alpha", "beta", "gamma", "theta", "pi", "sigma", "angle", "cap", "cup", "cdot", "CDOT", "cdots", "CDOTS", "times", "TIMES", "triangle", "sim", "box"]
     keywordMap = {
         "sin": "\\sin",
@@ -235,88 +229,61 @@ def fontRegularizer (strList: List[str]) -> List[str]:
         "box": "BOX"
     }
     for sk in specialKeywords:
+        # keep big operators like BIGOTIMES whole for sumRegularizer
+        operators = [op for op in bigOperators if sk in op]
         idx = 0
         while idx < len(strList):
         #for idx, elem in enumerate(strList):
             elem = strList[idx]
-            if re.match("^.+"+sk+".+$", elem) != None and not elem in specialKeywords:
+            if any(op in elem for op in operators):
+                pass
+            elif re.match("^.+"+sk+".+$", elem) != None and not elem in specialKeywords:
                 keywordLocation = elem.find(sk)
                 beforePart = elem[0:keywordLocation]
                 keywordPart = elem[keywordLocation:keywordLocation+len(sk)]
                 afterPart = elem[keywordLocation+len(sk):]
-                del strList[idx]
-                strList.insert(idx, afterPart)
-                strList.insert(idx, keywordMap[sk])
-                strList.insert(idx, beforePart)
+                strList[idx:idx+1] = [beforePart, keywordMap[sk], afterPart]
             elif re.match("^.+"+sk+"$", elem) != None and not elem in specialKeywords:
                 keywordLocation = elem.find(sk)
                 beforePart = elem[0:keywordLocation]
                 keywordPart = elem[keywordLocation:keywordLocation+len(sk)]
                 if beforePart != "\\":
-                    del strList[idx]
-                    strList.insert(idx, keywordMap[sk])
-                    strList.insert(idx, beforePart)
+                    strList[idx:idx+1] = [beforePart, keywordMap[sk]]
             elif re.match("^"+sk+".+$", elem) != None and not elem in specialKeywords:
                 keywordPart = elem[0:len(sk)]
                 afterPart = elem[len(sk):]
-                del strList[idx]
-                strList.insert(idx, afterPart)
-                strList.insert(idx, keywordMap[sk])
+                strList[idx:idx+1] = [keywordMap[sk], afterPart]
             elif re.match("^"+sk+"$", elem) != None:
-                del strList[idx]
-                strList.insert(idx, keywordMap[sk])
+                strList[idx] = keywordMap[sk]
+            if budget is not None:
+                budget.step("fontRegularizer", len(strList))
             if len(strList) > listLengthLimit:
-                print("Equation parser error. List exceeded length limit of " + str(listLengthLimit) + ".")
-                strList = ["ERROR"]
-                break
+                return _lengthLimitExceeded(strList, "fontRegularizer", idx, diagnostics)
             idx = idx + 1
     matrixKeywords = ["matrix", "cases"]
+    index = BraceIndex(strList)
     for mk in matrixKeywords:
         for idx, elem in enumerate(strList):
             if re.match("^.+"+mk+"$", elem) != None:
                 keywordLocation = elem.find(mk)
                 beforePart = elem[0:keywordLocation]
-                del strList[idx]
-                strList.insert(idx, mk)
-                strList.insert(idx, beforePart)
-                rightBracketLocation = idx + 2
-                bracketMatch = 0
-                while True:
-                    if strList[rightBracketLocation] == '}':
-                        bracketMatch = bracketMatch - 1
-                        if bracketMatch == 0:
-                            break
-                        else:
-                            rightBracketLocation = rightBracketLocation + 1
-                    elif strList[rightBracketLocation] == '{':
-                        bracketMatch = bracketMatch + 1
-                        rightBracketLocation = rightBracketLocation + 1
-                    else:
-                        rightBracketLocation = rightBracketLocation + 1
-                strList.insert(rightBracketLocation+1, "}")
-                strList.insert(idx, "{")
+                index.splice(idx, idx+1, [beforePart, mk])
+                rightBracketLocation = index.firstGroupClose(idx + 2)
+                if rightBracketLocation is not None:
+                    index.wrap(idx, rightBracketLocation+1)
+                else:
+                    _unmatchedBrace("fontRegularizer", idx, diagnostics)
             elif re.match("^" + mk + "$", elem) != None:
                 if strList[idx-1] != "{":
-                    rightBracketLocation = idx + 1
-                    bracketMatch = 0
-                    while True:
-                        if strList[rightBracketLocation] == '}':
-                            bracketMatch = bracketMatch - 1
-                            if bracketMatch == 0:
-                                break
-                            else:
-                                rightBracketLocation = rightBracketLocation + 1
-                        elif strList[rightBracketLocation] == '{':
-                            bracketMatch = bracketMatch + 1
-                            rightBracketLocation = rightBracketLocation + 1
-                        else:
-                            rightBracketLocation = rightBracketLocation + 1
-                    strList.insert(rightBracketLocation+1, "}")
-                    strList.insert(idx, "{")
+                    rightBracketLocation = index.firstGroupClose(idx + 1)
+                    if rightBracketLocation is not None:
+                        index.wrap(idx, rightBracketLocation+1)
+                    else:
+                        _unmatchedBrace("fontRegularizer", idx, diagnostics)
+            if budget is not None:
+                budget.step("fontRegularizer", len(strList))
             if len(strList) > listLengthLimit:
-                print("Equation parser error. List exceeded length limit of " + str(listLengthLimit) + ".")
-                strList = ["ERROR"]
-                break
+                return _lengthLimitExceeded(strList, "fontRegularizer", idx, diagnostics)
     return strList
 
 def backslashRemover (strList: List[str]) -> List[str]:
@@ -337,11 +304,11 @@ def backslashRemover (strList: List[str]) -> List[str]:
     for idx, elem in enumerate(strList):
         if re.match("^\\\\[A-Z]{1,5}$", elem) != None:
             remainderPart = elem[1:]
-            del strList[idx]
-            strList.insert(idx, remainderPart)
+            strList[idx] = remainderPart
     return strList
 
-def bracketRegularizer (strList: List[str]) -> List[str]:
+def bracketRegularizer (strList: List[str], diagnostics: EquationDiagnostics = None,
+                        budget: BudgetMeter = None) -> List[str]:
     '''
     Regularize bracket format.
     'LEFT', 'RIGHT' signs and their equivalents are converted to regularized form.
@@ -350,6 +317,10 @@ def bracketRegularizer (strList: List[str]) -> List[str]:
     ----------------------
     strList : List[str]
         List of strings, splitted by whitespace from hml equation string.
+    diagnostics : EquationDiagnostics, optional
+        Receives a record if the list exceeds listLengthLimit.
+    budget : BudgetMeter, optional
+        Raises BudgetExceeded if the equation runs over its budget.
     
     Returns
     ----------------------
@@ -360,17 +331,12 @@ def bracketRegularizer (strList: List[str]) -> List[str]:
         if re.match('^(left|LEFT)(\(|\{|\[|\|)$', elem) != None:
             directionKeyword = "\\left"
             bracketKeyword = elem[4:]
-            del strList[idx]
-            strList.insert(idx, bracketKeyword)
-            strList.insert(idx, directionKeyword)
+            strList[idx:idx+1] = [directionKeyword, bracketKeyword]
         elif re.match('^(left|LEFT)(\(|\{|\[|\|).+$', elem) != None:
             directionKeyword = "\\left"
             bracketKeyword = elem[4]
             afterPart = elem[5:]
-            del strList[idx]
-            strList.insert(idx, afterPart)
-            strList.insert(idx, bracketKeyword)
-            strList.insert(idx, directionKeyword)
+            strList[idx:idx+1] = [directionKeyword, bracketKeyword, afterPart]
         elif re.match('^.*(left|LEFT)$', elem) != None and elem != "\\left":
             if strList[idx+1] == '(' or strList[idx+1] == '{' or strList[idx+1] == '[' or strList[idx+1] == '|':
                 directionKeyword = "\\left"
@@ -378,24 +344,18 @@ def bracketRegularizer (strList: List[str]) -> List[str]:
                 if directionKeywordLocation == -1:
                     directionKeywordLocation = elem.find("LEFT")
                 beforePart = elem[0:directionKeywordLocation]
-                del strList[idx]
-                strList.insert(idx, directionKeyword)
+                strList[idx] = directionKeyword
                 if beforePart != "":
                     strList.insert(idx, beforePart)
         elif re.match('^(right|RIGHT)(\)|\}|\]|\|)$', elem) != None:
             directionKeyword = "\\right"
             bracketKeyword = elem[5:]
-            del strList[idx]
-            strList.insert(idx, bracketKeyword)
-            strList.insert(idx, directionKeyword)
+            strList[idx:idx+1] = [directionKeyword, bracketKeyword]
         elif re.match('^(right|RIGHT)(\)|\}|\]|\|).+$', elem) != None:
             directionKeyword = "\\right"
             bracketKeyword = elem[5]
             afterPart = elem[6:]
-            del strList[idx]
-            strList.insert(idx, afterPart)
-            strList.insert(idx, bracketKeyword)
-            strList.insert(idx, directionKeyword)
+            strList[idx:idx+1] = [directionKeyword, bracketKeyword, afterPart]
         elif re.match('^.*(right|RIGHT)$', elem) != None and elem != "\\right":
             if strList[idx+1] == ')' or strList[idx+1] == '}' or strList[idx+1] == ']' or strList[idx+1] == '|':
                 directionKeyword = "\\right"
@@ -403,8 +363,7 @@ def bracketRegularizer (strList: List[str]) -> List[str]:
                 if directionKeywordLocation == -1:
                     directionKeywordLocation = elem.find("RIGHT")
                 beforePart = elem[0:directionKeywordLocation]
-                del strList[idx]
-                strList.insert(idx, directionKeyword)
+                strList[idx] = directionKeyword
                 if beforePart != "":
                     strList.insert(idx, beforePart)
         elif re.match("^(\(|\[)$", elem) != None:
@@ -415,10 +374,10 @@ def bracketRegularizer (strList: List[str]) -> List[str]:
         elif re.match("^(\)|\])$", elem) != None:
             if strList[idx-1] != "\\right":
                 strList.insert(idx, "\\right")
+        if budget is not None:
+            budget.step("bracketRegularizer", len(strList))
         if len(strList) > listLengthLimit:
-            print("Equation parser error. List exceeded length limit of " + str(listLengthLimit) + ".")
-            strList = ["ERROR"]
-            break
+            return _lengthLimitExceeded(strList, "bracketRegularizer", idx, diagnostics)
         '''elif re.match('^.*\(.*$', elem) != None and re.match('^.*(LEFT|left)\(.*$', elem) == None and strList[idx-1] != "\\left":
             leftBracketLocation = elem.find("(")
             beforePart = elem[0:leftBracketLocation]
@@ -461,22 +420,19 @@ def bracketRegularizer (strList: List[str]) -> List[str]:
             del strList[idx]
             if afterPart != "":
                 strList.insert(idx, afterPart)
-            strList.insert(idx, rightBracket)
-            strList.insert(idx, "\\right")
-            strList.insert(idx, middlePart)
-            strList.insert(idx, leftBracket)
-            strList.insert(idx, "\\left")
+            strList[idx:idx] = ["\\left", leftBracket, middlePart, "\\right", rightBracket]
             if beforePart != "":
                 strList.insert(idx, beforePart)
             #del strList[idx]
             #strList.insert("")
+        if budget is not None:
+            budget.step("bracketRegularizer", len(strList))
         if len(strList) > listLengthLimit:
-            print("Equation parser error. List exceeded length limit of " + str(listLengthLimit) + ".")
-            strList = ["ERROR"]
-            break
+            return _lengthLimitExceeded(strList, "bracketRegularizer", idx, diagnostics)
     return strList
 
-def inEqualityRegularizer (strList: List[str]) -> List[str]:
+def inEqualityRegularizer (strList: List[str], diagnostics: EquationDiagnostics = None,
+                           budget: BudgetMeter = None) -> List[str]:
     '''
     Regularize inequalities.
     
@@ -486,6 +442,10 @@ def inEqualityRegularizer (strList: List[str]) -> List[str]:
     ----------------------
     strList : List[str]
         List of strings, splitted by whitespace from hml equation string.
+    diagnostics : EquationDiagnostics, optional
+        Receives a record if the list exceeds listLengthLimit.
+    budget : BudgetMeter, optional
+        Raises BudgetExceeded if the equation runs over its budget.
     
     Returns
     ----------------------
@@ -495,80 +455,57 @@ def inEqualityRegularizer (strList: List[str]) -> List[str]:
 
     for idx, elem in enumerate(strList):
         if elem == "＞":
-            del strList[idx]
-            strList.insert(idx, ">")
+            strList[idx] = ">"
         elif elem == "＜":
-            del strList[idx]
-            strList.insert(idx, "<")
+            strList[idx] = "<"
         elif re.match("^.+le.+$", elem) != None and elem != "\\leq" and elem != "\\left":
             inequalityLocation = elem.find("le")
             beforePart = elem[0:inequalityLocation]
             afterPart = elem[inequalityLocation+2:]
-            del strList[idx]
-            strList.insert(idx, afterPart)
-            strList.insert(idx, "\\leq")
-            strList.insert(idx, beforePart)
+            strList[idx:idx+1] = [beforePart, "\\leq", afterPart]
         elif re.match("^le.+$", elem) != None:
             if re.match("^leq.+$", elem) != None:
                 afterPart = elem[3:]
-                del strList[idx]
-                strList.insert(idx, afterPart)
-                strList.insert(idx, "\\leq")
+                strList[idx:idx+1] = ["\\leq", afterPart]
             elif re.match("^leq$", elem) != None:
-                del strList[idx]
-                strList.insert(idx, "\\leq")
+                strList[idx] = "\\leq"
             else:
                 afterPart = elem[2:]
-                del strList[idx]
-                strList.insert(idx, afterPart)
-                strList.insert(idx, "\\leq")
+                strList[idx:idx+1] = ["\\leq", afterPart]
         elif re.match("^.+le$", elem) != None and elem != "angle" and elem != "triangle":
             inequalityLocation = elem.find("le")
             beforePart = elem[0:inequalityLocation]
-            del strList[idx]
-            strList.insert(idx, "\\leq")
-            strList.insert(idx, beforePart)
+            strList[idx:idx+1] = [beforePart, "\\leq"]
         elif elem == "le":
-            del strList[idx]
-            strList.insert(idx, "\\leq")
+            strList[idx] = "\\leq"
         elif re.match("^.+ge.+$", elem) != None and elem != "\\geq":
             inequalityLocation = elem.find("ge")
             beforePart = elem[0:inequalityLocation]
             afterPart = elem[inequalityLocation+2:]
-            del strList[idx]
-            strList.insert(idx, afterPart)
-            strList.insert(idx, "\\geq")
-            strList.insert(idx, beforePart)
+            strList[idx:idx+1] = [beforePart, "\\geq", afterPart]
         elif re.match("^ge.+$", elem) != None:
             if re.match("^geq.+$", elem) != None:
                 afterPart = elem[3:]
-                del strList[idx]
-                strList.insert(idx, afterPart)
-                strList.insert(idx, "\\geq")
+                strList[idx:idx+1] = ["\\geq", afterPart]
             elif re.match("^geq$", elem) != None:
-                del strList[idx]
-                strList.insert(idx, "\\geq")
+                strList[idx] = "\\geq"
             else:
                 afterPart = elem[2:]
-                del strList[idx]
-                strList.insert(idx, afterPart)
-                strList.insert(idx, "\\geq")
+                strList[idx:idx+1] = ["\\geq", afterPart]
         elif re.match("^.+ge$", elem) != None:
             inequalityLocation = elem.find("ge")
             beforePart = elem[0:inequalityLocation]
-            del strList[idx]
-            strList.insert(idx, "\\geq")
-            strList.insert(idx, beforePart)
+            strList[idx:idx+1] = [beforePart, "\\geq"]
         elif elem == "ge":
-            del strList[idx]
-            strList.insert(idx, "\\geq")
+            strList[idx] = "\\geq"
+        if budget is not None:
+            budget.step("inEqualityRegularizer", len(strList))
         if len(strList) > listLengthLimit:
-            print("Equation parser error. List exceeded length limit of " + str(listLengthLimit) + ".")
-            strList = ["ERROR"]
-            break
+            return _lengthLimitExceeded(strList, "inEqualityRegularizer", idx, diagnostics)
     return strList
 
-def expRegularizer (strList: List[str], avoid: bool) -> List[str]:
+def expRegularizer (strList: List[str], avoid: bool, diagnostics: EquationDiagnostics = None,
+                    budget: BudgetMeter = None) -> List[str]:
     '''
     Regularize exponents and subscripts.
     
@@ -578,6 +515,10 @@ def expRegularizer (strList: List[str], avoid: bool) -> List[str]:
     ----------------------
     strList : List[str]
         List of strings, splitted by whitespace from hml equation string.
+    diagnostics : EquationDiagnostics, optional
+        Receives a record if the list exceeds listLengthLimit.
+    budget : BudgetMeter, optional
+        Raises BudgetExceeded if the equation runs over its budget.
     
     Returns
     ----------------------
@@ -585,9 +526,10 @@ def expRegularizer (strList: List[str], avoid: bool) -> List[str]:
         Exponent and subscript regularized string list.
     '''
     regularizationTarget = ["^", "_"]
-    avoidRegularizationTarget = ["over", "sum", "int"]
+    avoidRegularizationTarget = ["over"] + bigOperators
     if not avoid:
         avoidRegularizationTarget = []
+    index = BraceIndex(strList)
     for rt in regularizationTarget:
         idx = 0
         while idx < len(strList):
@@ -602,43 +544,22 @@ def expRegularizer (strList: List[str], avoid: bool) -> List[str]:
                     exponentLocation = elem.find(rt)
                     beforePart = elem[0:exponentLocation]
                     afterPart = elem[exponentLocation+1:]
-                    del strList[idx]
-                    strList.insert(idx, "}")
-                    strList.insert(idx, "}")
-                    strList.insert(idx, afterPart)
-                    strList.insert(idx, "{")
-                    strList.insert(idx, rt)
-                    strList.insert(idx, beforePart)
-                    strList.insert(idx, "{")
+                    index.splice(idx, idx+1, ["{", beforePart, rt, "{", afterPart, "}", "}"])
                 elif re.match("^" + "\\" + rt + ".+$", elem) != None and "{" not in elem and "}" not in elem:
                     afterPart = elem[1:]
-                    del strList[idx]
-                    strList.insert(idx, "}")
-                    strList.insert(idx, afterPart)
-                    strList.insert(idx, "{")
-                    strList.insert(idx, rt)
+                    index.splice(idx, idx+1, [rt, "{", afterPart, "}"])
                 elif re.match("^.+" + "\\" + rt + "$", elem) != None and "{" not in elem and "}" not in elem:
                     exponentLocation = elem.find(rt)
                     beforePart = elem[0:exponentLocation]
-                    del strList[idx]
-                    strList.insert(idx, rt)
-                    #strList.insert(idx, "}")
-                    strList.insert(idx, beforePart)
-                    #strList.insert(idx, "{")
+                    index.splice(idx, idx+1, [beforePart, rt])
                     if strList[idx+2] == "{":
-                        rightBracketLocation = idx+3
-                        rightBracketMatch = 1
-                        while rightBracketMatch > 0:
-                            if strList[rightBracketLocation] == "{":
-                                rightBracketMatch = rightBracketMatch + 1
-                            elif strList[rightBracketLocation] == "}":
-                                rightBracketMatch = rightBracketMatch - 1
-                            rightBracketLocation = rightBracketLocation + 1
-                        strList.insert(rightBracketLocation, "}")
-                        strList.insert(idx, "{")
+                        rightBracketLocation = index.closeFrom(idx+3)
+                        if rightBracketLocation is not None:
+                            index.wrap(idx, rightBracketLocation+1)
+                        else:
+                            _unmatchedBrace("expRegularizer", idx, diagnostics)
                     else:
-                        strList.insert(idx, "{")
-                        strList.insert(idx+4, "}")
+                        index.wrap(idx, idx+3)
                 '''elif re.match("^\\" + rt + "$", elem) != None:
                     #if strList[idx-1] != "}":
                     #    strList.insert(idx-1, "{")
@@ -675,20 +596,21 @@ def expRegularizer (strList: List[str], avoid: bool) -> List[str]:
                         strList.insert(idx-1, "{")
                         strList.insert(outerBracketLocationRight+1, "}")
                         idx = idx + 1'''
+                if budget is not None:
+                    budget.step("expRegularizer", len(strList))
                 if len(strList) > listLengthLimit:
-                    print("Equation parser error. List exceeded length limit of " + str(listLengthLimit) + ".")
-                    strList = ["ERROR"]
-                    break
+                    return _lengthLimitExceeded(strList, "expRegularizer", idx, diagnostics)
                 idx = idx + 1
             else:
+                if budget is not None:
+                    budget.step("expRegularizer", len(strList))
                 if len(strList) > listLengthLimit:
-                    print("Equation parser error. List exceeded length limit of " + str(listLengthLimit) + ".")
-                    strList = ["ERROR"]
-                    break
+                    return _lengthLimitExceeded(strList, "expRegularizer", idx, diagnostics)
                 idx = idx + 1
     return strList
 
-def sqrtRegularizer (strList: List[str]) -> List[str]:
+def sqrtRegularizer (strList: List[str], diagnostics: EquationDiagnostics = None,
+                     budget: BudgetMeter = None) -> List[str]:
     '''
     Regularize sqrts.
     
@@ -698,6 +620,10 @@ def sqrtRegularizer (strList: List[str]) -> List[str]:
     ----------------------
     strList : List[str]
         List of strings, splitted by whitespace from hml equation string.
+    diagnostics : EquationDiagnostics, optional
+        Receives a record if the list exceeds listLengthLimit.
+    budget : BudgetMeter, optional
+        Raises BudgetExceeded if the equation runs over its budget.
     
     Returns
     ----------------------
@@ -710,12 +636,8 @@ def sqrtRegularizer (strList: List[str]) -> List[str]:
             beforePart = elem[0:sqrtLocation]
             sqrtPart = elem[sqrtLocation:sqrtLocation+4]
             remainderPart = elem[sqrtLocation+4:]
-            del strList[idx]
-            strList.insert(idx, beforePart)
-            strList.insert(idx+1, "}")
-            strList.insert(idx+1, remainderPart)
-            strList.insert(idx+1, "{")
-            strList.insert(idx+1, sqrtPart)
+            strList[idx] = beforePart
+            strList[idx+1:idx+1] = [sqrtPart, "{", remainderPart, "}"]
         elif re.match("^.*root.+$", elem) != None:
             sqrtLocation = elem.find("root")
             beforePart = elem[0:sqrtLocation]
@@ -753,11 +675,7 @@ def sqrtRegularizer (strList: List[str]) -> List[str]:
                 strList.insert(idx, sqrtPart)
                 if beforePart != '':
                     strList.insert(idx, beforePart)'''
-            del strList[idx]
-            strList.insert(idx, "}")
-            strList.insert(idx, remainderPart)
-            strList.insert(idx, "{")
-            strList.insert(idx, sqrtPart)
+            strList[idx:idx+1] = [sqrtPart, "{", remainderPart, "}"]
             if beforePart != '':
                 strList.insert(idx, beforePart)
         elif re.match("^.*root$", elem) != None:
@@ -765,46 +683,30 @@ def sqrtRegularizer (strList: List[str]) -> List[str]:
             beforePart = elem[0:sqrtLocation]
             sqrtPart = "\\sqrt"
             if strList[idx+1] != '{':
-                del strList[idx]
-                strList.insert(idx, sqrtPart)
-                strList.insert(idx, beforePart)
+                strList[idx:idx+1] = [beforePart, sqrtPart]
                 afterPart = strList[idx+2]
-                del strList[idx+2]
-                strList.insert(idx+2, "}")
-                strList.insert(idx+2, afterPart)
-                strList.insert(idx+2, "{")
+                strList[idx+2:idx+3] = ["{", afterPart, "}"]
             else:
-                del strList[idx]
-                strList.insert(idx, sqrtPart)
-                strList.insert(idx, beforePart)
+                strList[idx:idx+1] = [beforePart, sqrtPart]
+        if budget is not None:
+            budget.step("sqrtRegularizer", len(strList))
         if len(strList) > listLengthLimit:
-            print("Equation parser error. List exceeded length limit of " + str(listLengthLimit) + ".")
-            strList = ["ERROR"]
-            break
+            return _lengthLimitExceeded(strList, "sqrtRegularizer", idx, diagnostics)
+    index = BraceIndex(strList)
     for idx, elem in enumerate(strList):
         if elem == "\\sqrt":
-            rightBracketLocation = idx + 2
-            rightBracketMatch = 1
-            while rightBracketMatch > 0 and rightBracketLocation < len(strList):
-                if strList[rightBracketLocation] == '{':
-                    rightBracketMatch = rightBracketMatch + 1
-                elif strList[rightBracketLocation] == '}':
-                    rightBracketMatch = rightBracketMatch - 1
-                rightBracketLocation = rightBracketLocation + 1
-            rightBracketLocation = rightBracketLocation - 1
-            if rightBracketLocation < len(strList) - 1 and strList[rightBracketLocation+1] == "of":
-                del strList[idx+1]
-                strList.insert(idx+1, '[')
-                del strList[rightBracketLocation]
-                strList.insert(rightBracketLocation, ']')
-                del strList[rightBracketLocation+1]
+            rightBracketLocation = index.closeFrom(idx + 2)
+            if rightBracketLocation is not None and rightBracketLocation < len(strList) - 1 and strList[rightBracketLocation+1] == "of":
+                index.splice(rightBracketLocation, rightBracketLocation+2, [']'])
+                index.splice(idx+1, idx+2, ['['])
+        if budget is not None:
+            budget.step("sqrtRegularizer", len(strList))
         if len(strList) > listLengthLimit:
-            print("Equation parser error. List exceeded length limit of " + str(listLengthLimit) + ".")
-            strList = ["ERROR"]
-            break
+            return _lengthLimitExceeded(strList, "sqrtRegularizer", idx, diagnostics)
     return strList
 
-def barRegularizer (strList: List[str]) -> List[str]:
+def barRegularizer (strList: List[str], diagnostics: EquationDiagnostics = None,
+                    budget: BudgetMeter = None) -> List[str]:
     '''
     Regularize bar-like elements.
     
@@ -816,6 +718,10 @@ def barRegularizer (strList: List[str]) -> List[str]:
     ----------------------
     strList : List[str]
         List of strings, splitted by whitespace from hml equation string.
+    diagnostics : EquationDiagnostics, optional
+        Receives a record if the list exceeds listLengthLimit.
+    budget : BudgetMeter, optional
+        Raises BudgetExceeded if the equation runs over its budget.
     
     Returns
     ----------------------
@@ -823,6 +729,7 @@ def barRegularizer (strList: List[str]) -> List[str]:
         Bar-like element regualrized string list.
     '''
     targetKeywords = ["vec", "dyad", "acute", "grave", "dot", "ddot", "bar", "hat", "check", "arch", "tilde", "BOX", "overline"]
+    index = BraceIndex(strList)
     for targetKeyword in targetKeywords:
         idx = 0
         while idx < len(strList):
@@ -832,44 +739,31 @@ def barRegularizer (strList: List[str]) -> List[str]:
                 #print(strList)
                 if strList[idx+1] != '{':
                     innerContent = strList[idx+1]
-                    strList.insert(idx+1, '{')
-                    strList.insert(idx+3, '}')
-                    strList.insert(idx+4, '}')
-                    strList.insert(idx-1, '{')
+                    index.splice(idx+1, idx+2, ['{', innerContent, '}'])
+                    index.wrap(idx-1, idx+4)
                 #print(strList)
                 if strList[idx-1] != '{':
-                    #leftBraceLocation = idx+1
-                    rightBraceLocation = idx+2
-                    rightBraceMatch = 1
-                    while rightBraceMatch > 0:
-                        if strList[rightBraceLocation] == '}':
-                            rightBraceMatch = rightBraceMatch - 1
-                        elif strList[rightBraceLocation] == '{':
-                            rightBraceMatch = rightBraceMatch + 1
-                        rightBraceLocation = rightBraceLocation + 1
-                    rightBraceLocation = rightBraceLocation - 1
-                    strList.insert(rightBraceLocation + 1, '}')
-                    strList.insert(idx, '{')
-                    idx = idx + 1
+                    rightBraceLocation = index.closeFrom(idx+2)
+                    if rightBraceLocation is not None:
+                        index.wrap(idx, rightBraceLocation + 1)
+                        idx = idx + 1
+                    else:
+                        _unmatchedBrace("barRegularizer", idx, diagnostics)
                 #print(strList)
             elif re.match("^" + targetKeyword + ".+$", elem) != None:
                 afterPart = elem[len(targetKeyword):]
-                del strList[idx]
-                strList.insert(idx, "}")
-                strList.insert(idx, afterPart)
-                strList.insert(idx, "{")
-                strList.insert(idx, targetKeyword)
+                index.splice(idx, idx+1, [targetKeyword, "{", afterPart, "}"])
                 if strList[idx-1] != "{":
-                    strList.insert(idx+4, "}")
-                    strList.insert(idx, "{")
+                    index.wrap(idx, idx+4)
+            if budget is not None:
+                budget.step("barRegularizer", len(strList))
             if len(strList) > listLengthLimit:
-                print("Equation parser error. List exceeded length limit of " + str(listLengthLimit) + ".")
-                strList = ["ERROR"]
-                break
+                return _lengthLimitExceeded(strList, "barRegularizer", idx, diagnostics)
             idx = idx + 1
     return strList
 
-def fracRegularizer (strList: List[str]) -> List[str]:
+def fracRegularizer (strList: List[str], diagnostics: EquationDiagnostics = None,
+                     budget: BudgetMeter = None) -> List[str]:
     '''
     Regularize fractions.
     
@@ -879,12 +773,17 @@ def fracRegularizer (strList: List[str]) -> List[str]:
     ----------------------
     strList : List[str]
         List of strings, splitted by whitespace from hml equation string.
+    diagnostics : EquationDiagnostics, optional
+        Receives a record if the list exceeds listLengthLimit.
+    budget : BudgetMeter, optional
+        Raises BudgetExceeded if the equation runs over its budget.
     
     Returns
     ----------------------
     out : List[str]
         Fractions regualrized string list.
     '''
+    index = BraceIndex(strList)
     for idx, elem in enumerate(strList):
         if re.match("^.+(over|OVER).+$", elem) != None:
             '''
@@ -894,14 +793,7 @@ def fracRegularizer (strList: List[str]) -> List[str]:
             beforePart = elem[0:fracLocation]
             fracPart = elem[fracLocation:fracLocation+4]
             remainderPart = elem[fracLocation+4:]
-            del strList[idx]
-            strList.insert(idx, "\\frac")
-            strList.insert(idx+1, "}")
-            strList.insert(idx+1, remainderPart)
-            strList.insert(idx+1, "{")
-            strList.insert(idx+1, "}")
-            strList.insert(idx+1, beforePart)
-            strList.insert(idx+1, "{")
+            index.splice(idx, idx+1, ["\\frac", "{", beforePart, "}", "{", remainderPart, "}"])
         elif re.match("^(over|OVER).+$", elem) != None and elem != "overline":
             '''
             Case when numerator is seperated from keyword.
@@ -910,41 +802,38 @@ def fracRegularizer (strList: List[str]) -> List[str]:
             fracPart = elem[fracLocation:fracLocation+4]
             remainderPart = elem[fracLocation+4:]
             if strList[idx-1] == "}":
-                leftBracketLocation = idx-2
-                leftBracketMatch = 1
-                while leftBracketMatch > 0:
-                    if strList[leftBracketLocation] == "}":
-                        leftBracketMatch = leftBracketMatch + 1
-                    elif strList[leftBracketLocation] == "{":
-                        leftBracketMatch = leftBracketMatch - 1
-                    leftBracketLocation = leftBracketLocation - 1
-                leftBracketLocation = leftBracketLocation + 1
-                del strList[idx]
-                strList.insert(leftBracketLocation, "\\frac")
-                strList.insert(idx+1, "}")
-                strList.insert(idx+1, remainderPart)
-                strList.insert(idx+1, "{")
+                leftBracketLocation = index.openFrom(idx-2)
+                if leftBracketLocation is not None:
+                    index.splice(idx, idx+1, [])
+                    index.splice(leftBracketLocation, leftBracketLocation, ["\\frac"])
+                    index.splice(idx+1, idx+1, ["{", remainderPart, "}"])
+                else:
+                    _unmatchedBrace("fracRegularizer", idx, diagnostics)
                 #del strList[idx]
                 #strList.insert(idx, "}")
                 #strList.insert(idx, remainderPart)
                 #strList.insert(idx, "{")
                 #strList.insert(idx-3, "\\frac")
+            elif idx > 0:
+                beforePart = strList[idx-1]
+                index.splice(idx-1, idx+1, ["\\frac", "{", beforePart, "}", "{", remainderPart, "}"])
             else:
                 beforePart = strList[idx-1]
                 del strList[idx]
                 del strList[idx-1]
                 strList.insert(idx-1, "\\frac")
-                strList.insert(idx, "}")
-                strList.insert(idx, remainderPart)
-                strList.insert(idx, "{")
-                strList.insert(idx, "}")
-                strList.insert(idx, beforePart)
-                strList.insert(idx, "{")
+                strList[idx:idx] = ["{", beforePart, "}", "{", remainderPart, "}"]
+                index.invalidate()
         elif re.match("^(over|OVER)$", elem) != None:
             '''
             Case when numerator and divider are both seperated from keyword.
             '''
-            if strList[idx-1] != "}":
+            if strList[idx-1] != "}" and idx > 0:
+                beforePart = strList[idx-1]
+                index.splice(idx-1, idx+1, ["\\frac", "{", beforePart, "}"])
+                if strList[idx+3] != "{":
+                    index.wrap(idx+3, idx+4)
+            elif strList[idx-1] != "}":
                 strList.insert(idx-1, "{")
                 strList.insert(idx+1, "}")
                 del strList[idx+2]
@@ -952,28 +841,24 @@ def fracRegularizer (strList: List[str]) -> List[str]:
                 if strList[idx+3] != "{":
                     strList.insert(idx+3, "{")
                     strList.insert(idx+5, "}")
+                index.invalidate()
             else:
-                leftCurlyBrace = idx-2
-                isMatched = 1
-                while isMatched > 0:
-                    if strList[leftCurlyBrace] == "}":
-                        isMatched = isMatched + 1
-                    elif strList[leftCurlyBrace] == "{":
-                        isMatched = isMatched - 1
-                    leftCurlyBrace = leftCurlyBrace - 1
-                leftCurlyBrace = leftCurlyBrace + 1
-                del strList[idx]
-                strList.insert(leftCurlyBrace, "\\frac")
-                if strList[idx+1] != "{":
-                    strList.insert(idx+1, "{")
-                    strList.insert(idx+3, "}")
+                leftCurlyBrace = index.openFrom(idx-2)
+                if leftCurlyBrace is not None:
+                    index.splice(idx, idx+1, [])
+                    index.splice(leftCurlyBrace, leftCurlyBrace, ["\\frac"])
+                    if strList[idx+1] != "{":
+                        index.wrap(idx+1, idx+2)
+                else:
+                    _unmatchedBrace("fracRegularizer", idx, diagnostics)
+        if budget is not None:
+            budget.step("fracRegularizer", len(strList))
         if len(strList) > listLengthLimit:
-            print("Equation parser error. List exceeded length limit of " + str(listLengthLimit) + ".")
-            strList = ["ERROR"]
-            break
+            return _lengthLimitExceeded(strList, "fracRegularizer", idx, diagnostics)
     return strList
 
-def limRegularizer (strList: List[str]) -> List[str]:
+def limRegularizer (strList: List[str], diagnostics: EquationDiagnostics = None,
+                    budget: BudgetMeter = None) -> List[str]:
     '''
     Regularize limits.
     
@@ -984,6 +869,10 @@ def limRegularizer (strList: List[str]) -> List[str]:
     ----------------------
     strList : List[str]
         List of strings, splitted by whitespace from hml equation string.
+    diagnostics : EquationDiagnostics, optional
+        Receives a record if the list exceeds listLengthLimit.
+    budget : BudgetMeter, optional
+        Raises BudgetExceeded if the equation runs over its budget.
     
     Returns
     ----------------------
@@ -993,21 +882,15 @@ def limRegularizer (strList: List[str]) -> List[str]:
     for idx, elem in enumerate(strList):
         if re.match("^lim$", elem) != None:
             #print("Case when limit is seperated by itself. strList: " + str(strList))
-            del strList[idx]
-            strList.insert(idx, "\\lim")
+            strList[idx] = "\\lim"
             target = strList[idx+1]
             if re.match("^_.+$", elem) != None:
                 underbar = target[0]
                 arrowLocation = elem.find("->")
                 beforeArrow = elem[1:arrowLocation]
                 afterArrow = elem[arrowLocation+2:]
-                del strList[idx+1]
-                strList.insert(idx+1, underbar)
-                strList.insert(idx+2, "}")
-                strList.insert(idx+2, afterArrow)
-                strList.insert(idx+2, "\\rightarrow")
-                strList.insert(idx+2, beforeArrow)
-                strList.insert(idx+2, "{")
+                strList[idx+1] = underbar
+                strList[idx+2:idx+2] = ["{", beforeArrow, "\\rightarrow", afterArrow, "}"]
         elif re.match("^lim_.+->.+$", elem) != None:
             #print("Case when limit and both arrow part are sticked together. strList: " + str(strList))
             limPart = elem[0:3]
@@ -1015,281 +898,252 @@ def limRegularizer (strList: List[str]) -> List[str]:
             beforeArrow = elem[4:arrowLocation]
             arrowPart = elem[arrowLocation:arrowLocation+2]
             afterArrow = elem[arrowLocation+2:]
-            del strList[idx]
-            strList.insert(idx, "\\"+limPart)
-            strList.insert(idx+1, "}")
-            strList.insert(idx+1, afterArrow)
-            strList.insert(idx+1, "\\rightarrow")
-            strList.insert(idx+1, beforeArrow)
-            strList.insert(idx+1, "_{")
+            strList[idx] = "\\"+limPart
+            strList[idx+1:idx+1] = ["_{", beforeArrow, "\\rightarrow", afterArrow, "}"]
             #print("After slicing sticked parts. strList: " + str(strList))
         elif re.match("^lim_$", elem) != None:
             #print("Case when limit and only underbar is sticked together. strList: " + str(strList))
-            del strList[idx]
-            strList.insert(idx, "_")
-            strList.insert(idx, "\\lim")
+            strList[idx:idx+1] = ["\\lim", "_"]
+        if budget is not None:
+            budget.step("limRegularizer", len(strList))
         if len(strList) > listLengthLimit:
-            print("Equation parser error. List exceeded length limit of " + str(listLengthLimit) + ".")
-            strList = ["ERROR"]
-            break
+            return _lengthLimitExceeded(strList, "limRegularizer", idx, diagnostics)
     for idx, elem in enumerate(strList):
         if re.match("^.+->.+$", elem) != None:
             #print("Case when rightarrow is sticked together with before and after parts. strList: " + str(strList))
             arrowLocation = elem.find("->")
             beforePart = elem[0:arrowLocation]
             afterPart = elem[arrowLocation+2:]
-            del strList[idx]
-            strList.insert(idx, afterPart)
-            strList.insert(idx, "\\rightarrow")
-            strList.insert(idx, beforePart)
+            strList[idx:idx+1] = [beforePart, "\\rightarrow", afterPart]
         elif re.match("^.+->$", elem) != None:
             #print("Case when rightarrow is sticked together with before part. strList: " + str(strList))
             arrowLocation = elem.find("->")
             beforePart = elem[0:arrowLocation]
-            del strList[idx]
-            strList.insert(idx, "\\rightarrow")
-            strList.insert(idx, beforePart)
+            strList[idx:idx+1] = [beforePart, "\\rightarrow"]
         elif re.match("^->.+$", elem) != None:
             #print("Case when rightarrow is sticked together with after part. strList: " + str(strList))
             afterPart = elem[2:]
-            del strList[idx]
-            strList.insert(idx, afterPart)
-            strList.insert(idx, "\\rightarrow")
+            strList[idx:idx+1] = ["\\rightarrow", afterPart]
         elif re.match("^->$", elem) != None:
             #print("Case when righrarrow is by itself. strList: " + str(strList))
-            del strList[idx]
-            strList.insert(idx, "\\rightarrow")
+            strList[idx] = "\\rightarrow"
+        if budget is not None:
+            budget.step("limRegularizer", len(strList))
         if len(strList) > listLengthLimit:
-            print("Equation parser error. List exceeded length limit of " + str(listLengthLimit) + ".")
-            strList = ["ERROR"]
-            break
+            return _lengthLimitExceeded(strList, "limRegularizer", idx, diagnostics)
     return strList
 
-def sumRegularizer (strList: List[str]) -> List[str]:
+def sumRegularizer (strList: List[str], diagnostics: EquationDiagnostics = None,
+                    budget: BudgetMeter = None) -> List[str]:
     '''
     Regularize limits.
     
     This involves adding curly braces if needed, and seperating parts.
-    Sum is just for representation, this regularizer regularizes Sum, Integral and if needed, more equations that has same format.
+    Sum is just for representation, this regularizer regularizes every keyword in bigOperators
+    (sum, product, integral, big union and so on) in a single pass.
 
     Parameters
     ----------------------
     strList : List[str]
         List of strings, splitted by whitespace from hml equation string.
+    diagnostics : EquationDiagnostics, optional
+        Receives a record if the list exceeds listLengthLimit.
+    budget : BudgetMeter, optional
+        Raises BudgetExceeded if the equation runs over its budget.
     
     Returns
     ----------------------
     out : List[str]
         Limits regularized string list.
     '''
-    regularizationTarget = ["sum", "int"]
-    for rt in regularizationTarget:
-        #print(rt)
-        idx = 0
-        #for idx, elem in enumerate(strList):
-        while idx < len(strList):
-            elem = strList[idx]
-            #print(elem)
-            if re.match("^" + rt + "_.+\^.+$", elem) != None:
-                '''
-                Case when 'sum', lower and upper part are all sticked together.
-                ex) sum_k=1^n
-                '''
-                underbarLocation = elem.find("_")
-                caretLocation = elem.find("^")
-                sumPart = elem[0:3]
-                lowerPart = elem[underbarLocation:caretLocation]
-                upperPart = elem[caretLocation:]
-                if lowerPart[1] != "{":
-                    #lowerPart = "_{" + lowerPart[1:] + "}"
-                    lowerPartLst = ["_", "{", lowerPart[1:], "}"]
-                if upperPart[1] != "{":
-                    #upperPart = "^{" + upperPart[1:] + "}"
-                    upperPartLst = ["^", "{", upperPart[1:], "}"]
-                del strList[idx]
-                strList.insert(idx, "\\"+rt)
-                if rt == "int":
-                    strList.insert(idx+1, "\\,")
-                #strList.insert(idx+1, upperPart)
-                strList = insertList(idx+1, strList, upperPartLst)
-                #strList.insert(idx+1, lowerPart)
-                strList = insertList(idx+1, strList, lowerPartLst)
-                idx = idx + 1
-            elif re.match("^.+" + rt + "_.+\^.+$", elem) != None:
+    index = BraceIndex(strList)
+    idx = 0
+    #for idx, elem in enumerate(strList):
+    while idx < len(strList):
+        elem = strList[idx]
+        #print(elem)
+        rt = None
+        if _bigOperatorRegex.search(elem) != None:
+            for rt, (stickedRegex, prefixedRegex, seperatedRegex) in _bigOperatorRegexes:
+                if stickedRegex.match(elem) != None:
+                    case = "sticked"
+                    break
+                if prefixedRegex.match(elem) != None:
+                    case = "prefixed"
+                    break
+                if seperatedRegex.match(elem) != None:
+                    case = "seperated"
+                    break
+            else:
+                rt = None
+        if rt is None:
+            if budget is not None:
+                budget.step("sumRegularizer", len(strList))
+            if len(strList) > listLengthLimit:
+                return _lengthLimitExceeded(strList, "sumRegularizer", idx, diagnostics)
+            idx = idx + 1
+            continue
+        spacing = ["\\,"] if rt in integralOperators else []
+        if case == "sticked":
+            '''
+            Case when 'sum', lower and upper part are all sticked together.
+            ex) sum_k=1^n
+            '''
+            underbarLocation = elem.find("_")
+            caretLocation = elem.find("^")
+            lowerPart = elem[underbarLocation:caretLocation]
+            upperPart = elem[caretLocation:]
+            lowerPartLst = [lowerPart]
+            upperPartLst = [upperPart]
+            if lowerPart[1] != "{":
+                #lowerPart = "_{" + lowerPart[1:] + "}"
+                lowerPartLst = ["_", "{", lowerPart[1:], "}"]
+            if upperPart[1] != "{":
+                #upperPart = "^{" + upperPart[1:] + "}"
+                upperPartLst = ["^", "{", upperPart[1:], "}"]
+            index.splice(idx, idx+1, [rt] + lowerPartLst + upperPartLst + spacing)
+            idx = idx + 1
+        elif case == "prefixed":
+            '''
+            Case when all sticked together, and there are additional text before 'sum'.
+            ex) M=sum_k=1^n
+            '''
+            underbarLocation = elem.find("_")
+            caretLocation = elem.find("^")
+            sumLocation = elem.find(rt)
+            beforePart = elem[0:sumLocation]
+            sumPart = elem[sumLocation:sumLocation+len(rt)]
+            lowerPart = elem[underbarLocation:caretLocation]
+            upperPart = elem[caretLocation:]
+            lowerPartLst = [lowerPart]
+            upperPartLst = [upperPart]
+            if lowerPart[1] != "{":
+                #lowerPart = "_{" + lowerPart[1:] + "}"
+                lowerPartLst = ["_", "{", lowerPart[1:], "}"]
+            if upperPart[1] != "{":
+                #upperPart = "^{" + upperPart[1:] + "}"
+                upperPartLst = ["^", "{", upperPart[1:], "}"]
+            index.splice(idx, idx+1, [beforePart, sumPart] + lowerPartLst + upperPartLst + spacing)
+        else:
+            '''
+            Case when keyword 'sum' is seperated.
+            '''
+            target = strList[idx+1] if idx+1 < len(strList) else ""
+            sumLocation = elem.find(rt)
+            beforePart = elem[0:sumLocation]
+            sumPart = elem[sumLocation:]
+            headPart = [beforePart, sumPart] if beforePart != "" else [sumPart]
+            if re.match("^_.+\^.+$", target) != None:
                 '''
-                Case when all sticked together, and there are additional text before 'sum'.
-                ex) M=sum_k=1^n
+                Case when lower and upper part is sticked together.
                 '''
-                underbarLocation = elem.find("_")
-                caretLocation = elem.find("^")
-                sumLocation = elem.find(rt)
-                beforePart = elem[0:sumLocation]
-                sumPart = elem[sumLocation:sumLocation+3]
-                lowerPart = elem[underbarLocation:caretLocation]
-                upperPart = elem[caretLocation:]
+                caretLocation = target.find("^")
+                lowerPart = target[0:caretLocation]
+                lowerPartLst = [lowerPart]
+                upperPart = target[caretLocation:]
+                upperPartLst = [upperPart]
                 if lowerPart[1] != "{":
                     #lowerPart = "_{" + lowerPart[1:] + "}"
                     lowerPartLst = ["_", "{", lowerPart[1:], "}"]
                 if upperPart[1] != "{":
                     #upperPart = "^{" + upperPart[1:] + "}"
                     upperPartLst = ["^", "{", upperPart[1:], "}"]
-                del strList[idx]
-                strList.insert(idx, beforePart)
-                if rt == "int":
-                    strList.insert(idx+1, "\\,")
-                #strList.insert(idx+1, upperPart)
-                strList = insertList(idx+1, strList, upperPartLst)
-                #strList.insert(idx+1, lowerPart)
-                strList = insertList(idx+1, strList, lowerPartLst)
-                strList.insert(idx+1, sumPart)
-            elif re.match("^.*" + rt + "$", elem) != None:
+                index.splice(idx, idx+2, headPart + lowerPartLst + upperPartLst + spacing)
+                idx = idx + len(headPart)
+            elif re.match("^_.+$", target) != None:
                 '''
-                Case when keyword 'sum' is seperated.
+                Case when lower and upper parts are seperated.
                 '''
-                target = strList[idx+1]
-                sumLocation = elem.find(rt)
-                beforePart = elem[0:sumLocation]
-                sumPart = elem[sumLocation:]
-                if re.match("^_.+\^.+$", target) != None:
-                    '''
-                    Case when lower and upper part is sticked together.
-                    '''
-                    underbarLocation = target.find("_")
-                    caretLocation = target.find("^")
-                    lowerPart = target[0:caretLocation]
-                    lowerPartLst = []
-                    upperPart = target[caretLocation:]
-                    upperPartLst = []
-                    if lowerPart[1] != "{":
-                        #lowerPart = "_{" + lowerPart[1:] + "}"
-                        lowerPartLst = ["_", "{", lowerPart[1:], "}"]
-                    if upperPart[1] != "{":
-                        #upperPart = "^{" + upperPart[1:] + "}"
-                        upperPartLst = ["^", "{", upperPart[1:], "}"]
-                    del strList[idx]
-                    #strList.insert(idx, beforePart)
-                    #strList.insert(idx+1, sumPart)
-                    strList.insert(idx, sumPart)
-                    #del strList[idx+2]
-                    del strList[idx+1]
-                    if rt == "int":
-                        #strList.insert(idx+2, "\\,")
-                        strList.insert(idx+1, "\\,")
-                    #strList.insert(idx+2, upperPart)
-                    #strList = insertList(idx+2, strList, upperPartLst)
-                    strList = insertList(idx+1, strList, upperPartLst)
-                    #strList.insert(idx+2, lowerPart)
-                    #strList = insertList(idx+2, strList, lowerPart)
-                    strList = insertList(idx+1, strList, lowerPartLst)
-                    #if rt == "int":
-                        #idx = idx + 5
-                    #else:
-                        #idx = idx + 4
-                    idx = idx + 1
-                elif re.match("^_.+$", target) != None:
+                upperTarget = strList[idx+2] if idx+2 < len(strList) else ""
+                upperPartLst = []
+                lowerPartLst = [target]
+                end = idx+2
+                if re.match("^\^.+$", upperTarget) != None:
                     '''
-                    Case when lower and upper parts are seperated.
+                    Case when upper part exists.
                     '''
-                    upperTarget = strList[idx+2]
-                    upperPart = "^{}"
-                    lowerPart = ""
-                    upperPartLst = ["^", "{", "}"]
-                    lowerPartLst = []
-                    if re.match("^\^.+$", upperTarget) != None:
-                        '''
-                        Case when upper part exists.
-                        '''
-                        if upperTarget[1] != "{":
-                            #upperPart = "^{" + upperTarget[1:] + "}"
-                            upperPartLst = ["^", "{", upperTarget[1:], "}"]
-                        #else:
-                            #upperPart = upperTarget
-                    if target[1] != "{":
-                        #lowerPart = "_{" + target[1:] + "}"
-                        lowerPartLst = ["_", "{", target[1:], "}"]
-                    del strList[idx]
-                    #strList.insert(idx, beforePart)
-                    #strList.insert(idx+1, sumPart)
-                    strList.insert(idx, sumPart)
-                    #del strList[idx+2]
-                    del strList[idx+1]
-                    #strList.insert(idx+2, lowerPart)
-                    #del strList[idx+3]
-                    #if rt == "int":
-                        #strList.insert(idx+3, "\\,")
-                    #strList.insert(idx+3, upperPart)
-                    if rt == "int":
-                        #strList.insert(idx+2, "\\,")
-                        strList.insert(idx+1, "\\,")
-                    #strList = insertList(idx+2, upperPartLst)
-                    strList = insertList(idx+1, upperPartLst)
-                    #strList = insertList(idx+2, lowerPartLst)
-                    strList = insertList(idx+1, lowerPartLst)
-                    #if rt == "int":
-                        #idx = idx + 5
-                    #else:
-                        #idx = idx + 4
-                    idx = idx + 1
-                elif target == "_":
+                    upperPartLst = [upperTarget]
+                    if upperTarget[1] != "{":
+                        #upperPart = "^{" + upperTarget[1:] + "}"
+                        upperPartLst = ["^", "{", upperTarget[1:], "}"]
+                    end = idx+3
+                if target[1] != "{":
+                    #lowerPart = "_{" + target[1:] + "}"
+                    lowerPartLst = ["_", "{", target[1:], "}"]
+                index.splice(idx, end, headPart + lowerPartLst + upperPartLst + spacing)
+                idx = idx + len(headPart)
+            elif target == "_":
+                '''
+                Case when lower part is seperated from keyword.
+                '''
+                index.splice(idx, idx+1, headPart)
+                idx = idx + len(headPart) - 1
+                lowerOpened = idx+2 < len(strList) and strList[idx+2] == "{"
+                rightCurlyBrace = index.closeFrom(idx+3) if lowerOpened else None
+                if not lowerOpened:
+                    pass
+                elif rightCurlyBrace is None:
+                    _unmatchedBrace("sumRegularizer", idx, diagnostics)
+                elif rightCurlyBrace+1 < len(strList) and \
+                        re.match("^\^.+$", strList[rightCurlyBrace+1]) != None:
                     '''
-                    Case when lower part is seperated from keyword.
+                    Case when upper part does not have curly braces.
                     '''
-                    rightCurlyBrace = idx+3
-                    isMatched = 1
-                    #while strList[rightCurlyBrace] != "}":
-                    while isMatched > 0:
-                        if strList[rightCurlyBrace] == "{":
-                            isMatched = isMatched + 1
-                        elif strList[rightCurlyBrace] == "}":
-                            isMatched = isMatched - 1
-                        rightCurlyBrace = rightCurlyBrace + 1
-                    rightCurlyBrace = rightCurlyBrace - 1
-                    if strList[rightCurlyBrace+1] == "^":
-                        '''
-                        Case when upper part has curly braces.
-                        '''
-                        del strList[idx]
-                        #strList.insert(idx, beforePart)
-                        #strList.insert(idx+1, sumPart)
-                        strList.insert(idx, sumPart)
-                        #idx = idx + 2
-                        idx = idx + 1
-                    else:
-                        '''
-                        Case when upper part does not have curly braces.
-                        '''
-                        upperPart = strList[rightCurlyBrace+1]
-                        upperPart = "^{" + upperPart[1:] + "}"
-                        upperPartLst = ["^", "{", upperPart[1:], "}"]
-                        del strList[idx]
-                        #strList.insert(idx, beforePart)
-                        #strList.insert(idx+1, sumPart)
-                        strList.insert(idx, sumPart)
-                        #del strList[rightCurlyBrace+2]
-                        del strList[rightCurlyBrace+1]
-                        #strList.insert(rightCurlyBrace+2, upperPart)
-                        if rt == "int":
-                            #strList.insert(rightCurlyBrace+2, "\\,")
-                            strList.insert(rightCurlyBrace+1, "\\,")
-                        #strList = insertList(rightCurlyBrace+2, strList, upperPartLst)
-                        strList = insertList(rightCurlyBrace+1, strList, upperPartLst)
-                        #if rt == "int":
-                            #strList.insert(rightCurlyBrace+3, "\\,")
-                        #if rt == "int":
-                            #idx = rightCurlyBrace + 2
-                        #else:
-                            #idx = rightCurlyBrace + 1
-                        idx = idx + 1
-                else:
-                    idx = idx + 1
-                if len(strList) > listLengthLimit:
-                    print("Equation parser error. List exceeded length limit of " + str(listLengthLimit) + ".")
-                    strList = ["ERROR"]
-                    break
-            else:
-                if len(strList) > listLengthLimit:
-                    print("Equation parser error. List exceeded length limit of " + str(listLengthLimit) + ".")
-                    strList = ["ERROR"]
-                    break
+                    upperPart = strList[rightCurlyBrace+1]
+                    upperPartLst = ["^", "{", upperPart[1:], "}"]
+                    index.splice(rightCurlyBrace+1, rightCurlyBrace+2, upperPartLst + spacing)
                 idx = idx + 1
+            else:
+                index.splice(idx, idx+1, headPart)
+                idx = idx + len(headPart)
+            if budget is not None:
+                budget.step("sumRegularizer", len(strList))
+            if len(strList) > listLengthLimit:
+                return _lengthLimitExceeded(strList, "sumRegularizer", idx, diagnostics)
     return strList
+
+# words of a Hangul-heavy sentence, for benchmark
+_hangulWords = ["그러므로", "점", "이다.", "에서", "값은", "구하시오.", "이고,"]
+_mixedWords = ["x의", "f(x)는", "AB와", "2이므로", "n번째"]
+_asciiWords = ["x", "=", "2", "+", "AB", "f(x)"]
+
+def hangulSentence (rng: random.Random, size: int) -> List[str]:
+    '''
+    Random token list of `size` tokens, mostly Hangul words and tokens
+    mixing Hangul and ascii.
+    '''
+    words = _hangulWords * 3 + _mixedWords * 2 + _asciiWords
+    return [rng.choice(words) for _ in range(size)]
+
+def benchmark (size: int = 96, count: int = 2000, seed: int = 0) -> dict:
+    '''
+    Time textRegularizer on `count` Hangul-heavy sentences of `size`
+    tokens.
+    '''
+    rng = random.Random(seed)
+    sentences = [hangulSentence(rng, size) for _ in range(count)]
+    start = time.perf_counter()
+    for sentence in sentences:
+        textRegularizer(list(sentence))
+    seconds = time.perf_counter() - start
+    return {"sentences": count,
+            "tokens": size,
+            "seconds": seconds,
+            "microsecondsPerCall": seconds / count * 1e6 if count else None}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Time textRegularizer on Hangul-heavy sentences.")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="time textRegularizer and print the result")
+    parser.add_argument("--tokens", type=int, default=96,
+                        help="tokens of every sentence")
+    parser.add_argument("--count", type=int, default=2000,
+                        help="number of sentences")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if not args.benchmark:
+        parser.error("nothing to do, pass --benchmark")
+    print(json.dumps(benchmark(args.tokens, args.count, args.seed)))
@@ -2,3 +2,6 @@ from .hulkEqParser import hmlEquation2latex as eq2latex
 from .hmlParser import parseHml as parseHmlSample
 from .hmlParser import convertEquation as convertEquationSample
 from .hmlParser import extract2HtmlStr as extract2HtmlStrSample
+from .diagnostics import (Diagnostics, DiagnosticRecord,
+                          EquationParseError)
+from .budget import EquationBudget, BudgetExceeded
@@ -0,0 +1,230 @@
+'''
+Attribute the memory a conversion batch allocates to the stages of the
+pipeline, with tracemalloc.
+
+Documents are converted in chunks, one stage at a time for the whole
+chunk: read, parse (parseHml and its trees), trivial (trivialLatex),
+regularize (tokenize and the EqRegularizer passes), map (mapTokens),
+render (renderTokens and hulkReplaceMethod) and serialize. tracemalloc
+takes a snapshot around every stage; their difference is what the stage
+allocated and still holds, by allocation site, and the peak is the most
+it held at once on top of what was there before. Sites are summed and
+peaks maximized over all chunks of the batch.
+
+The report is a text file, one line per site with its size and number of
+blocks, sorted, so that the reports of two versions can be compared with
+diff. Tracing slows conversion several times, so this is a separate
+command:
+
+    python -m hml_equation_parser.allocations --out report.txt docs/
+'''
+from typing import Callable, Iterable, List
+from collections import Counter
+import argparse
+import dis
+import os
+import sys
+import tracemalloc
+
+from .hmlParser import parseHml, config
+from .hulkEqParser import trivialLatex, regularizeTokens, mapTokens, \
+    renderTokens
+from .serializer import xmlString
+from .diagnostics import Diagnostics
+from .build import iterSources
+
+stages = ["read", "parse", "trivial", "regularize", "map", "render",
+          "serialize"]
+keyTypes = ["lineno", "filename", "traceback"]
+
+# allocations of the profiler itself
+_filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>")]
+
+
+def _siteName(filename: str) -> str:
+    '''
+    File name relative to the sys.path entry it was imported from, so that
+    sites do not depend on where python or the package is installed.
+    '''
+    for prefix in sorted(sys.path, key=len, reverse=True):
+        if prefix and filename.startswith(prefix + os.sep):
+            return os.path.relpath(filename, prefix)
+    return filename
+
+
+class AllocationProfile:
+    '''
+    Allocation sites and peaks of every stage, summed over a batch.
+
+    Parameters
+    ----------------------
+    keyType : str
+        Group allocations by "lineno", "filename" or "traceback", as
+        tracemalloc.Snapshot.statistics does.
+    '''
+    def __init__(self, keyType: str = "lineno") -> None:
+        if keyType not in keyTypes:
+            raise ValueError("unknown key type: {}".format(keyType))
+        self.keyType = keyType
+        self.sizes = {stage: Counter() for stage in stages}
+        self.counts = {stage: Counter() for stage in stages}
+        self.peaks = Counter()  # type: Counter
+        self.documents = 0
+        self.equations = 0
+
+    def _site(self, traceback: tracemalloc.Traceback) -> str:
+        if self.keyType == "filename":
+            return _siteName(traceback[0].filename)
+        return " <- ".join("{}:{}".format(_siteName(frame.filename),
+                                          frame.lineno)
+                           for frame in traceback)
+
+    def measure(self, stage: str, function: Callable[[], object]) -> object:
+        '''
+        Call function as stage, and add what it allocated to the stage.
+        '''
+        before = tracemalloc.take_snapshot().filter_traces(_filters)
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        result = function()
+        peak = tracemalloc.get_traced_memory()[1]
+        after = tracemalloc.take_snapshot().filter_traces(_filters)
+        for stat in after.compare_to(before, self.keyType):
+            if not stat.size_diff and not stat.count_diff:
+                continue
+            frame = stat.traceback[0]
+            if frame.filename == __file__ and frame.lineno in _measureLines:
+                continue  # the counters of the previous stage
+            site = self._site(stat.traceback)
+            self.sizes[stage][site] += stat.size_diff
+            self.counts[stage][site] += stat.count_diff
+        if hasattr(tracemalloc, "reset_peak"):
+            self.peaks[stage] = max(self.peaks[stage], peak - start)
+        return result
+
+    def report(self, top: int = 20) -> str:
+        '''
+        Text report of the top sites of every stage, by size.
+        '''
+        lines = ["# {} documents, {} equations, sites by {}".format(
+            self.documents, self.equations, self.keyType)]
+        for stage in stages:
+            sizes, counts = self.sizes[stage], self.counts[stage]
+            header = "[{}] {} B in {} blocks".format(
+                stage, sum(sizes.values()), sum(counts.values()))
+            if stage in self.peaks:
+                header += ", peak {} B".format(self.peaks[stage])
+            lines.append(header)
+            sites = sorted(sizes, key=lambda site: (-sizes[site], site))
+            for site in sites[:top]:
+                lines.append("{:>12} B {:>8} blocks  {}".format(
+                    sizes[site], counts[site], site))
+        return "\n".join(lines) + "\n"
+
+
+_measureLines = frozenset(
+    line for _, line in dis.findlinestarts(AllocationProfile.measure.__code__))
+
+
+def _profileChunk(profile: AllocationProfile, fileNames: List[str]) -> None:
+    '''
+    Convert a chunk of documents stage by stage. What a stage makes is
+    kept until the end of the chunk, as it is what the stage holds.
+    '''
+    measure = profile.measure
+    diagnostics = Diagnostics()
+
+    def read() -> List[bytes]:
+        contents = []
+        for fileName in fileNames:
+            with open(fileName, "rb") as f:
+                contents.append(f.read())
+        return contents
+    contents = measure("read", read)
+    trees = measure("parse", lambda: [
+        tree for content, fileName in zip(contents, fileNames)
+        for tree in parseHml(content, diagnostics, fileName)])
+
+    nodes = [node for tree in trees
+             for paragraph in tree.getroot() for node in paragraph
+             if node.tag == config["NodeNames"]["equation"] and
+             node.text is not None]
+    profile.documents += len(fileNames)
+    profile.equations += len(nodes)
+
+    results = measure("trivial", lambda: [trivialLatex(node.text)
+                                          for node in nodes])
+    pending = [idx for idx, latex in enumerate(results) if latex is None]
+    tokens = measure("regularize", lambda: [
+        regularizeTokens(nodes[idx].text, diagnostics.bind(idx))
+        for idx in pending])
+    mapped = measure("map", lambda: [mapTokens(strList)
+                                     for strList in tokens])
+    rendered = measure("render", lambda: [renderTokens(strList)
+                                          for strList in mapped])
+    for idx, latex in zip(pending, rendered):
+        results[idx] = latex
+    for node, latex in zip(nodes, results):
+        node.text = latex
+    measure("serialize", lambda: [xmlString(tree) for tree in trees])
+
+
+def profileAllocations(sources: Iterable[str], chunkSize: int = 20,
+                       keyType: str = "lineno",
+                       frames: int = 1) -> AllocationProfile:
+    '''
+    Convert documents under tracemalloc and attribute the allocations to
+    the stages of the conversion.
+
+    Parameters
+    ----------------------
+    sources : Iterable[str]
+        .hml files, or directories to search for them.
+    chunkSize : int
+        Number of documents going through a stage at once. Larger chunks
+        take fewer snapshots, but hold more documents in memory.
+    keyType : str
+        Grouping of the allocation sites, see AllocationProfile.
+    frames : int
+        Number of frames of the traceback of every allocation, with
+        keyType "traceback".
+    '''
+    profile = AllocationProfile(keyType)
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start(frames)
+    try:
+        chunk = []  # type: List[str]
+        for source in iterSources(sources):
+            chunk.append(source)
+            if len(chunk) >= chunkSize:
+                _profileChunk(profile, chunk)
+                chunk = []
+        if chunk:
+            _profileChunk(profile, chunk)
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    return profile
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Report the allocations of every conversion stage.")
+    parser.add_argument("sources", nargs="+",
+                        help=".hml documents or directories of them")
+    parser.add_argument("--out", required=True, help="report file")
+    parser.add_argument("--top", type=int, default=20,
+                        help="sites reported per stage")
+    parser.add_argument("--chunk-size", type=int, default=20)
+    parser.add_argument("--by", choices=keyTypes, default="lineno")
+    parser.add_argument("--frames", type=int, default=1)
+    args = parser.parse_args()
+
+    profile = profileAllocations(args.sources, args.chunk_size, args.by,
+                                 args.frames)
+    with open(args.out, "w", encoding="utf8") as f:
+        f.write(profile.report(args.top))
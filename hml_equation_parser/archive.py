@@ -0,0 +1,188 @@
+'''
+Read .hml documents straight out of zip and tar (.tar, .tar.gz, .tar.bz2,
+.tar.xz) bundles, without extracting them to disk.
+
+Members are decompressed one after the other in the calling process, as
+both formats are read sequentially. With workers > 1 every decompressed
+member is handed to a process pool for parsing (and converting), so the
+pool works while the next members are decompressed.
+
+    python -m hml_equation_parser.archive --workers 4 --convert bundle.zip
+'''
+from typing import BinaryIO, Iterator, List, Tuple, Union
+from xml.etree.ElementTree import ElementTree
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import argparse
+import json
+import tarfile
+import time
+import zipfile
+
+from .hmlParser import parseHml, convertEquation
+from .diagnostics import Diagnostics, DiagnosticRecord
+from .budget import EquationBudget
+
+Archive = Union[str, BinaryIO]
+
+
+def iterArchive(archive: Archive,
+                suffix: str = ".hml") -> Iterator[Tuple[str, bytes]]:
+    '''
+    Iterate the (member name, content) of the documents in a zip or tar
+    archive, in archive order.
+
+    Parameters
+    ----------------------
+    archive : str or binary file object
+        Path of the archive, or the archive itself. A tar archive may be a
+        non-seekable stream.
+    suffix : str
+        Only members whose name ends with suffix (in any case) are read.
+    '''
+    suffix = suffix.lower()
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                if info.filename.lower().endswith(suffix):
+                    yield info.filename, zf.read(info)
+        return
+
+    if isinstance(archive, str):
+        tf = tarfile.open(archive, mode="r|*")
+    else:
+        if archive.seekable():
+            archive.seek(0)  # is_zipfile has read the end of the file
+        tf = tarfile.open(fileobj=archive, mode="r|*")
+    with tf:
+        for member in tf:
+            if member.isfile() and member.name.lower().endswith(suffix):
+                yield member.name, tf.extractfile(member).read()
+
+
+def _parseMember(name: str, content: bytes, collect: bool, convert: bool,
+                 budget: EquationBudget
+                 ) -> Tuple[str, Tuple[ElementTree, ElementTree],
+                            List[DiagnosticRecord]]:
+    '''
+    Parse, and convert if asked, one member. In a worker process the
+    records are sent back to the caller's collector. A member that fails
+    has no trees, and a record of stage "archive".
+    '''
+    diagnostics = Diagnostics() if collect else None
+    try:
+        doc, sol = parseHml(content, diagnostics, name)
+        if convert:
+            convertEquation(doc, diagnostics, budget)
+            convertEquation(sol, diagnostics, budget)
+        trees = doc, sol
+    except Exception as e:
+        trees = None
+        failure = DiagnosticRecord(name, "archive", None, "{}: {}".format(
+            type(e).__name__, e))
+        if not collect:
+            print("Archive member error. {} ({})".format(failure.reason,
+                                                         name))
+            return name, trees, []
+        return name, trees, diagnostics.records + [failure]
+    records = diagnostics.records if collect else []
+    return name, trees, records
+
+
+def parseArchive(archive: Archive, diagnostics: Diagnostics = None,
+                 workers: int = 1, suffix: str = ".hml",
+                 convert: bool = False, budget: EquationBudget = None
+                 ) -> Iterator[Tuple[str, Tuple[ElementTree, ElementTree]]]:
+    '''
+    Parse every document of an archive, as parseHml does for a file.
+
+    Parameters
+    ----------------------
+    archive : str or binary file object
+        zip or tar archive, see iterArchive.
+    diagnostics : Diagnostics, optional
+        Collector for unsupported tags and equation problems. Records of
+        a member have its name in equationId. If not given, they are
+        printed.
+    workers : int
+        Number of processes parsing members. With 1, members are parsed
+        in the calling process.
+    suffix : str
+        Suffix of the member names to parse.
+    convert : bool
+        Also convert the equations of both trees, as convertEquation does.
+        Conversion takes much longer than parsing, so this is where
+        workers pay off: the trees are sent back to the caller only once.
+    budget : EquationBudget, optional
+        Budget for each equation, when converting.
+
+    Returns
+    ----------------------
+    out : Iterator[(str, (ElementTree, ElementTree))]
+        Member name and the question and solution trees, in archive order.
+        A member that cannot be parsed or converted is reported and
+        skipped, and the others go on.
+    '''
+    collect = diagnostics is not None
+
+    def replay(name: str, trees: Tuple[ElementTree, ElementTree],
+               records: List[DiagnosticRecord]
+               ) -> Tuple[str, Tuple[ElementTree, ElementTree]]:
+        for record in records:
+            equationId = record.equationId
+            if isinstance(equationId, tuple):
+                equationId = (name,) + equationId
+            diagnostics.report(record.stage, record.reason,
+                               record.tokenIndex, equationId)
+        return name, trees
+
+    def parsed(results: Iterator[Tuple[str, Tuple[ElementTree, ElementTree],
+                                       List[DiagnosticRecord]]]
+               ) -> Iterator[Tuple[str, Tuple[ElementTree, ElementTree]]]:
+        for result in results:
+            name, trees = replay(*result)
+            if trees is not None:
+                yield name, trees
+
+    members = iterArchive(archive, suffix)
+    if workers <= 1:
+        yield from parsed(_parseMember(name, content, collect, convert,
+                                       budget)
+                          for name, content in members)
+        return
+
+    def results(executor: ProcessPoolExecutor):
+        # at most 2 members per worker are decompressed ahead of parsing
+        pending = deque()
+        for name, content in members:
+            pending.append(executor.submit(_parseMember, name, content,
+                                           collect, convert, budget))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    with ProcessPoolExecutor(workers) as executor:
+        yield from parsed(results(executor))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Parse the .hml documents of zip or tar archives.")
+    parser.add_argument("archives", nargs="+")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--convert", action="store_true",
+                        help="also convert the equations")
+    args = parser.parse_args()
+
+    diagnostics = Diagnostics()
+    start = time.perf_counter()
+    documents = 0
+    for archive in args.archives:
+        for name, (doc, sol) in parseArchive(archive, diagnostics,
+                                             args.workers,
+                                             convert=args.convert):
+            documents += 1
+    print(json.dumps({"documents": documents,
+                      "seconds": time.perf_counter() - start,
+                      "diagnostics": dict(diagnostics.counters)}))
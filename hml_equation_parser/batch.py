@@ -0,0 +1,429 @@
+'''
+Batch conversion of many hml equations.
+
+Every equation is tokenized and regularized in python, as the structural
+rewrites differ per equation. Mapping the regularized tokens to latex is
+the same table lookup for all of them, so the "numpy" backend does it for
+the whole batch at once: all tokens are concatenated, mapped to ids in a
+vocabulary built from the convertMap keys with searchsorted, replaced
+through lookup tables, and brace depth and brace partners are computed
+with a cumsum over brace deltas. NumPy is an optional extra
+(`pip install hml_equation_parser[numpy]`); the "python" backend needs
+nothing and gives the same result.
+
+Large batches can be split into one shard per worker process, and
+profiled with the stack sampler of sampler.py in every worker.
+
+    python -m hml_equation_parser.batch --benchmark test.hml equations.txt
+    python -m hml_equation_parser.batch --workers 4 --profile batch.folded \
+        docs/*.hml
+'''
+from typing import Dict, Iterable, List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import argparse
+import codecs
+import json
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .hulkEqParser import (regularizeTokens, mapTokens, renderTokens,
+                           prepareEquation, failedEquation, plan)
+from .EqRegularizer import backslashRemover
+from .diagnostics import Diagnostics
+from .budget import EquationBudget
+from .sampler import StackSampler
+
+backends = ["python", "numpy"]
+
+
+class TokenVocabulary:
+    '''
+    Lookup tables of the convertMap keys for the numpy backend.
+    '''
+    def __init__(self) -> None:
+        keys = sorted(plan.tokenMap)
+        values = backslashRemover([plan.tokenMap[key] for key in keys])
+        self.keys = np.array(keys)
+        # mapped tokens are final: backslashRemover is applied here once
+        self.values = np.array(values, dtype=object)
+        self.isEmpty = np.array([value == "" for value in values])
+        self.isLeft = np.array([value == "\\left" for value in values])
+        self.isRight = np.array([value == "\\right" for value in values])
+        self.isMarker = np.array([value in plan.markers for value in values])
+        self.markers = np.array(sorted(plan.markers))
+
+    def lookup(self, tokens: 'np.ndarray') -> Tuple['np.ndarray',
+                                                    'np.ndarray']:
+        '''
+        Vocabulary ids of tokens, and whether they are in the vocabulary.
+        '''
+        ids = np.searchsorted(self.keys, tokens)
+        ids[ids == len(self.keys)] = 0
+        known = self.keys[ids] == tokens
+        return ids, known
+
+
+_vocabulary = None
+
+
+def _firstChars(tokens: 'np.ndarray') -> 'np.ndarray':
+    '''
+    Code point of the first character of every token, 0 if empty.
+    '''
+    width = tokens.dtype.itemsize // 4
+    return tokens.view(np.uint32).reshape(-1, width)[:, 0]
+
+
+def _mapBatchNumpy(tokenLists: List[List[str]]) -> Tuple[List[List[str]],
+                                                         List[List[int]]]:
+    '''
+    mapTokens for a batch of token lists with array operations.
+    Also returns brace partners of the lists that hold markers and have
+    balanced braces, None for the others.
+    '''
+    global _vocabulary
+    if _vocabulary is None:
+        _vocabulary = TokenVocabulary()
+    vocabulary = _vocabulary
+
+    lengths = np.array([len(tokens) for tokens in tokenLists], dtype=np.int64)
+    count = len(tokenLists)
+    flat = [token for tokens in tokenLists for token in tokens]
+    if not flat:
+        return [[] for _ in tokenLists], [None] * count
+    tokens = np.array(flat)
+    eqIndex = np.repeat(np.arange(count), lengths)
+
+    ids, known = vocabulary.lookup(tokens)
+    unknown = ~known
+    knownIds = ids[known]
+    mapped = tokens.astype(object)
+    mapped[known] = vocabulary.values[knownIds]
+
+    def flag(table: 'np.ndarray', raw: 'np.ndarray') -> 'np.ndarray':
+        out = np.zeros(len(tokens), dtype=bool)
+        out[known] = table[knownIds]
+        out[unknown] = raw[unknown]
+        return out
+
+    isLeft = flag(vocabulary.isLeft, tokens == "\\left")
+    isRight = flag(vocabulary.isRight, tokens == "\\right")
+    isMarker = np.zeros(len(tokens), dtype=bool)
+    isMarker[known] = vocabulary.isMarker[knownIds]
+    isOpen = unknown & (tokens == "{")
+    isClose = unknown & (tokens == "}")
+    keep = np.ones(len(tokens), dtype=bool)
+    keep[known] = ~vocabulary.isEmpty[knownIds]
+
+    # few unknown tokens start with a backslash or look like a marker,
+    # and they repeat, so they are handled once per distinct token.
+    firstChars = _firstChars(tokens)
+    keep[unknown & (firstChars == 0)] = False
+    candidates = np.flatnonzero(unknown & (firstChars == ord("\\")))
+    if len(candidates):
+        distinct, inverse = np.unique(tokens[candidates], return_inverse=True)
+        mapped[candidates] = np.array(
+            backslashRemover(distinct.tolist()) + [None],
+            dtype=object)[:-1][inverse]
+    candidates = np.flatnonzero(unknown & (firstChars == ord("H")))
+    if len(candidates):
+        isMarker[candidates] = np.isin(tokens[candidates], vocabulary.markers)
+
+    mapped = mapped[keep]
+    eqIndex = eqIndex[keep]
+    isMarker = isMarker[keep]
+    isOpen = isOpen[keep]
+    isClose = isClose[keep]
+    isLeft = isLeft[keep]
+    isRight = isRight[keep]
+    lengths = np.bincount(eqIndex, minlength=count)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+
+    # replaceBracket
+    sameEquation = eqIndex[1:] == eqIndex[:-1]
+    escapeOpen = np.flatnonzero(isOpen[1:] & isLeft[:-1] & sameEquation) + 1
+    escapeClose = np.flatnonzero(isClose[1:] & isRight[:-1] &
+                                 sameEquation) + 1
+    mapped[escapeOpen] = "\\{"
+    mapped[escapeClose] = "\\}"
+    isOpen[escapeOpen] = False
+    isClose[escapeClose] = False
+
+    # brace depth after every token, counted from the start of its equation
+    depth = np.cumsum(isOpen.astype(np.int64) - isClose)
+    depth -= np.repeat(depth[starts - 1] * (starts > 0), lengths)
+    nonEmpty = lengths > 0
+    minDepth = np.zeros(count, dtype=np.int64)
+    minDepth[nonEmpty] = np.minimum.reduceat(depth, starts[nonEmpty])
+    lastDepth = np.zeros(count, dtype=np.int64)
+    lastDepth[nonEmpty] = depth[ends[nonEmpty] - 1]
+    hasMarker = np.bincount(eqIndex, weights=isMarker, minlength=count) > 0
+    matched = hasMarker & (minDepth >= 0) & (lastDepth == 0)
+
+    # With balanced braces, the k-th opening brace of a level in an
+    # equation pairs with the k-th closing brace of that level.
+    partner = np.full(len(mapped), -1, dtype=np.int64)
+    braceMask = (isOpen | isClose) & matched[eqIndex]
+    braces = np.flatnonzero(braceMask)
+    level = depth[braces] - isOpen[braces]
+    opens = braces[isOpen[braces]]
+    closes = braces[isClose[braces]]
+    opens = opens[np.lexsort((opens, level[isOpen[braces]],
+                              eqIndex[opens]))]
+    closes = closes[np.lexsort((closes, level[isClose[braces]],
+                                eqIndex[closes]))]
+    partner[opens] = closes
+    partner[closes] = opens
+    partner[braces] -= np.repeat(starts, lengths)[braces]
+
+    mappedLists = []
+    partners = []
+    mapped = mapped.tolist()
+    partner = partner.tolist()
+    for idx in range(count):
+        start, end = int(starts[idx]), int(ends[idx])
+        mappedLists.append(mapped[start:end])
+        partners.append(partner[start:end] if matched[idx] else None)
+    return mappedLists, partners
+
+
+def convertBatch(equations: Iterable[str], diagnostics: Diagnostics = None,
+                 budget: EquationBudget = None, backend: str = "python",
+                 chunkSize: int = 10000) -> List[str]:
+    '''
+    Convert many hml equation strings, like hmlEquation2latex on each.
+    An equation that fails is reported and rendered verbatim on its own,
+    and the rest of the batch goes on.
+
+    Parameters
+    ----------------------
+    equations : Iterable[str]
+        hml equation strings.
+    diagnostics : Diagnostics, optional
+        Collector for problems, with the index of the equation in the
+        batch as equationId.
+    budget : EquationBudget, optional
+        Limits for each equation.
+    backend : str
+        "python", or "numpy" to map tokens with array operations.
+    chunkSize : int
+        Number of equations mapped at once by the numpy backend.
+
+    Returns
+    ----------------------
+    out : List[str]
+        Converted latex strings, in order.
+    '''
+    if backend not in backends:
+        raise ValueError("unknown backend: {}".format(backend))
+    if backend == "numpy" and np is None:
+        raise ImportError("the numpy backend needs numpy, install "
+                          "hml_equation_parser[numpy]")
+
+    results = []  # type: List[str]
+    chunk = []  # type: List[Tuple[int, str, object, object, List[str]]]
+
+    def flush() -> None:
+        if not chunk:
+            return
+        mappedLists, partners = _mapBatchNumpy(
+            [tokens for _, _, _, _, tokens in chunk])
+        for (idx, hmlEqStr, reporter, meter, _), mapped, partner in \
+                zip(chunk, mappedLists, partners):
+            try:
+                if meter is not None:
+                    meter.resume()
+                results[idx] = renderTokens(mapped, meter, partner)
+            except Exception as e:
+                results[idx] = failedEquation(hmlEqStr, reporter, e)
+        del chunk[:]
+
+    for idx, hmlEqStr in enumerate(equations):
+        reporter = None
+        if diagnostics is not None:
+            reporter = diagnostics.bind(idx)
+        meter = None
+        if budget is not None:
+            meter = budget.start()
+        results.append(None)
+        try:
+            results[idx], tokens = prepareEquation(hmlEqStr, reporter, meter)
+            if results[idx] is not None:
+                continue
+            if backend == "python":
+                results[idx] = renderTokens(mapTokens(tokens), meter)
+                continue
+        except Exception as e:
+            results[idx] = failedEquation(hmlEqStr, reporter, e)
+            continue
+        # the time waiting for the rest of the chunk is not counted
+        if meter is not None:
+            meter.pause()
+        chunk.append((idx, hmlEqStr, reporter, meter, tokens))
+        if len(chunk) >= chunkSize:
+            flush()
+    flush()
+    return results
+
+
+def _convertShard(equations: List[str], backend: str, chunkSize: int,
+                  interval: float) -> Tuple[List[str], Dict[str, int]]:
+    sampler = StackSampler(interval) if interval else None
+    if sampler is not None:
+        sampler.start()
+    try:
+        results = convertBatch(equations, Diagnostics(), backend=backend,
+                               chunkSize=chunkSize)
+    finally:
+        if sampler is not None:
+            sampler.stop()
+    return results, sampler.samples if sampler is not None else None
+
+
+def convertShards(equations: List[str], workers: int = 1,
+                  backend: str = "python", chunkSize: int = 10000,
+                  sampler: StackSampler = None) -> List[str]:
+    '''
+    Convert a batch with convertBatch, in one contiguous shard per worker
+    process.
+
+    Parameters
+    ----------------------
+    equations : List[str]
+        hml equation strings.
+    workers : int
+        Number of processes. With 1, the batch is converted in this
+        process.
+    backend, chunkSize
+        As for convertBatch.
+    sampler : StackSampler, optional
+        Sample the conversion, in every worker at the interval of sampler,
+        and merge the samples into it.
+
+    Returns
+    ----------------------
+    out : List[str]
+        Converted latex strings, in order.
+    '''
+    interval = sampler.interval if sampler is not None else None
+    if workers <= 1:
+        results, samples = _convertShard(equations, backend, chunkSize,
+                                         interval)
+        shards = [(results, samples)]
+    else:
+        size = max(1, -(-len(equations) // workers))
+        with ProcessPoolExecutor(workers) as executor:
+            shards = list(executor.map(
+                _convertShard,
+                [equations[start:start+size]
+                 for start in range(0, len(equations), size)],
+                repeat(backend), repeat(chunkSize), repeat(interval)))
+    results = []  # type: List[str]
+    for converted, samples in shards:
+        results.extend(converted)
+        if sampler is not None:
+            sampler.merge(samples)
+    return results
+
+
+def readEquations(fileNames: List[str]) -> List[str]:
+    '''
+    Equation strings of .hml documents, corpus files, or text files with
+    one equation per line.
+    '''
+    from .equationScan import iterEquationScripts
+    from .corpus import Corpus, isCorpus
+
+    equations = []  # type: List[str]
+    for fileName in fileNames:
+        if fileName.endswith(".hml"):
+            equations.extend(script for _, script
+                             in iterEquationScripts(fileName))
+        elif isCorpus(fileName):
+            equations.extend(Corpus(fileName))
+        else:
+            with codecs.open(fileName, "r", "utf8") as f:
+                equations.extend(line.rstrip("\n") for line in f
+                                 if line.strip())
+    return equations
+
+
+def benchmark(equations: List[str], chunkSize: int = 10000) -> dict:
+    '''
+    Time the token mapping of both backends on the same regularized
+    tokens, and check that they give the same result.
+    Equations whose regularization raises are left out.
+    '''
+    start = time.perf_counter()
+    tokenLists = []  # type: List[List[str]]
+    for idx, equation in enumerate(equations):
+        try:
+            tokenLists.append(regularizeTokens(equation,
+                                               Diagnostics().bind(idx)))
+        except Exception:
+            pass  # not convertible, regardless of the backend
+    regularizeSeconds = time.perf_counter() - start
+    stats = {"equations": len(tokenLists),
+             "tokens": sum(len(tokens) for tokens in tokenLists),
+             "regularizeSeconds": regularizeSeconds}
+
+    start = time.perf_counter()
+    pythonMapped = [mapTokens(list(tokens)) for tokens in tokenLists]
+    stats["pythonMapSeconds"] = time.perf_counter() - start
+    if np is None:
+        return stats
+
+    start = time.perf_counter()
+    numpyMapped = []  # type: List[List[str]]
+    numpyPartners = []  # type: List[List[int]]
+    for chunkStart in range(0, len(tokenLists), chunkSize):
+        mapped, partners = _mapBatchNumpy(
+            tokenLists[chunkStart:chunkStart+chunkSize])
+        numpyMapped.extend(mapped)
+        numpyPartners.extend(partners)
+    stats["numpyMapSeconds"] = time.perf_counter() - start
+    stats["identical"] = pythonMapped == numpyMapped and all(
+        partner is None or
+        renderTokens(mapped, None, partner) == renderTokens(mapped)
+        for mapped, partner in zip(numpyMapped, numpyPartners))
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Convert hml equations in batch.")
+    parser.add_argument("files", nargs="+",
+                        help=".hml documents, corpus files or files of one "
+                             "equation per line")
+    parser.add_argument("--backend", choices=backends, default="python")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="repeat the equations to make a larger batch")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="compare the python and numpy backends")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--profile", default=None,
+                        help="write the sampled stacks of the conversion "
+                             "to this file, in collapsed stack format")
+    parser.add_argument("--interval", type=float, default=0.005,
+                        help="seconds of CPU time between samples")
+    args = parser.parse_args()
+
+    equations = readEquations(args.files) * args.repeat
+    if args.benchmark:
+        print(json.dumps(benchmark(equations, args.chunk_size)))
+    else:
+        sampler = None
+        if args.profile:
+            sampler = StackSampler(args.interval)
+        for latex in convertShards(equations, args.workers, args.backend,
+                                   args.chunk_size, sampler):
+            print(latex)
+        if sampler is not None:
+            sampler.write(args.profile)
@@ -0,0 +1,236 @@
+from typing import List
+
+
+class BraceIndex:
+    '''
+    Structural index of the braces of a token list, shared by the
+    regularizers instead of counting braces token by token.
+
+    For every brace the index keeps the offset to its matching partner, so
+    finding a match is a lookup. Rewrites go through `splice` and `wrap`,
+    which patch the index locally when they keep the braces balanced:
+    the offsets of the new tokens are computed, and only the groups
+    enclosing the change are moved. Any other change marks the index
+    stale, and it is rebuilt on the next query.
+
+    Parameters
+    ----------------------
+    strList : List[str]
+        Token list, changed in place through the index.
+    opening, closing : str
+        Brace tokens, "{" and "}" by default, or "\\left" and "\\right".
+    '''
+    def __init__(self, strList: List[str], opening: str = "{",
+                 closing: str = "}") -> None:
+        self.strList = strList
+        self.opening = opening
+        self.closing = closing
+        self._offsets = None  # type: List[int]
+        self._net = 0
+
+    def _offsetsOf(self, tokens: List[str]) -> List[int]:
+        '''
+        Offset of each token to its partner, 0 for other tokens and
+        unmatched braces. Sets _net to opening minus closing braces.
+        '''
+        offsets = [0] * len(tokens)
+        stack = []  # type: List[int]
+        net = 0
+        for idx, elem in enumerate(tokens):
+            if elem == self.opening:
+                stack.append(idx)
+                net = net + 1
+            elif elem == self.closing:
+                net = net - 1
+                if stack:
+                    openIdx = stack.pop()
+                    offsets[openIdx] = idx - openIdx
+                    offsets[idx] = openIdx - idx
+        self._net = net
+        return offsets
+
+    @property
+    def offsets(self) -> List[int]:
+        if self._offsets is None:
+            self._offsets = self._offsetsOf(self.strList)
+        return self._offsets
+
+    @property
+    def net(self) -> int:
+        '''
+        Number of opening braces minus number of closing braces.
+        '''
+        self.offsets
+        return self._net
+
+    def invalidate(self) -> None:
+        '''
+        Mark the index stale after strList is changed directly.
+        '''
+        self._offsets = None
+
+    def partner(self, idx: int) -> int:
+        '''
+        Index of the brace matching the brace at idx, None if there is none.
+        '''
+        offset = self.offsets[idx]
+        if offset == 0:
+            return None
+        return idx + offset
+
+    def partners(self) -> List[int]:
+        '''
+        Index of the partner of every token, -1 for other tokens and
+        unmatched braces.
+        '''
+        return [idx + offset if offset else -1
+                for idx, offset in enumerate(self.offsets)]
+
+    def enclosing(self, idx: int) -> int:
+        '''
+        Index of the opening brace of the innermost group holding idx,
+        None at top level. Sibling groups are skipped as a whole.
+        '''
+        offsets = self.offsets
+        strList = self.strList
+        cursor = idx - 1
+        while cursor >= 0:
+            offset = offsets[cursor]
+            if offset < 0:
+                cursor = cursor + offset - 1
+            elif offset > 0 and cursor + offset >= idx:
+                return cursor
+            elif offset == 0 and strList[cursor] == self.opening:
+                return cursor
+            else:
+                cursor = cursor - 1
+        return None
+
+    def closeFrom(self, start: int) -> int:
+        '''
+        Like counting braces forward from start with one group open:
+        index of the closing brace of that group, None if it is not closed.
+        '''
+        if start > 0 and self.strList[start-1] == self.opening:
+            closeIdx = self.partner(start-1)
+            if closeIdx is not None:
+                return closeIdx
+        count = 1
+        for idx in range(start, len(self.strList)):
+            if self.strList[idx] == self.opening:
+                count = count + 1
+            elif self.strList[idx] == self.closing:
+                count = count - 1
+                if count == 0:
+                    return idx
+        return None
+
+    def firstGroupClose(self, start: int) -> int:
+        '''
+        Index of the closing brace of the first group opened from start,
+        None if it is not closed.
+        '''
+        if start < len(self.strList) and self.strList[start] == self.opening:
+            closeIdx = self.partner(start)
+            if closeIdx is not None:
+                return closeIdx
+        count = 0
+        for idx in range(start, len(self.strList)):
+            if self.strList[idx] == self.opening:
+                count = count + 1
+            elif self.strList[idx] == self.closing:
+                count = count - 1
+                if count == 0:
+                    return idx
+        return None
+
+    def openFrom(self, start: int) -> int:
+        '''
+        Like counting braces backward from start with one group open:
+        index of the opening brace of that group, None if it is not opened.
+        The index is negative if the group is found past the start of the
+        list.
+        '''
+        if start + 1 < len(self.strList) and \
+                self.strList[start+1] == self.closing:
+            openIdx = self.partner(start+1)
+            if openIdx is not None:
+                return openIdx
+        # like the counting it replaces, the scan goes on from the end of
+        # the list through negative indices
+        count = 1
+        for idx in range(start, -len(self.strList) - 1, -1):
+            if self.strList[idx] == self.closing:
+                count = count + 1
+            elif self.strList[idx] == self.opening:
+                count = count - 1
+                if count == 0:
+                    return idx
+        return None
+
+    def _isBalanced(self, tokens: List[str]) -> bool:
+        depth = 0
+        for elem in tokens:
+            if elem == self.opening:
+                depth = depth + 1
+            elif elem == self.closing:
+                depth = depth - 1
+                if depth < 0:
+                    return False
+        return depth == 0
+
+    def _enclosingGroups(self, idx: int) -> List[int]:
+        '''
+        Opening braces of the matched groups holding idx, innermost first.
+        '''
+        groups = []
+        cursor = self.enclosing(idx)
+        while cursor is not None:
+            if self._offsets[cursor] > 0:
+                groups.append(cursor)
+            cursor = self.enclosing(cursor)
+        return groups
+
+    def _moveGroups(self, groups: List[int], delta: int) -> None:
+        offsets = self._offsets
+        for openIdx in groups:
+            closeIdx = openIdx + offsets[openIdx] + delta
+            offsets[openIdx] = closeIdx - openIdx
+            offsets[closeIdx] = openIdx - closeIdx
+
+    def splice(self, start: int, stop: int, tokens: List[str]) -> None:
+        '''
+        strList[start:stop] = tokens, keeping the index up to date.
+        '''
+        removed = self.strList[start:stop]
+        if self._offsets is None or start < 0 or \
+                not self._isBalanced(removed) or \
+                not self._isBalanced(tokens):
+            self.strList[start:stop] = tokens
+            self._offsets = None
+            return
+        # enclosing groups are found before the change, then moved after it
+        delta = len(tokens) - len(removed)
+        groups = self._enclosingGroups(start) if delta != 0 else []
+        net = self._net
+        self.strList[start:stop] = tokens
+        self._offsets[start:stop] = self._offsetsOf(tokens)
+        self._net = net
+        self._moveGroups(groups, delta)
+
+    def wrap(self, start: int, stop: int) -> None:
+        '''
+        Put strList[start:stop] in a new group, keeping the index up to date.
+        '''
+        if self._offsets is None or start < 0 or \
+                not self._isBalanced(self.strList[start:stop]):
+            self.strList.insert(stop, self.closing)
+            self.strList.insert(start, self.opening)
+            self._offsets = None
+            return
+        groups = self._enclosingGroups(start)
+        self.strList.insert(stop, self.closing)
+        self.strList.insert(start, self.opening)
+        self._offsets.insert(stop, start - stop - 1)
+        self._offsets.insert(start, stop + 1 - start)
+        self._moveGroups(groups, 2)
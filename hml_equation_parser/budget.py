@@ -0,0 +1,86 @@
+import time
+
+
+class BudgetExceeded(Exception):
+    '''
+    Raised inside a conversion pass when an equation runs over its budget.
+    '''
+    def __init__(self, stage: str, reason: str) -> None:
+        super().__init__("{}: {}".format(stage, reason))
+        self.stage = stage
+        self.reason = reason
+
+
+class EquationBudget:
+    '''
+    Limits for converting a single equation.
+    A limit of None is not enforced.
+
+    Parameters
+    ----------------------
+    maxTokens : int, optional
+        Maximum length of the token list.
+    maxSteps : int, optional
+        Maximum number of rewrite steps, counted over all passes.
+    maxTime : float, optional
+        Maximum wall time in seconds.
+    '''
+    def __init__(self, maxTokens: int = None, maxSteps: int = None,
+                 maxTime: float = None) -> None:
+        self.maxTokens = maxTokens
+        self.maxSteps = maxSteps
+        self.maxTime = maxTime
+
+    def start(self) -> 'BudgetMeter':
+        '''
+        Start metering one equation. A budget can be shared by a batch,
+        but every equation needs its own meter.
+        '''
+        return BudgetMeter(self)
+
+
+class BudgetMeter:
+    '''
+    Running usage of an EquationBudget, checked by the conversion passes.
+    '''
+    def __init__(self, budget: EquationBudget) -> None:
+        self.budget = budget
+        self.steps = 0
+        self.deadline = None
+        self.remaining = None
+        if budget.maxTime is not None:
+            self.deadline = time.monotonic() + budget.maxTime
+
+    def step(self, stage: str, tokenCount: int = None) -> None:
+        '''
+        Count one rewrite step of `stage`, raising BudgetExceeded if any
+        limit is exceeded.
+        '''
+        self.steps += 1
+        budget = self.budget
+        if budget.maxSteps is not None and self.steps > budget.maxSteps:
+            raise BudgetExceeded(
+                stage, "exceeded {} rewrite steps".format(budget.maxSteps))
+        if budget.maxTokens is not None and tokenCount is not None and\
+                tokenCount > budget.maxTokens:
+            raise BudgetExceeded(
+                stage, "exceeded {} tokens".format(budget.maxTokens))
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise BudgetExceeded(
+                stage, "exceeded {} seconds".format(budget.maxTime))
+
+    def pause(self) -> None:
+        '''
+        Stop the wall time clock, while the equation waits for other
+        equations of a batch.
+        '''
+        if self.deadline is not None:
+            self.remaining = self.deadline - time.monotonic()
+
+    def resume(self) -> None:
+        '''
+        Restart the wall time clock stopped by pause.
+        '''
+        if self.remaining is not None:
+            self.deadline = time.monotonic() + self.remaining
+            self.remaining = None
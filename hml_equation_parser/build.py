@@ -0,0 +1,221 @@
+'''
+Incremental conversion of a document set into a directory.
+
+Like the hmlParser command, every .hml document is converted to
+"<name>.xml" and "<name>.html", but a manifest in the output directory
+records, for every document, its size, modification time and content
+hash, and its outputs. A rerun only converts the documents whose content
+changed, or whose outputs are missing, in the stages of a
+DocumentPipeline; the others cost a stat. A document whose size or
+modification time changed is hashed again, and skipped if its content is
+the same.
+
+The manifest also records the fingerprint of the converter (convertMap and
+the converting modules). When it changes, every document is converted.
+
+    python -m hml_equation_parser.build --out converted --workers 4 docs/
+'''
+from typing import Iterable, Iterator, List
+import argparse
+import hashlib
+import json
+import os
+import time
+
+from .convertPlan import loadPlan
+from .pipeline import DocumentPipeline
+from .dedup import outputName
+from .diagnostics import Diagnostics
+from .budget import EquationBudget
+
+manifestName = "manifest.json"
+manifestVersion = 1
+
+# files whose content changes the converted outputs
+converterFiles = ["config.json", "hmlParser.py", "hulkEqParser.py",
+                  "EqRegularizer.py", "hulkReplaceMethod.py",
+                  "matrixCells.py", "braceIndex.py", "convertPlan.py",
+                  "buildConvertPlan.py"]
+
+
+def converterFingerprint() -> str:
+    '''
+    sha1 hex digest of the convertMap fingerprint and the converter files.
+    '''
+    digest = hashlib.sha1(loadPlan().fingerprint.encode())
+    for fileName in converterFiles:
+        with open(os.path.join(os.path.dirname(__file__), fileName),
+                  "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def iterSources(sources: Iterable[str]) -> Iterator[str]:
+    '''
+    .hml files, and the .hml files found under directories, in order.
+    '''
+    for source in sources:
+        if not os.path.isdir(source):
+            yield source
+            continue
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for fileName in sorted(files):
+                if fileName.lower().endswith(".hml"):
+                    yield os.path.join(root, fileName)
+
+
+def destination(source: str, outDir: str) -> str:
+    '''
+    Destination name of the outputs of a document, mirroring its path
+    under outDir as dedup names them.
+    '''
+    return os.path.join(outDir, outputName(source))
+
+
+def readManifest(path: str) -> dict:
+    '''
+    Content of a manifest, empty if there is none or it is unreadable.
+    '''
+    try:
+        with open(path, "r", encoding="utf8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != manifestVersion:
+        return {}
+    return manifest
+
+
+def writeManifest(path: str, manifest: dict) -> None:
+    '''
+    Replace the manifest at once, so that an interrupted write leaves the
+    previous one.
+    '''
+    with open(path + ".tmp", "w", encoding="utf8") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+
+def buildDocuments(sources: Iterable[str], outDir: str,
+                   diagnostics: Diagnostics = None, workers: int = 1,
+                   budget: EquationBudget = None,
+                   manifestPath: str = None, readers: int = 2,
+                   writers: int = 2) -> dict:
+    '''
+    Convert the documents of sources that changed since the last build
+    into outDir, and update the manifest.
+
+    Parameters
+    ----------------------
+    sources : Iterable[str]
+        .hml files, or directories to search for them.
+    outDir : str
+        Directory for the outputs and, by default, the manifest.
+    diagnostics : Diagnostics, optional
+        Collector for the records of converted documents, and for
+        documents which could not be read or parsed (stage "build"), which
+        are left out of the manifest to be retried. If not given, they are
+        printed.
+    workers : int
+        Number of processes converting documents.
+    budget : EquationBudget, optional
+        Budget for each equation.
+    manifestPath : str, optional
+        Path of the manifest, outDir/manifest.json by default.
+    readers, writers : int
+        Number of threads reading documents and writing outputs.
+
+    Returns
+    ----------------------
+    out : dict
+        Number of documents, of documents skipped by their stat
+        ("unchanged"), skipped by their hash ("rehashed"), converted and
+        failed, the time spent, and the counters of every stage of the
+        pipeline.
+    '''
+    start = time.perf_counter()
+    if manifestPath is None:
+        manifestPath = os.path.join(outDir, manifestName)
+    fingerprint = converterFingerprint()
+    manifest = readManifest(manifestPath)
+    entries = {}  # type: dict
+    if manifest.get("fingerprint") == fingerprint:
+        entries = manifest["documents"]
+
+    report = {"documents": 0, "unchanged": 0, "rehashed": 0,
+              "converted": 0, "failed": 0}
+    # (source, manifest key, stat, destination, outputs, known hash)
+    pending = []  # type: List[tuple]
+    for source in iterSources(sources):
+        report["documents"] += 1
+        key = os.path.abspath(source)
+        stat = os.stat(source)
+        dst = destination(source, outDir)
+        outputs = [dst + ".xml", dst + ".html"]
+        entry = entries.get(key)
+        if entry is not None and entry["outputs"] == outputs and \
+                all(os.path.exists(output) for output in outputs):
+            if entry["size"] == stat.st_size and \
+                    entry["mtime"] == stat.st_mtime_ns:
+                report["unchanged"] += 1
+                continue
+        else:
+            entry = None
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        pending.append((source, key, stat, dst, outputs,
+                        entry["sha1"] if entry is not None else None))
+
+    pipeline = DocumentPipeline(readers, workers, writers, budget=budget)
+    tasks = [(item[0], item[3], item[5], idx)
+             for idx, item in enumerate(pending)]
+    try:
+        for idx, digest, converted, records in pipeline.run(tasks):
+            _, key, stat, _, outputs, _ = pending[idx]
+            for record in records:
+                if diagnostics is None:
+                    print(record.reason)
+                else:
+                    diagnostics.report(record.stage, record.reason,
+                                       record.tokenIndex, record.equationId)
+            if digest is None:
+                report["failed"] += 1
+                entries.pop(key, None)
+                continue
+            report["converted" if converted else "rehashed"] += 1
+            entries[key] = {"size": stat.st_size, "mtime": stat.st_mtime_ns,
+                            "sha1": digest, "outputs": outputs}
+    finally:
+        # a no-op build leaves the manifest as it is
+        if pending or manifest.get("fingerprint") != fingerprint:
+            writeManifest(manifestPath, {"version": manifestVersion,
+                                         "fingerprint": fingerprint,
+                                         "documents": entries})
+    report["seconds"] = time.perf_counter() - start
+    report["stages"] = pipeline.report()
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Convert the .hml documents which changed since the "
+                    "last build.")
+    parser.add_argument("sources", nargs="+",
+                        help=".hml documents or directories of them")
+    parser.add_argument("--out", required=True,
+                        help="directory for the outputs and the manifest")
+    parser.add_argument("--manifest", default=None,
+                        help="path of the manifest, "
+                             "OUT/" + manifestName + " by default")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--writers", type=int, default=2)
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    diagnostics = Diagnostics()
+    report = buildDocuments(args.sources, args.out, diagnostics,
+                            args.workers, manifestPath=args.manifest,
+                            readers=args.readers, writers=args.writers)
+    report["diagnostics"] = dict(diagnostics.counters)
+    print(json.dumps(report))
@@ -0,0 +1,165 @@
+'''
+Generate hml_equation_parser/_convertPlan.py from convertMap.json.
+
+This script only needs the standard library and never imports the
+package, so setup.py runs it before anything is built:
+
+    python hml_equation_parser/buildConvertPlan.py
+    python hml_equation_parser/buildConvertPlan.py --benchmark
+
+With --benchmark, it times loading the plan in fresh interpreters from
+the generated module and from the json, and importing the package.
+'''
+from typing import Dict, List
+import argparse
+import codecs
+import hashlib
+import json
+import os
+import sys
+
+here = os.path.dirname(os.path.abspath(__file__))
+mapPath = os.path.join(here, "convertMap.json")
+modulePath = os.path.join(here, "_convertPlan.py")
+
+# bump when the layout of the generated tables changes
+planFormat = 3
+
+
+def mapFingerprint(path: str = mapPath) -> str:
+    '''
+    sha1 hex digest of the convertMap.json bytes and the plan format.
+    '''
+    with open(path, "rb") as f:
+        digest = hashlib.sha1(f.read())
+    digest.update(str(planFormat).encode())
+    return digest.hexdigest()
+
+
+def planTables(maps: Dict[str, Dict]) -> Dict[str, object]:
+    '''
+    Plain python tables of the plan, before freezing.
+    '''
+    tokenMap = dict(maps["middleConvertMap"])
+    tokenMap.update(maps["convertMap"])  # convertMap takes precedence
+    return {
+        "convertMap": dict(maps["convertMap"]),
+        "middleConvertMap": dict(maps["middleConvertMap"]),
+        "tokenMap": tokenMap,
+        "barTemplates": dict(maps["BarConvertMap"]),
+        "matrixTemplates": {
+            key: (elem["begin"], elem["end"], elem["removeOutterBrackets"])
+            for key, elem in maps["MatrixConvertMap"].items()},
+        "braceTemplates": dict(maps["BraceConvertMap"]),
+    }
+
+
+def readMaps(path: str = mapPath) -> Dict[str, Dict]:
+    '''
+    The maps of convertMap.json.
+    '''
+    with codecs.open(path, "r", "utf8") as f:
+        return json.load(f)
+
+
+def generateModule(maps: Dict[str, Dict], fingerprint: str) -> str:
+    '''
+    Source code of the `_convertPlan` module.
+    '''
+    return "\n".join([
+        "# Generated by hml_equation_parser.buildConvertPlan "
+        "from convertMap.json. Do not edit.",
+        "fingerprint = {!r}".format(fingerprint),
+        "tables = {!r}".format(planTables(maps)),
+    ]) + "\n"
+
+
+def writePlanModule(path: str = modulePath) -> None:
+    '''
+    Generate the `_convertPlan` module from convertMap.json.
+    '''
+    with codecs.open(path, "w", "utf8") as f:
+        f.write(generateModule(readMaps(), mapFingerprint()))
+
+
+# Code run by every fresh interpreter of the benchmark. Both ways of
+# loading the plan hash convertMap.json to check the generated module.
+_loadModule = '''
+import sys, time
+sys.path.insert(0, {directory!r})
+start = time.perf_counter()
+fingerprint = mapFingerprint()
+import _convertPlan
+assert _convertPlan.fingerprint == fingerprint
+print(time.perf_counter() - start)
+'''
+_loadJson = '''
+import time
+start = time.perf_counter()
+fingerprint = mapFingerprint()
+tables = planTables(readMaps())
+print(time.perf_counter() - start)
+'''
+_importPackage = '''
+import sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import hml_equation_parser
+print(time.perf_counter() - start)
+'''
+
+
+def _timeFresh(code: str, runs: int) -> float:
+    '''
+    Median of the seconds printed by `code` in `runs` fresh interpreters,
+    with the functions of this script defined.
+    '''
+    # imported here, as the package imports this script for its tables
+    import statistics
+    import subprocess
+    prelude = "import runpy\nglobals().update(runpy.run_path({!r}))\n" \
+        .format(os.path.abspath(__file__))
+    seconds = []  # type: List[float]
+    for _ in range(runs):
+        out = subprocess.check_output([sys.executable, "-c", prelude + code])
+        seconds.append(float(out.decode().split()[-1]))
+    return statistics.median(seconds)
+
+
+def benchmark(runs: int = 20) -> dict:
+    '''
+    Median milliseconds of loading the plan from a generated module (from
+    its cached bytecode, as an installed package does) and from
+    convertMap.json, and of importing the package, each in `runs` fresh
+    interpreters.
+    '''
+    import py_compile
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "_convertPlan.py")
+        writePlanModule(path)
+        # even with PYTHONDONTWRITEBYTECODE
+        py_compile.compile(path)
+        module = _timeFresh(_loadModule.format(directory=directory), runs)
+    json_ = _timeFresh(_loadJson, runs)
+    package = _timeFresh(_importPackage.format(root=os.path.dirname(here)),
+                         runs)
+    return {"runs": runs,
+            "moduleMs": module * 1e3,
+            "jsonMs": json_ * 1e3,
+            "importMs": package * 1e3}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Generate _convertPlan.py from convertMap.json.")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="time loading the plan instead")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.benchmark:
+        print(json.dumps(benchmark(args.runs)))
+    else:
+        writePlanModule()
+        print("wrote " + modulePath)
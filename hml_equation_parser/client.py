@@ -0,0 +1,213 @@
+'''
+Client of the conversion daemon, see daemon.py.
+
+Every message is a frame: a 4 byte big-endian length and that many bytes.
+A request is a JSON frame with an "op", and for "document" a second frame
+with the raw bytes of the .hml document. The reply is a JSON frame with
+"ok" and the result, or the "error" that made the request fail.
+
+    {"op": "equation", "script": "a over b"}   -> {"ok": true, "latex": ...}
+    {"op": "batch", "scripts": [...]}          -> {"ok": true, "latex": [...]}
+    {"op": "document"} + document              -> {"ok": true, "xml": ...,
+                                                   "html": ...,
+                                                   "solutionXml": ...,
+                                                   "solutionHtml": ...}
+
+Any request may set "diagnostics": true to get the "records" of the
+conversion. A connection serves requests until the client closes it, so
+a client connecting once pays one round-trip per request.
+
+    python -m hml_equation_parser.client --socket /tmp/hml.sock test.hml dst
+'''
+from typing import List
+import argparse
+import json
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+from .hmlParser import writeDocument
+
+_length = struct.Struct(">I")
+maxFrameSize = 1 << 30
+
+
+class DaemonError(Exception):
+    '''
+    Raised by ConversionClient when the daemon could not serve a request.
+    '''
+
+
+def sendFrame(sock: socket.socket, payload: bytes) -> None:
+    sock.sendall(_length.pack(len(payload)) + payload)
+
+
+def _recvExactly(sock: socket.socket, size: int) -> bytes:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if count == 0:
+            raise EOFError("connection closed after {} of {} bytes"
+                           .format(received, size))
+        received += count
+    return bytes(buffer)
+
+
+def recvFrame(sock: socket.socket) -> bytes:
+    '''
+    Read one frame, None if the connection is closed before it starts.
+    '''
+    header = sock.recv(_length.size, socket.MSG_WAITALL)
+    if not header:
+        return None
+    if len(header) < _length.size:
+        header += _recvExactly(sock, _length.size - len(header))
+    size, = _length.unpack(header)
+    if size > maxFrameSize:
+        raise ValueError("frame of {} bytes is too large".format(size))
+    return _recvExactly(sock, size)
+
+
+def sendMessage(sock: socket.socket, message: dict) -> None:
+    sendFrame(sock, json.dumps(message).encode("utf8"))
+
+
+def recvMessage(sock: socket.socket) -> dict:
+    frame = recvFrame(sock)
+    if frame is None:
+        return None
+    return json.loads(frame.decode("utf8"))
+
+
+class ConversionClient:
+    '''
+    Connection to a conversion daemon, kept open for all requests.
+
+    Parameters
+    ----------------------
+    path : str
+        Path of the Unix socket the daemon listens on.
+    diagnostics : bool
+        Ask for the diagnostic records of every request. They are kept in
+        `records` after each request.
+    '''
+    def __init__(self, path: str, diagnostics: bool = False) -> None:
+        self.diagnostics = diagnostics
+        self.records = []  # type: List[list]
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def __enter__(self) -> 'ConversionClient':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def request(self, message: dict, body: bytes = None) -> dict:
+        '''
+        Send a request, and the body frame if any, and return the reply.
+        '''
+        if self.diagnostics:
+            message["diagnostics"] = True
+        sendMessage(self.sock, message)
+        if body is not None:
+            sendFrame(self.sock, body)
+        reply = recvMessage(self.sock)
+        if reply is None:
+            raise DaemonError("the daemon closed the connection")
+        if not reply["ok"]:
+            raise DaemonError(reply["error"])
+        self.records = reply.get("records", [])
+        return reply
+
+    def ping(self) -> dict:
+        return self.request({"op": "ping"})
+
+    def equation(self, script: str) -> str:
+        '''
+        Latex string of a hml equation string, as eq2latex converts it.
+        '''
+        return self.request({"op": "equation", "script": script})["latex"]
+
+    def batch(self, scripts: List[str]) -> List[str]:
+        '''
+        Latex strings of many hml equation strings, as convertBatch
+        converts them.
+        '''
+        return self.request({"op": "batch",
+                             "scripts": list(scripts)})["latex"]
+
+    def document(self, document: bytes) -> dict:
+        '''
+        Convert the raw bytes of a .hml document.
+
+        Returns
+        ----------------------
+        out : dict
+            The outputs of convertDocument, see writeDocument.
+        '''
+        reply = self.request({"op": "document"}, document)
+        return {key: reply[key]
+                for key in ["xml", "html", "solutionXml", "solutionHtml"]}
+
+
+def benchmark(path: str, documents: List[str], dst: str) -> dict:
+    '''
+    Time converting each document by starting the hmlParser command, and
+    by a request to the daemon from one connection.
+    '''
+    start = time.perf_counter()
+    for document in documents:
+        subprocess.check_call([sys.executable, "-m",
+                               "hml_equation_parser.hmlParser", document,
+                               dst])
+    spawnSeconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ConversionClient(path) as client:
+        connectSeconds = time.perf_counter() - start
+        for document in documents:
+            with open(document, "rb") as f:
+                writeDocument(client.document(f.read()), dst)
+    daemonSeconds = time.perf_counter() - start
+    count = len(documents)
+    return {"documents": count,
+            "spawnSeconds": spawnSeconds,
+            "daemonSeconds": daemonSeconds,
+            "connectSeconds": connectSeconds,
+            "spawnPerDocument": spawnSeconds / count if count else 0.0,
+            "daemonPerDocument": daemonSeconds / count if count else 0.0}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Convert with a running conversion daemon.")
+    parser.add_argument("--socket", required=True,
+                        help="Unix socket of the daemon")
+    parser.add_argument("--equation", action="append", default=[],
+                        help="convert this equation string and print it")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="compare with starting the hmlParser command "
+                             "for each document")
+    parser.add_argument("documents", nargs="*",
+                        help=".hml documents, then the destination name")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        print(json.dumps(benchmark(args.socket, args.documents[:-1],
+                                   args.documents[-1])))
+        sys.exit()
+    with ConversionClient(args.socket) as client:
+        for latex in client.batch(args.equation) if args.equation else []:
+            print(latex)
+        if args.documents:
+            hmlDoc, dst = args.documents
+            with open(hmlDoc, "rb") as f:
+                writeDocument(client.document(f.read()), dst)
@@ -0,0 +1,57 @@
+'''
+Conversion plan compiled from convertMap.json.
+
+`loadPlan` returns the tables used at run time: frozen lookup tables
+and precomputed matrix/bar/brace templates.
+They come from the generated module `_convertPlan.py` when it exists and
+matches the fingerprint of convertMap.json, and are compiled from the
+json otherwise. The tables are made by buildConvertPlan, which setup.py
+runs as a script to generate the module:
+
+    python hml_equation_parser/buildConvertPlan.py
+'''
+from typing import Dict
+from types import MappingProxyType
+
+from .buildConvertPlan import (mapPath, modulePath, planFormat,
+                               mapFingerprint, planTables, readMaps,
+                               generateModule, writePlanModule)
+
+_loadedPlan = None
+
+
+class ConvertPlan:
+    '''
+    Frozen lookup tables and templates of a conversion plan.
+    '''
+    def __init__(self, tables: Dict[str, object], fingerprint: str) -> None:
+        self.fingerprint = fingerprint
+        self.convertMap = MappingProxyType(tables["convertMap"])
+        self.middleConvertMap = MappingProxyType(tables["middleConvertMap"])
+        self.tokenMap = MappingProxyType(tables["tokenMap"])
+        self.barTemplates = MappingProxyType(tables["barTemplates"])
+        self.matrixTemplates = MappingProxyType(tables["matrixTemplates"])
+        self.braceTemplates = MappingProxyType(tables["braceTemplates"])
+        self.markers = frozenset(self.barTemplates) | \
+            frozenset(self.matrixTemplates) | frozenset(self.braceTemplates)
+
+
+def loadPlan() -> ConvertPlan:
+    '''
+    Load the generated plan if it is up to date,
+    or compile it from convertMap.json. The plan is loaded once per process.
+    '''
+    global _loadedPlan
+    if _loadedPlan is not None:
+        return _loadedPlan
+
+    fingerprint = mapFingerprint()
+    try:
+        from . import _convertPlan
+        if _convertPlan.fingerprint == fingerprint:
+            _loadedPlan = ConvertPlan(_convertPlan.tables, fingerprint)
+    except ImportError:
+        pass
+    if _loadedPlan is None:
+        _loadedPlan = ConvertPlan(planTables(readMaps()), fingerprint)
+    return _loadedPlan
@@ -0,0 +1,221 @@
+'''
+Binary equation corpus, loaded with mmap instead of parsing JSON lines.
+
+A corpus file is
+    header   : magic b"HMLEQC", version (uint16), count (uint64)
+    offsets  : count + 1 uint64 offsets of the equations in the blob
+    blob     : the UTF-8 encoded equations, one after the other
+with every integer little-endian. Opening a corpus reads only the header;
+an equation is decoded from the mapped blob when it is accessed.
+
+    python -m hml_equation_parser.corpus write corpus.hmleq equations.jsonl
+    python -m hml_equation_parser.corpus convert --workers 4 corpus.hmleq
+'''
+from typing import Iterable, Iterator, List, Union
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import array
+import codecs
+import json
+import mmap
+import struct
+import sys
+import time
+
+from .batch import convertBatch, readEquations
+from .diagnostics import Diagnostics
+
+magic = b"HMLEQC"
+corpusVersion = 1
+_header = struct.Struct("<6sHQ")
+
+
+def writeCorpus(fileName: str, equations: Iterable[str]) -> int:
+    '''
+    Write equation strings to a corpus file.
+
+    Returns
+    ----------------------
+    out : int
+        Number of equations written.
+    '''
+    blobs = [equation.encode("utf8") for equation in equations]
+    offsets = array.array("Q", [0])
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+    if sys.byteorder != "little":
+        offsets.byteswap()
+    with open(fileName, "wb") as f:
+        f.write(_header.pack(magic, corpusVersion, len(blobs)))
+        f.write(offsets.tobytes())
+        for blob in blobs:
+            f.write(blob)
+    return len(blobs)
+
+
+def isCorpus(fileName: str) -> bool:
+    '''
+    Whether fileName starts like a corpus file.
+    '''
+    with open(fileName, "rb") as f:
+        return f.read(len(magic)) == magic
+
+
+class Corpus:
+    '''
+    Read-only, memory-mapped view of the equations of a corpus file.
+
+    Supports len(), iteration, corpus[idx] and corpus[start:stop]. A slice
+    shares the mapping of its corpus. Pickling a corpus (for a worker
+    process) sends only the file name and the range, and the worker maps
+    the file again.
+
+    Parameters
+    ----------------------
+    fileName : str
+        Corpus file written by writeCorpus.
+    start, stop : int, optional
+        Range of equations in the view, the whole corpus by default.
+    '''
+    def __init__(self, fileName: str, start: int = 0,
+                 stop: int = None) -> None:
+        self.fileName = fileName
+        with open(fileName, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        fileMagic, version, count = _header.unpack_from(self._map)
+        if fileMagic != magic or version != corpusVersion:
+            self._map.close()
+            raise ValueError("not a corpus file: {}".format(fileName))
+        tableEnd = _header.size + 8 * (count + 1)
+        if sys.byteorder == "little":
+            self._offsets = memoryview(self._map)[_header.size:tableEnd] \
+                .cast("Q")
+        else:
+            self._offsets = array.array("Q", self._map[_header.size:tableEnd])
+            self._offsets.byteswap()
+        self._blobStart = tableEnd
+        self.start, self.stop, _ = slice(start, stop).indices(count)
+        self.stop = max(self.start, self.stop)
+
+    def _view(self, start: int, stop: int) -> 'Corpus':
+        view = Corpus.__new__(Corpus)
+        view.__dict__.update(self.__dict__)
+        view.start, view.stop = start, stop
+        return view
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def raw(self, idx: int) -> memoryview:
+        '''
+        UTF-8 bytes of an equation, without copying them.
+        '''
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("corpus index out of range")
+        idx += self.start
+        begin = self._blobStart + self._offsets[idx]
+        end = self._blobStart + self._offsets[idx + 1]
+        return memoryview(self._map)[begin:end]
+
+    def __getitem__(self, idx: Union[int, slice]) -> Union[str, 'Corpus']:
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(len(self))
+            if step != 1:
+                raise ValueError("corpus slices must be contiguous")
+            return self._view(self.start + start,
+                              self.start + max(start, stop))
+        return str(self.raw(idx), "utf8")
+
+    def __iter__(self) -> Iterator[str]:
+        mapped = self._map
+        blobStart = self._blobStart
+        offsets = self._offsets[self.start:self.stop + 1].tolist()
+        for idx in range(len(offsets) - 1):
+            yield mapped[blobStart + offsets[idx]:
+                         blobStart + offsets[idx + 1]].decode("utf8")
+
+    def shards(self, count: int) -> List['Corpus']:
+        '''
+        Split the corpus in count contiguous views of nearly equal length.
+        '''
+        size, extra = divmod(len(self), count)
+        shards = []
+        start = 0
+        for shard in range(count):
+            stop = start + size + (1 if shard < extra else 0)
+            shards.append(self[start:stop])
+            start = stop
+        return shards
+
+    def __reduce__(self):
+        return (Corpus, (self.fileName, self.start, self.stop))
+
+
+def readJsonLines(fileName: str, key: str = "equation") -> List[str]:
+    '''
+    Equation strings of a JSON lines file, whose lines are strings or
+    objects with the equation under key.
+    '''
+    equations = []  # type: List[str]
+    with codecs.open(fileName, "r", "utf8") as f:
+        for line in f:
+            if line.strip():
+                value = json.loads(line)
+                equations.append(value if isinstance(value, str)
+                                 else value[key])
+    return equations
+
+
+def _convertShard(shard: Corpus) -> List[str]:
+    return convertBatch(shard, Diagnostics())
+
+
+def convertCorpus(corpus: Corpus, workers: int = 1) -> List[str]:
+    '''
+    Convert every equation of a corpus, with one shard per worker process.
+    '''
+    if workers <= 1:
+        return convertBatch(corpus, Diagnostics())
+    results = []  # type: List[str]
+    with ProcessPoolExecutor(workers) as executor:
+        for converted in executor.map(_convertShard, corpus.shards(workers)):
+            results.extend(converted)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Write, or convert, binary equation corpora.")
+    commands = parser.add_subparsers(dest="command")
+    write = commands.add_parser(
+        "write", help="write a corpus from .jsonl, .hml or text files")
+    write.add_argument("corpus")
+    write.add_argument("files", nargs="+")
+    write.add_argument("--key", default="equation",
+                       help="key of the equation in JSON objects")
+    convert = commands.add_parser(
+        "convert", help="convert a corpus and report the time spent")
+    convert.add_argument("corpus")
+    convert.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == "write":
+        equations = []  # type: List[str]
+        for fileName in args.files:
+            if fileName.endswith(".jsonl"):
+                equations.extend(readJsonLines(fileName, args.key))
+            else:
+                equations.extend(readEquations([fileName]))
+        print(writeCorpus(args.corpus, equations))
+    elif args.command == "convert":
+        start = time.perf_counter()
+        corpus = Corpus(args.corpus)
+        loadSeconds = time.perf_counter() - start
+        results = convertCorpus(corpus, args.workers)
+        print(json.dumps({"equations": len(results),
+                          "loadSeconds": loadSeconds,
+                          "seconds": time.perf_counter() - start}))
+    else:
+        parser.print_help()
@@ -0,0 +1,141 @@
+'''
+Keep the converter loaded in a long-lived process, serving conversions
+over a Unix domain socket.
+
+Starting python and loading the convert plan takes longer than converting
+a typical document, so a caller converting one document per process pays
+mostly for start-up. The daemon pays it once: a client connects, sends
+equations, batches or whole documents as length-prefixed frames, and gets
+the results back on the same connection. The protocol and a client are in
+client.py. Every connection is served by its own thread.
+
+    python -m hml_equation_parser.daemon --socket /tmp/hml.sock
+'''
+from typing import List
+import argparse
+import os
+import signal
+import socket
+import socketserver
+
+from .hmlParser import convertDocument
+from .hulkEqParser import hmlEquation2latex
+from .batch import convertBatch
+from .diagnostics import Diagnostics
+from .budget import EquationBudget
+from .client import recvFrame, recvMessage, sendMessage
+
+
+def _records(diagnostics: Diagnostics) -> List[list]:
+    return [[record.equationId, record.stage, record.tokenIndex,
+             record.reason] for record in diagnostics.records]
+
+
+class ConversionHandler(socketserver.BaseRequestHandler):
+    '''
+    Serve the requests of one connection until the client closes it.
+    '''
+    def handle(self) -> None:
+        sock = self.request
+        budget = self.server.budget
+        while True:
+            message = recvMessage(sock)
+            if message is None:
+                return
+            op = message.get("op")
+            body = recvFrame(sock) if op == "document" else None
+            diagnostics = Diagnostics()
+            try:
+                if op == "ping":
+                    reply = {"pid": os.getpid()}
+                elif op == "equation":
+                    reply = {"latex": hmlEquation2latex(
+                        message["script"], diagnostics, budget=budget)}
+                elif op == "batch":
+                    reply = {"latex": convertBatch(message["scripts"],
+                                                   diagnostics, budget)}
+                elif op == "document":
+                    reply = convertDocument(body, diagnostics, budget,
+                                            "document")
+                else:
+                    raise ValueError("unknown op: {}".format(op))
+            except Exception as e:
+                sendMessage(sock, {"ok": False, "error": "{}: {}".format(
+                    type(e).__name__, e)})
+                continue
+            reply["ok"] = True
+            if message.get("diagnostics"):
+                reply["records"] = _records(diagnostics)
+            sendMessage(sock, reply)
+
+
+class ConversionServer(socketserver.ThreadingMixIn,
+                       socketserver.UnixStreamServer):
+    '''
+    Conversion daemon listening on a Unix socket.
+
+    Parameters
+    ----------------------
+    path : str
+        Path of the socket. A stale socket file left there is replaced.
+    budget : EquationBudget, optional
+        Budget for each equation converted.
+    '''
+    daemon_threads = True
+
+    def __init__(self, path: str, budget: EquationBudget = None) -> None:
+        self.budget = budget
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except OSError:
+                os.remove(path)
+            else:
+                raise OSError("a daemon already listens on {}".format(path))
+            finally:
+                probe.close()
+        super().__init__(path, ConversionHandler)
+
+    def server_close(self) -> None:
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def _interrupt(signum, frame) -> None:
+    raise KeyboardInterrupt
+
+
+def serve(path: str, budget: EquationBudget = None) -> None:
+    '''
+    Run a conversion daemon on path until interrupted.
+    '''
+    # the first conversion also loads what the plan leaves to first use
+    hmlEquation2latex("a over b")
+    server = ConversionServer(path, budget)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Serve conversions over a Unix socket.")
+    parser.add_argument("--socket", required=True,
+                        help="path of the Unix socket to listen on")
+    parser.add_argument("--max-tokens", type=int, default=None)
+    parser.add_argument("--max-steps", type=int, default=None)
+    parser.add_argument("--max-time", type=float, default=None)
+    args = parser.parse_args()
+
+    budget = None
+    if args.max_tokens or args.max_steps or args.max_time:
+        budget = EquationBudget(args.max_tokens, args.max_steps,
+                                args.max_time)
+    # stopped like interrupted, removing the socket file
+    signal.signal(signal.SIGTERM, _interrupt)
+    serve(args.socket, budget)
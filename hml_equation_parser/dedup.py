@@ -0,0 +1,228 @@
+'''
+Convert the equations of a document set once per distinct equation.
+
+Most equations of a large document set are repeats. Instead of converting
+document by document, the documents are scanned once to index every
+distinct equation script, each distinct script is converted once, and
+the results are written back into every document. Scripts are keyed in
+canonical form, so that the spellings of an equation with other spacing
+are converted once too.
+
+    python -m hml_equation_parser.dedup --out converted docs/*.hml bundle.zip
+'''
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Set, Tuple
+from xml.etree.ElementTree import ElementTree
+import argparse
+import json
+import os
+import time
+
+from .hmlParser import parseHml, config
+from .hulkEqParser import (hmlEquation2latex, canonicalEquation,
+                           escapeVerbatim)
+from .archive import parseArchive
+from .diagnostics import Diagnostics, EquationParseError
+from .budget import EquationBudget
+from .serializer import writeXml
+
+Occurrence = NamedTuple("Occurrence", [("document", str),
+                                       ("stream", str),
+                                       ("paragraph", int),
+                                       ("position", int)])
+
+streams = ["question", "solution"]
+
+
+def equationKey(script: str, canonical: bool = True) -> str:
+    '''
+    Key of an equation script in the index: its canonicalEquation form if
+    canonical, the script as written otherwise. The scripts are kept by
+    the index anyway, so a hash of them would save no memory.
+    '''
+    if canonical:
+        return canonicalEquation(script)
+    return script
+
+
+def outputName(document: str) -> str:
+    '''
+    Relative path of the outputs of a document, mirroring the path of the
+    document (or of its archive and member), so that documents of other
+    directories never share it. Leading ".." components become "__", and
+    the root of an absolute path is dropped.
+    '''
+    path = os.path.normpath(document.replace("/", os.sep))
+    parts = os.path.splitdrive(path)[1].split(os.sep)
+    parts = ["__" if part == ".." else part for part in parts
+             if part not in ("", ".")]
+    return os.path.join(*parts)
+
+
+def iterDocuments(sources: Iterable[str], diagnostics: Diagnostics = None
+                  ) -> Iterator[Tuple[str, Tuple[ElementTree, ElementTree]]]:
+    '''
+    Parse .hml files, and the .hml members of zip or tar archives, named
+    "archive/member".
+    '''
+    for source in sources:
+        if source.lower().endswith(".hml"):
+            yield source, parseHml(source, diagnostics)
+        else:
+            for member, trees in parseArchive(source, diagnostics):
+                yield source + "/" + member, trees
+
+
+def iterEquations(document: str, trees: Tuple[ElementTree, ElementTree]):
+    '''
+    Every equation node of a document with its occurrence, numbered like
+    convertEquation numbers them.
+    '''
+    for stream, tree in zip(streams, trees):
+        for pIdx, paragraph in enumerate(
+                tree.findall(config["NodeNames"]["paragraph"])):
+            for cIdx, child in enumerate(paragraph):
+                if child.tag == config["NodeNames"]["equation"] and \
+                        child.text is not None:
+                    yield Occurrence(document, stream, pIdx, cIdx), child
+
+
+class EquationIndex:
+    '''
+    Occurrences of every distinct equation of a document set, by
+    equationKey. `rawKeys` holds the scripts as written, to report how
+    many more repeats the canonical keys find.
+    '''
+    def __init__(self, canonical: bool = True) -> None:
+        self.canonical = canonical
+        self.scripts = {}  # type: Dict[str, str]
+        self.occurrences = {}  # type: Dict[str, List[Occurrence]]
+        self.rawKeys = set()  # type: Set[str]
+        self.documents = 0
+        self.equations = 0
+        self.failed = 0
+
+    def add(self, document: str,
+            trees: Tuple[ElementTree, ElementTree]) -> None:
+        '''
+        Index the equations of a parsed document.
+        '''
+        self.documents += 1
+        for occurrence, node in iterEquations(document, trees):
+            key = equationKey(node.text, self.canonical)
+            self.rawKeys.add(equationKey(node.text, False)
+                             if self.canonical else key)
+            if key not in self.scripts:
+                self.scripts[key] = node.text
+                self.occurrences[key] = []
+            self.occurrences[key].append(occurrence)
+            self.equations += 1
+
+    def convert(self, diagnostics: Diagnostics = None,
+                budget: EquationBudget = None) -> Dict[str, str]:
+        '''
+        Convert every distinct equation once. Records are tagged with the
+        first occurrence of the equation. An equation failed by a strict
+        collector is written back verbatim and counted in `failed`, and
+        the others are still converted.
+
+        Returns
+        ----------------------
+        out : Dict[str, str]
+            Latex string of every key.
+        '''
+        results = {}  # type: Dict[str, str]
+        for key, script in self.scripts.items():
+            try:
+                results[key] = hmlEquation2latex(
+                    script, diagnostics, self.occurrences[key][0], budget)
+            except EquationParseError:
+                # the record is already in diagnostics
+                self.failed += 1
+                results[key] = escapeVerbatim(script)
+        return results
+
+    def report(self) -> dict:
+        '''
+        Counts of the index. A hit rate is the share of equations which
+        repeat an equation met before, with raw or with canonical keys.
+        '''
+        unique = len(self.scripts)
+        equations = self.equations
+        return {"documents": self.documents,
+                "equations": equations,
+                "unique": unique,
+                "failed": self.failed,
+                "uniqueRaw": len(self.rawKeys),
+                "dedupRatio": equations / unique if unique else 1.0,
+                "rawHitRate": 1 - len(self.rawKeys) / equations
+                if equations else 0.0,
+                "hitRate": 1 - unique / equations if equations else 0.0}
+
+
+def applyConversions(document: str, trees: Tuple[ElementTree, ElementTree],
+                     results: Dict[str, str], canonical: bool = True) -> None:
+    '''
+    Write converted equations back into the trees of a document, keyed
+    as the index was.
+    '''
+    for _, node in iterEquations(document, trees):
+        node.text = results[equationKey(node.text, canonical)]
+
+
+def convertDocuments(sources: List[str], outDir: str,
+                     diagnostics: Diagnostics = None,
+                     budget: EquationBudget = None) -> dict:
+    '''
+    Convert all documents of sources, each distinct equation once, and
+    write the trees of every document to outDir as "<name>.xml" and
+    "<name>.solution.xml", name being the outputName of the document.
+
+    The documents are parsed twice, once to index their equations and
+    once to write them back, so they are never all kept in memory.
+    With a budget, scripts are keyed as written, as an equation over its
+    budget is written back verbatim.
+
+    Returns
+    ----------------------
+    out : dict
+        Number of documents, equations, distinct and failed equations, the
+        deduplication ratio, the hit rates with raw and canonical keys and
+        the time spent in each step.
+    '''
+    start = time.perf_counter()
+    index = EquationIndex(canonical=budget is None)
+    for document, trees in iterDocuments(sources, diagnostics):
+        index.add(document, trees)
+    indexed = time.perf_counter()
+    results = index.convert(diagnostics, budget)
+    converted = time.perf_counter()
+
+    for document, trees in iterDocuments(sources, Diagnostics()):
+        applyConversions(document, trees, results, index.canonical)
+        fileName = os.path.join(outDir, outputName(document))
+        os.makedirs(os.path.dirname(fileName), exist_ok=True)
+        doc, sol = trees
+        writeXml(doc, fileName + ".xml", "utf-8")
+        writeXml(sol, fileName + ".solution.xml", "utf-8")
+
+    report = index.report()
+    report.update({"indexSeconds": indexed - start,
+                   "convertSeconds": converted - indexed,
+                   "writeSeconds": time.perf_counter() - converted})
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Convert a document set, each distinct equation once.")
+    parser.add_argument("sources", nargs="+",
+                        help=".hml documents or zip/tar archives of them")
+    parser.add_argument("--out", required=True,
+                        help="directory for the converted documents")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    diagnostics = Diagnostics()
+    report = convertDocuments(args.sources, args.out, diagnostics)
+    report["diagnostics"] = dict(diagnostics.counters)
+    print(json.dumps(report))
@@ -0,0 +1,100 @@
+from typing import Callable, List, NamedTuple
+from collections import Counter
+import threading
+
+DiagnosticRecord = NamedTuple("DiagnosticRecord", [("equationId", object),
+                                                   ("stage", str),
+                                                   ("tokenIndex", int),
+                                                   ("reason", str)])
+
+
+class EquationParseError(Exception):
+    '''
+    Raised by a strict Diagnostics collector.
+    The offending record is kept in `record`.
+    '''
+    def __init__(self, record: DiagnosticRecord) -> None:
+        super().__init__("{} (equation: {}, stage: {}, token: {})".format(
+            record.reason, record.equationId, record.stage,
+            record.tokenIndex))
+        self.record = record
+
+
+class Diagnostics:
+    '''
+    Collect structured records of problems met while parsing documents and
+    converting equations, instead of printing them.
+
+    One collector can be shared by a whole batch; `counters` aggregates the
+    number of records per stage. `passesRun` and `passesSkipped` count, per
+    regularizer, the equations (and matrix cells converted alone) it ran
+    on and those it was skipped for, as scheduled by regularizeTokens.
+
+    Parameters
+    ----------------------
+    strict : bool
+        If True, every record raises EquationParseError.
+        Otherwise (lenient) conversion goes on with the best partial result.
+    callback : Callable[[DiagnosticRecord], None], optional
+        Called with every record as soon as it is reported.
+    '''
+    def __init__(self, strict: bool = False,
+                 callback: Callable[[DiagnosticRecord], None] = None) -> None:
+        self.strict = strict
+        self.callback = callback
+        self.records = []  # type: List[DiagnosticRecord]
+        self.counters = Counter()  # type: Counter
+        self.passesRun = Counter()  # type: Counter
+        self.passesSkipped = Counter()  # type: Counter
+        self._lock = threading.Lock()
+
+    def report(self, stage: str, reason: str, tokenIndex: int = None,
+               equationId: object = None) -> DiagnosticRecord:
+        '''
+        Record a problem, raising EquationParseError in strict mode.
+        '''
+        record = DiagnosticRecord(equationId, stage, tokenIndex, reason)
+        with self._lock:
+            self.records.append(record)
+            self.counters[stage] += 1
+        if self.callback is not None:
+            self.callback(record)
+        if self.strict:
+            raise EquationParseError(record)
+        return record
+
+    def schedule(self, stage: str, skipped: bool, count: int = 1) -> None:
+        '''
+        Count a regularizer run on, or skipped for, an equation.
+        '''
+        with self._lock:
+            if skipped:
+                self.passesSkipped[stage] += count
+            else:
+                self.passesRun[stage] += count
+
+    def bind(self, equationId: object) -> 'EquationDiagnostics':
+        '''
+        Make a reporter which tags every record with `equationId`.
+        '''
+        return EquationDiagnostics(self, equationId)
+
+
+class EquationDiagnostics:
+    '''
+    Reporter bound to a single equation, handed to the regularizers.
+    `lengthExceeded` is set once the token list of the equation has been
+    reported over the length limit, so later passes do not report it again.
+    '''
+    def __init__(self, diagnostics: Diagnostics, equationId: object) -> None:
+        self.diagnostics = diagnostics
+        self.equationId = equationId
+        self.lengthExceeded = False
+
+    def report(self, stage: str, reason: str,
+               tokenIndex: int = None) -> DiagnosticRecord:
+        return self.diagnostics.report(stage, reason, tokenIndex,
+                                       self.equationId)
+
+    def schedule(self, stage: str, skipped: bool, count: int = 1) -> None:
+        self.diagnostics.schedule(stage, skipped, count)
@@ -0,0 +1,272 @@
+'''
+Equation scripts of .hml documents, without parsing the documents.
+
+Most of the bytes of a document are styles, text and embedded binary data
+(images are stored base64 encoded in its TAIL), which parseHml parses only
+for them to be dropped. When only the equations are needed, the document
+is instead scanned for the few tags the paragraph streams read (BODY,
+SECTION, P, TEXT, CHAR, EQUATION, SCRIPT, ENDNOTE, PARALIST): everything
+between them is skipped by the regular expression engine, without making
+elements or strings of it.
+
+The scan does not check that a document is well-formed. Documents the scan
+can not read as expat would (comments, CDATA sections or processing
+instructions in the body, encodings that are not ASCII compatible such as
+UTF-16) are parsed with parseHml instead.
+
+    python -m hml_equation_parser.equationScan docs/*.hml
+'''
+from typing import BinaryIO, Iterator, List, Tuple, Union
+import argparse
+import html
+import json
+import mmap
+import re
+import time
+
+from .hmlParser import (_parseXml, iterQuestionParagraphs,
+                        iterSolutionParagraphs, parseHml, config)
+from .diagnostics import Diagnostics
+
+Location = Tuple[str, int, int]
+
+_tags = br'(?:BODY|SECTION|PARALIST|ENDNOTE|EQUATION|SCRIPT|TEXT|CHAR|P)'
+# anything up to the next of those tags
+_skip = br'(?:[^<]|<(?!/?' + _tags + br'[\s/>]))*'
+_tagPattern = re.compile(
+    # a CHAR without children, and an EQUATION whose first SCRIPT has no
+    # children, are common enough to be matched whole
+    br'<(?:(CHAR(?:\s[^<>]*)?>[^<]*</CHAR>)'
+    br'|EQUATION(?:\s[^<>]*)?>' + _skip +
+    br'<SCRIPT(?:\s[^<>]*)?>([^<]*)</SCRIPT>' + _skip + br'</EQUATION>'
+    br'|(/?)(' + _tags[3:-1] + br')'
+    br'(?=[\s/>])(?:[^>"\'/]|/(?!>)|"[^"]*"|\'[^\']*\')*(/?)>)')
+_declarationPattern = re.compile(
+    br'(?:\xef\xbb\xbf)?<\?xml[^>]*?encoding=["\']([A-Za-z0-9._-]+)')
+
+
+def _documentBytes(source: Union[str, bytes, memoryview, BinaryIO]
+                   ) -> Union[bytes, mmap.mmap]:
+    '''
+    The whole document, mapped instead of read for a file name.
+    '''
+    if isinstance(source, (bytes, bytearray, mmap.mmap)):
+        return source
+    if isinstance(source, memoryview):
+        return source.tobytes()
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            try:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty file
+                return b''
+    return source.read()
+
+
+def _scanEncoding(data: Union[bytes, mmap.mmap]) -> str:
+    '''
+    Encoding of a document the scan can read, None if it must be parsed.
+    '''
+    if data[:2] in (b'\xff\xfe', b'\xfe\xff'):
+        return None
+    match = _declarationPattern.match(data)
+    encoding = "utf-8" if match is None else match.group(1).decode("ascii")
+    try:
+        if "<P>&".encode(encoding) != b"<P>&":
+            return None
+    except LookupError:
+        return None
+    prolog = 3 if data[:3] == b'\xef\xbb\xbf' else 0
+    if data[prolog:prolog+5] == b"<?xml":
+        prolog = data.find(b"?>") + 2
+    if data.find(b"<!", prolog) >= 0 or data.find(b"<?", prolog) >= 0:
+        return None
+    return encoding
+
+
+def _scriptText(raw: bytes, encoding: str) -> str:
+    text = raw.decode(encoding)
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    if "&" in text:
+        text = html.unescape(text)
+    return text
+
+
+def _scan(data: Union[bytes, mmap.mmap], encoding: str
+          ) -> Iterator[Tuple[Location, str]]:
+    stack = []  # type: List[bytes]
+    # one frame per open P: [stream, TEXT state (0 not seen, 1 open,
+    # 2 closed), children, position of the open EQUATION, equations]
+    frames = []  # type: List[list]
+    counts = {"question": 0, "solution": 0}
+    # BODY elements at the top, and SECTION elements in the first of them
+    bodies = 0
+    sections = 0
+    for match in _tagPattern.finditer(data):
+        kind = match.lastindex
+        if kind < 3:
+            frame = frames[-1] if frames else None
+            if frame is not None and frame[1] == 1 and \
+                    stack[-2:] == [b"P", b"TEXT"]:
+                if kind == 2 and match.group(2):
+                    frame[4].append((frame[2], _scriptText(match.group(2),
+                                                           encoding)))
+                frame[2] = frame[2] + 1
+            continue
+        closing, tag, empty = match.group(3, 4, 5)
+        if not closing:
+            parent = stack[-1] if stack else None
+            frame = frames[-1] if frames else None
+            if tag == b"P":
+                stream = None
+                # like parseHml, only the first SECTION of the first
+                # BODY is read
+                if stack == [b"BODY", b"SECTION"] and bodies == 1 and \
+                        sections == 1:
+                    stream = "question"
+                elif parent == b"PARALIST" and frame is not None and \
+                        frame[1] == 1 and stack[-3:-1] == [b"TEXT",
+                                                           b"ENDNOTE"]:
+                    stream = "solution"
+                frame = None if stream is None else [stream, 0, 0, None, []]
+                frames.append(frame)
+            elif tag == b"BODY":
+                if not stack:
+                    bodies = bodies + 1
+            elif tag == b"SECTION":
+                if stack == [b"BODY"] and bodies == 1:
+                    sections = sections + 1
+            elif frame is None:
+                pass
+            elif tag == b"TEXT":
+                if parent == b"P" and frame[1] == 0:
+                    frame[1] = 1
+            elif parent == b"TEXT" and frame[1] == 1 and stack[-2] == b"P":
+                if tag == b"EQUATION":
+                    frame[3] = frame[2]
+                    frame[2] = frame[2] + 1
+                elif tag == b"CHAR":
+                    frame[2] = frame[2] + 1
+            elif tag == b"SCRIPT" and parent == b"EQUATION" and \
+                    frame[3] is not None and stack[-2] == b"TEXT":
+                # the script is the text of SCRIPT up to its first child
+                if not empty:
+                    start = match.end()
+                    raw = data[start:data.find(b"<", start)]
+                    if raw:
+                        frame[4].append((frame[3],
+                                         _scriptText(raw, encoding)))
+                # only the first SCRIPT of an equation is read
+                frame[3] = None
+            if empty:
+                if tag == b"P":
+                    frames.pop()
+                continue
+            stack.append(tag)
+            continue
+
+        stack.pop()
+        if tag == b"P":
+            frame = frames.pop()
+            if frame is not None and frame[1] != 0:
+                stream = frame[0]
+                pIdx = counts[stream]
+                counts[stream] = pIdx + 1
+                for cIdx, script in frame[4]:
+                    yield (stream, pIdx, cIdx), script
+        elif frames and frames[-1] is not None:
+            frame = frames[-1]
+            if tag == b"TEXT" and frame[1] == 1 and stack[-1] == b"P":
+                frame[1] = 2
+            elif tag == b"EQUATION":
+                frame[3] = None
+
+
+def _parsedScripts(source: Union[str, bytes, memoryview, BinaryIO]
+                   ) -> Iterator[Tuple[Location, str]]:
+    hwpml = _parseXml(source)
+    for stream, paragraphs in (
+            ("question", iterQuestionParagraphs(hwpml, Diagnostics())),
+            ("solution", iterSolutionParagraphs(hwpml, Diagnostics()))):
+        for pIdx, paragraph in enumerate(paragraphs):
+            for cIdx, child in enumerate(paragraph):
+                if child.tag == config["NodeNames"]["equation"] and \
+                        child.text:
+                    yield (stream, pIdx, cIdx), child.text
+
+
+def iterEquationScripts(source: Union[str, bytes, memoryview, BinaryIO]
+                        ) -> Iterator[Tuple[Location, str]]:
+    '''
+    Equation scripts of a .hml document, without parsing it.
+
+    Parameters
+    ----------------------
+    source : str, bytes, memoryview, mmap or file-like object
+        Document, as for parseHml. A file is mapped, not read.
+    Returns
+    ----------------------
+    out : Iterator[((str, int, int), str)]
+        ((stream, paragraph index, child index), script) of every
+        equation with a script, numbered like convertEquation numbers the
+        trees of parseHml, stream being "question" or "solution". Each
+        stream is in document order, a paragraph coming when it ends.
+    '''
+    data = _documentBytes(source)
+    encoding = _scanEncoding(data)
+    if encoding is None:
+        return _parsedScripts(data)
+    return _scan(data, encoding)
+
+
+def benchmark(fileNames: List[str], repeat: int = 3) -> dict:
+    '''
+    Throughput of the scan and of parseHml over the same documents, read
+    in memory first, best of repeat runs.
+    '''
+    documents = []  # type: List[bytes]
+    for fileName in fileNames:
+        with open(fileName, "rb") as f:
+            documents.append(f.read())
+    megabytes = sum(len(document) for document in documents) / 1e6
+
+    def best(function) -> float:
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for document in documents:
+                function(document)
+            seconds.append(time.perf_counter() - start)
+        return min(seconds)
+
+    scanSeconds = best(lambda document: list(iterEquationScripts(document)))
+    parseSeconds = best(lambda document: parseHml(document, Diagnostics()))
+    equations = sum(1 for document in documents
+                    for _ in iterEquationScripts(document))
+    return {"documents": len(documents),
+            "megabytes": megabytes,
+            "equations": equations,
+            "scanMBps": megabytes / scanSeconds if scanSeconds else None,
+            "parseMBps": megabytes / parseSeconds if parseSeconds else None}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Print the equation scripts of .hml documents as "
+                    "JSON lines, or compare the scan with parseHml.")
+    parser.add_argument("documents", nargs="+")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="report MB/s of the scan and of parseHml")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        print(json.dumps(benchmark(args.documents)))
+    else:
+        for document in args.documents:
+            for (stream, pIdx, cIdx), script in \
+                    iterEquationScripts(document):
+                print(json.dumps({"document": document, "stream": stream,
+                                  "paragraph": pIdx, "position": cIdx,
+                                  "equation": script},
+                                 ensure_ascii=False))
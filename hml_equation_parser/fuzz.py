@@ -0,0 +1,223 @@
+'''
+Fuzzing harness for hml equation conversion.
+
+Generates adversarial hml equation strings (unbalanced braces, deep
+nesting, glued keywords, mixed scripts) and checks that every conversion
+terminates within a time bound that grows linearly with the input size.
+Each conversion runs in a worker process, so hanging inputs are killed
+and saved as regression cases, which are replayed first on the next run.
+Everything runs offline with a seeded random generator.
+
+    python -m hml_equation_parser.fuzz --count 2000 --seed 1
+'''
+from typing import Dict, Iterator, List, Tuple
+from multiprocessing import Pipe, Process
+import argparse
+import codecs
+import json
+import os
+import random
+import time
+
+from .convertPlan import loadPlan
+
+structuralTokens = ["{", "}", "(", ")", "[", "]", "&", "#", "^", "_", "`",
+                    "~", "over", "OVER", "sqrt", "root", "of", "LEFT",
+                    "RIGHT", "left(", "right)", "lim", "lim_", "->", "sum",
+                    "int", "prod", "matrix", "pmatrix", "cases", "eqalign",
+                    "rm", "bold", "it", "le", "ge", "＞", "＜"]
+plainTokens = ["x", "y", "a", "b", "1", "2", "n", "k=1", "+", "-", "=",
+               "점", "그러므로", "이다", "AB"]
+vocabulary = structuralTokens + plainTokens + sorted(loadPlan().tokenMap)
+
+
+def generateEquation(rng: random.Random, size: int) -> str:
+    '''
+    Make a random hml equation string of about `size` tokens.
+    '''
+    strategy = rng.randrange(4)
+    tokens = []  # type: List[str]
+    if strategy == 0:
+        # plain random tokens, with separators left out now and then
+        for _ in range(size):
+            tokens.append(rng.choice(vocabulary))
+            if rng.random() < 0.7:
+                tokens.append(" ")
+    elif strategy == 1:
+        # deeply nested groups around a structural keyword
+        depth = max(1, size // 3)
+        keyword = rng.choice(structuralTokens)
+        tokens = ["{ ", keyword, " "] * depth + ["x"] + [" }"] * \
+            rng.randint(0, depth)
+    elif strategy == 2:
+        # glued keywords without any whitespace
+        tokens = [rng.choice(vocabulary) for _ in range(size)]
+    else:
+        # one structure repeated, with a random token dropped
+        unit = [rng.choice(vocabulary) + " " for _ in range(rng.randint(2, 6))]
+        tokens = unit * max(1, size // len(unit))
+        if len(tokens) > 1:
+            del tokens[rng.randrange(len(tokens))]
+    return "".join(tokens)
+
+
+# characters of the equations trivialLatex converts, and a few more
+trivialAlphabet = "abcxyzABXY0123456789 `~+-=<>!,.:;/|*'?()"
+
+
+def generateTrivialEquation(rng: random.Random, size: int) -> str:
+    '''
+    Make a random string of `size` characters of trivialAlphabet, which
+    trivialLatex may or may not accept.
+    '''
+    return "".join(rng.choice(trivialAlphabet) for _ in range(size))
+
+
+def timeBound(equation: str, baseSeconds: float,
+              perCharSeconds: float) -> float:
+    '''
+    Allowed conversion time, linear in the input size.
+    '''
+    return baseSeconds + perCharSeconds * len(equation)
+
+
+def _worker(connection) -> None:
+    from .hulkEqParser import hmlEquation2latex
+    from .diagnostics import Diagnostics
+
+    while True:
+        equation = connection.recv()
+        if equation is None:
+            break
+        start = time.perf_counter()
+        try:
+            hmlEquation2latex(equation, Diagnostics())
+            error = None
+        except Exception as e:
+            error = "{}: {}".format(type(e).__name__, e)
+        connection.send((time.perf_counter() - start, error))
+
+
+class FuzzRunner:
+    '''
+    Runs conversions in a worker process, restarting it after a timeout.
+    '''
+    def __init__(self, baseSeconds: float, perCharSeconds: float) -> None:
+        self.baseSeconds = baseSeconds
+        self.perCharSeconds = perCharSeconds
+        self.process = None
+        self.connection = None
+
+    def _start(self) -> None:
+        self.connection, childConnection = Pipe()
+        self.process = Process(target=_worker, args=(childConnection,),
+                               daemon=True)
+        self.process.start()
+
+    def close(self) -> None:
+        if self.process is not None:
+            self.connection.send(None)
+            self.process.join(1)
+            if self.process.is_alive():
+                self.process.kill()
+            self.process = None
+
+    def run(self, equation: str) -> Tuple[str, float, str]:
+        '''
+        Convert `equation`, returning (status, seconds, error).
+        status is "ok", "exception" or "timeout".
+        '''
+        if self.process is None:
+            self._start()
+        bound = timeBound(equation, self.baseSeconds, self.perCharSeconds)
+        self.connection.send(equation)
+        if not self.connection.poll(bound):
+            self.process.kill()
+            self.process.join()
+            self.process = None
+            return ("timeout", bound, None)
+        seconds, error = self.connection.recv()
+        if seconds > bound:
+            return ("timeout", seconds, error)
+        if error is not None:
+            return ("exception", seconds, error)
+        return ("ok", seconds, None)
+
+
+def loadRegressions(path: str) -> List[Dict[str, object]]:
+    if not os.path.exists(path):
+        return []
+    with codecs.open(path, "r", "utf8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def saveRegression(path: str, case: Dict[str, object]) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with codecs.open(path, "a", "utf8") as f:
+        f.write(json.dumps(case, ensure_ascii=False) + "\n")
+
+
+def fuzz(count: int, seed: int, maxSize: int, regressionPath: str,
+         baseSeconds: float = 1.0, perCharSeconds: float = 0.002,
+         saveExceptions: bool = False) -> Dict[str, int]:
+    '''
+    Replay saved regression cases, then convert `count` generated equations.
+    New failures are appended to `regressionPath` as json lines.
+
+    Returns
+    ----------------------
+    out : Dict[str, int]
+        Number of conversions per status.
+    '''
+    rng = random.Random(seed)
+    runner = FuzzRunner(baseSeconds, perCharSeconds)
+    stats = {"ok": 0, "exception": 0, "timeout": 0}
+    known = set()
+
+    def equations() -> Iterator[Tuple[str, bool]]:
+        for case in loadRegressions(regressionPath):
+            known.add(case["equation"])
+            yield case["equation"], True
+        for _ in range(count):
+            yield generateEquation(rng, rng.randint(1, maxSize)), False
+
+    try:
+        for equation, isRegression in equations():
+            status, seconds, error = runner.run(equation)
+            stats[status] += 1
+            failed = status == "timeout" or \
+                (saveExceptions and status == "exception")
+            if failed and not isRegression and equation not in known:
+                known.add(equation)
+                saveRegression(regressionPath, {
+                    "equation": equation, "status": status,
+                    "seconds": seconds, "error": error, "seed": seed})
+            if failed:
+                print("{}{} ({:.3f}s): {!r}".format(
+                    "regression " if isRegression else "", status, seconds,
+                    equation[:200]))
+    finally:
+        runner.close()
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Fuzz hml equation conversion for hangs.")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-size", type=int, default=200)
+    parser.add_argument("--regressions", default="fuzz_regressions.jsonl")
+    parser.add_argument("--base-seconds", type=float, default=1.0)
+    parser.add_argument("--per-char-seconds", type=float, default=0.002)
+    parser.add_argument("--save-exceptions", action="store_true")
+    args = parser.parse_args()
+
+    stats = fuzz(args.count, args.seed, args.max_size, args.regressions,
+                 args.base_seconds, args.per_char_seconds,
+                 args.save_exceptions)
+    print(json.dumps(stats))
+    if stats["timeout"]:
+        raise SystemExit(1)
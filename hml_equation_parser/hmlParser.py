@@ -1,7 +1,12 @@
-from typing import Tuple, Union
+from typing import BinaryIO, Callable, Iterator, List, Tuple, Union
 import os
-from xml.etree.ElementTree import fromstring, Element, ElementTree
+import re
+import mmap
+from xml.etree.ElementTree import XMLParser, Element, ElementTree
 from .hulkEqParser import hmlEquation2latex
+from .diagnostics import Diagnostics
+from .budget import EquationBudget
+from .serializer import xmlString, writeXml
 import json
 import codecs
 
@@ -9,89 +14,244 @@ with codecs.open(os.path.join(os.path.dirname(__file__), "config.json"),
                  "r", "utf8") as f:
     config = json.load(f)
 
+chunkSize = 1 << 20
 
-def parseHml(fileName: str) -> Tuple[ElementTree, ElementTree]:
+
+def _iterChunks(source: Union[str, bytes, memoryview, BinaryIO]
+                ) -> Iterator[Union[bytes, memoryview]]:
+    '''
+    Raw bytes of a document in chunks of chunkSize. Buffers are sliced
+    without copying.
+    '''
+    if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        with memoryview(source) as view:
+            for start in range(0, len(view), chunkSize):
+                yield view[start:start+chunkSize]
+        return
+
+    f = open(source, 'rb') if isinstance(source, str) else source
+    try:
+        while True:
+            chunk = f.read(chunkSize)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        if f is not source:
+            f.close()
+
+
+def _parseXml(source: Union[str, bytes, memoryview, BinaryIO]) -> Element:
+    '''
+    Feed the raw bytes of a document to the XML parser in chunks.
+    The parser decodes them with the encoding declared by the document
+    (UTF-8 if none), so they are never decoded to a str first.
+    expat only decodes UTF-8, UTF-16 and single-byte encodings. A document
+    declaring another one (EUC-KR, ...) is decoded by python instead.
+    '''
+    parser = XMLParser()
+    chunks = _iterChunks(source)
+    first = next(chunks, b'')
+    try:
+        parser.feed(first)
+    except ValueError:
+        data = b''.join([bytes(first)] + [bytes(chunk) for chunk in chunks])
+        match = re.match(br'<\?xml[^>]*encoding=["\']([A-Za-z0-9._-]+)', data)
+        if match is None:
+            raise
+        parser = XMLParser(encoding="utf-8")
+        parser.feed(data.decode(match.group(1).decode("ascii"))
+                    .encode("utf-8"))
+        return parser.close()
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
+
+
+def _unsupportedReporter(diagnostics: Diagnostics,
+                         name: str) -> Callable[[str], None]:
+    def reportUnsupported(reason: str) -> None:
+        if diagnostics is None:
+            print(reason)
+        else:
+            diagnostics.report("parseHml", reason, equationId=name)
+    return reportUnsupported
+
+
+def _paragraphNode(paragraph: Element,
+                   reportUnsupported: Callable[[str], None]) -> Element:
+    '''
+    Make the paragraph node of a paragraph(P) node, None if it has no TEXT.
+    Solutions (ENDNOTE) in it are left to iterSolutionParagraphs.
+    '''
+    text = paragraph.find("TEXT")
+    if text is None:
+        return None
+    paragraphNode = Element(config["NodeNames"]["paragraph"])
+    for child in text:
+        if child.tag == "CHAR":
+            value = child.text or ''
+            for charChild in child:
+                if charChild.tag == 'LINEBREAK':
+                    value += '<br>\n'
+                else:
+                    reportUnsupported("unsupported char tag: {}"
+                                      .format(charChild.tag))
+                value += charChild.tail or ''
+
+            if value is not None:
+                leafNode = Element(config["NodeNames"]["char"])
+                leafNode.text = value
+                paragraphNode.append(leafNode)
+
+        elif child.tag == "EQUATION":
+            script = child.find("SCRIPT")
+            value = script.text
+
+            leafNode = Element(config["NodeNames"]["equation"])
+            leafNode.text = value
+            paragraphNode.append(leafNode)
+
+        elif child.tag == "ENDNOTE":  # 해설 미주
+            pass
+
+        else:
+            reportUnsupported("unsupported tag: {}".format(child.tag))
+    return paragraphNode
+
+
+def _endnoteParagraphs(paragraph: Element) -> List[Element]:
+    '''
+    Paragraphs of the solutions (ENDNOTE) of a paragraph(P) node.
+    '''
+    text = paragraph.find("TEXT")
+    if text is None:
+        return []
+    return [note for endnote in text.iterfind("ENDNOTE")
+            for note in endnote.find("PARALIST").iterfind("P")]
+
+
+def _sourceParagraphs(source: Union[str, bytes, memoryview, BinaryIO,
+                                    Element],
+                      name: str) -> Tuple[Iterator[Element], str]:
+    if name is None:
+        name = source if isinstance(source, str) else \
+            getattr(source, "name", None)
+    hwpml = source if isinstance(source, Element) else _parseXml(source)
+    return hwpml.find("BODY").find("SECTION").iterfind("P"), name
+
+
+def iterQuestionParagraphs(source: Union[str, bytes, memoryview, BinaryIO,
+                                         Element],
+                           diagnostics: Diagnostics = None,
+                           name: str = None) -> Iterator[Element]:
+    '''
+    Paragraph nodes of the question of a .hml document, one at a time.
+
+    source is anything parseHml takes, or the HWPML element of a document
+    parsed already, to iterate both streams of one parse.
+    Solutions are skipped without making their nodes.
+    '''
+    paragraphs, name = _sourceParagraphs(source, name)
+    reportUnsupported = _unsupportedReporter(diagnostics, name)
+    for paragraph in paragraphs:
+        paragraphNode = _paragraphNode(paragraph, reportUnsupported)
+        if paragraphNode is not None:
+            yield paragraphNode
+
+
+def iterSolutionParagraphs(source: Union[str, bytes, memoryview, BinaryIO,
+                                         Element],
+                           diagnostics: Diagnostics = None,
+                           name: str = None) -> Iterator[Element]:
+    '''
+    Paragraph nodes of the solution (ENDNOTE) of a .hml document, one at
+    a time, see iterQuestionParagraphs. Question paragraphs are only
+    searched for solutions.
+
+    A solution inside a solution paragraph comes before that paragraph.
+    '''
+    paragraphs, name = _sourceParagraphs(source, name)
+    reportUnsupported = _unsupportedReporter(diagnostics, name)
+    for paragraph in paragraphs:
+        # (solution paragraph, its solutions left) from the outermost
+        stack = [(None, iter(_endnoteParagraphs(paragraph)))]
+        while stack:
+            owner, notes = stack[-1]
+            note = next(notes, None)
+            if note is not None:
+                stack.append((note, iter(_endnoteParagraphs(note))))
+                continue
+            stack.pop()
+            if owner is not None:
+                paragraphNode = _paragraphNode(owner, reportUnsupported)
+                if paragraphNode is not None:
+                    yield paragraphNode
+
+
+def parseHml(source: Union[str, bytes, memoryview, BinaryIO],
+             diagnostics: Diagnostics = None,
+             name: str = None) -> Tuple[ElementTree, ElementTree]:
     '''
     Parse .hml document and make ElementTrees for question and solution.
 
     Parameters
     ----------------------
-    fileName : str
-        fileName to be parsed.
+    source : str, bytes, memoryview, mmap or file-like object
+        fileName to be parsed, the document itself, or a binary file
+        object to read it from (an archive member, a socket, ...).
+        The encoding declared by the document is honored.
+    diagnostics : Diagnostics, optional
+        Collector for unsupported tags, recorded with name as
+        equationId. If not given, they are printed.
+    name : str, optional
+        Name of the document in diagnostics. Defaults to fileName, or to
+        the name of the file object.
     Returns
     ----------------------
     out : (ElementTree, ElementTree)
         Tuple of parsed ElementTree objects for question and solution,
         respectively.
     '''
-    with codecs.open(fileName, 'r', 'utf8') as f:
-        xmlText = f.read()
-
-    hwpml = fromstring(xmlText)
-    body = hwpml.find("BODY")
-    section = body.find("SECTION")
+    if name is None:
+        name = source if isinstance(source, str) else \
+            getattr(source, "name", None)
+    hwpml = _parseXml(source)
 
     docRoot = Element(config["NodeNames"]["root"])
+    docRoot.extend(iterQuestionParagraphs(hwpml, diagnostics, name))
     solRoot = Element(config["NodeNames"]["root"])
+    solRoot.extend(iterSolutionParagraphs(hwpml, diagnostics, name))
 
-    def parseParagraphNode(root: Element, paragraph: Element) -> None:
-        '''
-        Parse and make ElementTree of paragraph(P) node.
-        '''
-        paragraphNode = Element(config["NodeNames"]["paragraph"])
-
-        text = paragraph.find("TEXT")
-        if text is not None:
-            for child in text:
-                if child.tag == "CHAR":
-                    value = child.text or ''
-                    for charChild in child:
-                        if charChild.tag == 'LINEBREAK':
-                            value += '<br>\n'
-                        else:
-                            print("unsupported char tag: {}"
-                                  .format(charChild.tag))
-                        value += charChild.tail or ''
-
-                    if value is not None:
-                        leafNode = Element(config["NodeNames"]["char"])
-                        leafNode.text = value
-                        paragraphNode.append(leafNode)
-
-                elif child.tag == "EQUATION":
-                    script = child.find("SCRIPT")
-                    value = script.text
-
-                    leafNode = Element(config["NodeNames"]["equation"])
-                    leafNode.text = value
-                    paragraphNode.append(leafNode)
-
-                elif child.tag == "ENDNOTE":  # 해설 미주
-                    paralist = child.find("PARALIST")
-                    paragraphs = paralist.findall("P")
-
-                    for paragraph in paragraphs:
-                        parseParagraphNode(solRoot, paragraph)
-
-                else:
-                    print("unsupported tag: {}".format(child.tag))
-
-            root.append(paragraphNode)
+    return ElementTree(docRoot), ElementTree(solRoot)
 
-    for paragraph in section.findall("P"):
-        parseParagraphNode(docRoot, paragraph)
 
-    return ElementTree(docRoot), ElementTree(solRoot)
+def convertParagraph(paragraph: Element, diagnostics: Diagnostics = None,
+                     budget: EquationBudget = None,
+                     pIdx: int = None) -> Element:
+    '''
+    Convert the equations of a paragraph node, as made by parseHml or the
+    paragraph streams. With diagnostics, each equation is identified by
+    (pIdx, child index).
+    '''
+    for cIdx, child in enumerate(paragraph):
+        if child.tag == config["NodeNames"]["equation"]:
+            child.text = hmlEquation2latex(child.text, diagnostics,
+                                           (pIdx, cIdx), budget)
+    return paragraph
 
 
-def convertEquation(doc: ElementTree) -> str:
+def convertEquation(doc: ElementTree, diagnostics: Diagnostics = None,
+                    budget: EquationBudget = None) -> str:
     '''
     Convert equation with sample ElementTree.
+    With diagnostics, each equation is identified by its
+    (paragraph index, child index) in the tree.
+    The budget, if any, applies to each equation separately.
     '''
-    for paragraph in doc.findall(config["NodeNames"]["paragraph"]):
-        for child in paragraph:
-            if child.tag == config["NodeNames"]["equation"]:
-                child.text = hmlEquation2latex(child.text)
+    for pIdx, paragraph in enumerate(
+            doc.findall(config["NodeNames"]["paragraph"])):
+        convertParagraph(paragraph, diagnostics, budget, pIdx)
     return doc
 
 
@@ -117,13 +277,45 @@ def extract2HtmlStr(doc: ElementTree) -> str:
         config["htmlFooter"]
 
 
+def convertDocument(source: Union[str, bytes, memoryview, BinaryIO],
+                    diagnostics: Diagnostics = None,
+                    budget: EquationBudget = None, name: str = None) -> dict:
+    '''
+    Parse a .hml document, as parseHml does, and convert its equations.
+
+    Returns
+    ----------------------
+    out : dict
+        "xml" and "html" of the question, the same as the hmlParser
+        command writes, and "solutionXml" and "solutionHtml".
+    '''
+    doc, sol = parseHml(source, diagnostics, name)
+    outputs = {}
+    for (xmlKey, htmlKey), tree in [(("xml", "html"), doc),
+                                    (("solutionXml", "solutionHtml"), sol)]:
+        convertEquation(tree, diagnostics, budget)
+        outputs[xmlKey] = xmlString(tree)
+        outputs[htmlKey] = extract2HtmlStr(tree)
+    return outputs
+
+
+def writeDocument(outputs: dict, dst: str) -> None:
+    '''
+    Write the outputs of convertDocument to dst.xml and dst.html.
+    '''
+    with codecs.open(dst + ".xml", "w", "ascii") as f:
+        f.write(outputs["xml"])
+    with codecs.open(dst + ".html", "w", "utf8") as f:
+        f.write(outputs["html"])
+
+
 if __name__ == '__main__':
     import sys
     script, hmlDoc, dst = sys.argv
 
-    doc = parseHml(hmlDoc)
+    doc, _ = parseHml(hmlDoc)
     doc = convertEquation(doc)
-    doc.write(dst + '.xml')
+    writeXml(doc, dst + '.xml')
 
     with codecs.open(dst + ".html", "w", "utf8") as f:
         f.write(extract2HtmlStr(doc))
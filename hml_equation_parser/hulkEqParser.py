@@ -1,21 +1,102 @@
-from typing import List
+from typing import List, Tuple
+from collections import Counter
+from concurrent.futures import Executor
+import argparse
 import json
-import codecs
-import os
-from .hulkReplaceMethod import (replaceAllMatrix, replaceAllBar, replaceRootOf,
-                                replaceFrac, replaceAllBrace)
+import random
+import re
+import time
+from .hulkReplaceMethod import renderStructures, replaceRootOf, replaceFrac
 from .EqRegularizer import (sqrtRegularizer, barRegularizer, fracRegularizer,
                             limRegularizer,  sumRegularizer, matchCurlyBraces,
                             inEqualityRegularizer, bracketRegularizer,
                             expRegularizer, fontRegularizer, backslashRemover,
-                            textRegularizer, matchBraces)
+                            textRegularizer, matchBraces, listLengthLimit,
+                            bigOperators)
+from .diagnostics import (Diagnostics, EquationDiagnostics,
+                          EquationParseError)
+from .budget import EquationBudget, BudgetMeter, BudgetExceeded
+from .braceIndex import BraceIndex
+from .convertPlan import loadPlan
+from .matrixCells import splitMatrixCells, placeholder
 
-with codecs.open(os.path.join(os.path.dirname(__file__), "convertMap.json"),
-                 "r", "utf8") as f:
-    convertMap = json.load(f)
+plan = loadPlan()
 
 
-def hmlEquation2latex(hmlEqStr: str) -> str:
+_latexTextEscapes = {
+    '\\': r'\textbackslash{}',
+    '{': r'\{',
+    '}': r'\}',
+    '$': r'\$',
+    '&': r'\&',
+    '#': r'\#',
+    '^': r'\^{}',
+    '_': r'\_',
+    '%': r'\%',
+    '~': r'\~{}',
+}
+
+
+def escapeVerbatim(hmlEqStr: str) -> str:
+    '''
+    Render a hml equation string verbatim as latex text,
+    escaping latex special characters.
+    '''
+    escaped = ''.join(_latexTextEscapes.get(char, char) for char in hmlEqStr)
+    return r'\text{' + escaped + '}'
+
+
+# Strings of single letters, digits and operators, without any keyword
+# (all keywords have two letters or more), brace, script, font or accent.
+# limRegularizer splits "->" out of any token.
+_trivialRegex = re.compile(
+    r"(?:[A-Za-z](?![A-Za-z])|-(?!>)|[0-9 `~+=<>!,.:;/|*'?()])*")
+_trivialBrackets = {"(": "\\left (", ")": "\\right )"}
+
+
+def trivialLatex(hmlEqStr: str, meter: BudgetMeter = None) -> str:
+    '''
+    Convert an equation without any structure (`x`, `a+b`, `f(x)=2x`)
+    directly, with the same result as all passes of hmlEquation2latex.
+    Only the bracket rewrite and the token spacing apply to such an
+    equation, so one scan decides it and the regularizers are skipped.
+
+    Returns
+    ----------------------
+    out : str
+        A converted latex string, None if the equation has structure and
+        needs all passes.
+    '''
+    if _trivialRegex.fullmatch(hmlEqStr) is None:
+        return None
+    strList = hmlEqStr.replace('`', ' ').replace('~', ' ') \
+        .replace('(', ' ( ').replace(')', ' ) ').split()
+    # a few operators ("->", "!=", ...) are convertMap keys of their own,
+    # and long lists are reported by the regularizers
+    if len(strList) > listLengthLimit or \
+            not plan.tokenMap.keys().isdisjoint(strList):
+        return None
+    # unmatched brackets are completed by bracketRegularizer
+    depth = 0
+    for string in strList:
+        if string == "(":
+            depth = depth + 1
+        elif string == ")":
+            depth = depth - 1
+            if depth < 0:
+                return None
+    if depth != 0:
+        return None
+    if meter is not None:
+        meter.step("tokenize", len(strList))
+    return ' '.join([_trivialBrackets.get(string, string)
+                     for string in strList])
+
+
+def hmlEquation2latex(hmlEqStr: str, diagnostics: Diagnostics = None,
+                      equationId: object = None,
+                      budget: EquationBudget = None,
+                      executor: Executor = None) -> str:
     '''
     Convert hmlEquation string to latex string.
 
@@ -23,26 +104,161 @@ def hmlEquation2latex(hmlEqStr: str) -> str:
     ----------------------
     hmlEqStr : str
         A hml equation string to be converted.
+    diagnostics : Diagnostics, optional
+        Collector for problems met while converting.
+        If not given, failed regularizers print a message and the result
+        becomes "ERROR".
+        An equation that fails in a pass is rendered verbatim by
+        `escapeVerbatim`, and the pass and token index are reported (or
+        printed without diagnostics). Only a strict collector raises.
+    equationId : object, optional
+        Identifier of the equation attached to diagnostic records.
+    budget : EquationBudget, optional
+        Limits of tokens, rewrite steps and wall time for this equation.
+        If any of them is exceeded, the equation is rendered verbatim by
+        `escapeVerbatim` and the reason is reported.
+    executor : concurrent.futures.Executor, optional
+        Converts the cells of large matrices in parallel, see
+        matrixCellsLatex.
 
     Returns
     ----------------------
     out : str
         A converted latex string.
     '''
-    def replaceBracket(strList: List[str]) -> List[str]:
-        '''
-        "\left {"  -> "\left \{"
-        "\right }" -> "\right \}"
-        '''
-        for i, string in enumerate(strList):
-            if string == r'{':
-                if i > 0 and strList[i-1] == r'\left':
-                    strList[i] = r'\{'
-            if string == r'}':
-                if i > 0 and strList[i-1] == r'\right':
-                    strList[i] = r'\}'
-        return strList
+    reporter = None
+    if diagnostics is not None:
+        reporter = diagnostics.bind(equationId)
+    meter = None
+    if budget is not None:
+        meter = budget.start()
+
+    try:
+        return _convert(hmlEqStr, reporter, meter, executor)
+    except Exception as e:
+        return failedEquation(hmlEqStr, reporter, e)
+
+
+# stages named in the records of equations failed by an exception
+_failureStages = set(["tokenize", "matchCurlyBraces", "matchBraces",
+                      "mapTokens", "renderStructures", "replaceRootOf"])
+
+
+def _failureSite(e: Exception) -> Tuple[str, int]:
+    '''
+    The innermost conversion stage in the traceback of `e`, and the token
+    index it was at if known.
+    '''
+    stage, tokenIndex = "convert", None
+    tb = e.__traceback__
+    while tb is not None:
+        frame = tb.tb_frame
+        if frame.f_code.co_name in _failureStages or \
+                frame.f_code.co_name in passBits:
+            stage = frame.f_code.co_name
+            idx = frame.f_locals.get("idx")
+            tokenIndex = idx if isinstance(idx, int) else None
+        tb = tb.tb_next
+    return stage, tokenIndex
+
+
+def failedEquation(hmlEqStr: str, reporter: EquationDiagnostics,
+                   e: Exception) -> str:
+    '''
+    Report an equation whose conversion raised `e`, and render it verbatim
+    by `escapeVerbatim`. Errors of a strict collector are raised again.
+    '''
+    if isinstance(e, EquationParseError):
+        raise e
+    if isinstance(e, BudgetExceeded):
+        stage, tokenIndex, reason = e.stage, None, e.reason
+    else:
+        stage, tokenIndex = _failureSite(e)
+        reason = "{}: {}".format(type(e).__name__, e)
+    if reporter is None:
+        print("Equation parser error. {} ({})".format(reason, stage))
+    else:
+        reporter.report(stage, reason, tokenIndex)
+    return escapeVerbatim(hmlEqStr)
+
+
+def _convert(hmlEqStr: str, reporter: EquationDiagnostics,
+             meter: BudgetMeter, executor: Executor = None) -> str:
+    '''
+    Run all passes of hmlEquation2latex.
+    '''
+    latex, strList = prepareEquation(hmlEqStr, reporter, meter, executor)
+    if latex is not None:
+        return latex
+    return renderTokens(mapTokens(strList), meter)
+
+
+def prepareEquation(hmlEqStr: str, reporter: EquationDiagnostics,
+                    meter: BudgetMeter,
+                    executor: Executor = None) -> Tuple[str, List[str]]:
+    '''
+    Run the passes of hmlEquation2latex up to the regularized tokens,
+    which are left to be mapped and rendered.
+
+    Returns
+    ----------------------
+    out : Tuple[str, List[str]]
+        The latex string and None if the equation is converted without
+        the regularizers (trivialLatex, matrixCellsLatex), otherwise None
+        and the regularized tokens.
+    '''
+    latex = trivialLatex(hmlEqStr, meter)
+    if latex is not None:
+        return latex, None
+    # budgets count the steps and tokens of the whole list
+    if meter is None:
+        latex = matrixCellsLatex(hmlEqStr, reporter, executor)
+        if latex is not None:
+            return latex, None
+    return None, regularizeTokens(hmlEqStr, reporter, meter)
+
+
+# Substrings that a regularizer looks for in the tokens. Tokens are split
+# from the equation string and never joined, and the tokens regularizers
+# insert ("\\left", "\\sqrt", "_{", ...) hold none of the substrings of
+# the regularizers after them, so a regularizer whose substrings are not in
+# the equation string leaves the tokens as they are.
+_passTriggers = [
+    ("bracketRegularizer", r"left|LEFT|right|RIGHT|[()\[\]]"),
+    ("inEqualityRegularizer", r"le|ge|＞|＜"),
+    ("textRegularizer", r"[^\x00-\x7F]"),
+    ("sqrtRegularizer", r"sqrt|root"),
+    ("expRegularizer", r"[\^_]"),
+    ("barRegularizer", r"vec|dyad|acute|grave|dot|bar|hat|check|arch|"
+                       r"tilde|BOX|overline"),
+    ("fracRegularizer", r"over|OVER"),
+    ("limRegularizer", r"lim|->"),
+    ("sumRegularizer", "|".join(bigOperators)),
+    ("fontRegularizer", r"rm|RM|bold|BOLD|it|IT|sin|cos|tan|ln|log|alpha|"
+                        r"beta|gamma|theta|pi|sigma|angle|cap|cup|cdot|"
+                        r"CDOT|times|TIMES|triangle|sim|box|matrix|cases"),
+]
+passBits = {stage: 1 << bit for bit, (stage, _) in enumerate(_passTriggers)}
+_passTriggerRegexes = [(passBits[stage], re.compile(trigger))
+                       for stage, trigger in _passTriggers]
+
+
+def equationFeatures(hmlEqStr: str) -> int:
+    '''
+    Bitmap of the regularizers a hml equation string needs, with the bits
+    of passBits.
+    '''
+    features = 0
+    for bit, trigger in _passTriggerRegexes:
+        if trigger.search(hmlEqStr) is not None:
+            features |= bit
+    return features
 
+
+def tokenize(hmlEqStr: str) -> List[str]:
+    '''
+    Split a hml equation string into tokens.
+    '''
     strConverted = hmlEqStr.replace('`', ' ').replace('~', ' ')
     strConverted = strConverted.replace('{', ' { ')
     strConverted = strConverted.replace('}', ' } ')
@@ -52,42 +268,324 @@ def hmlEquation2latex(hmlEqStr: str) -> str:
 
     strList = strConverted.split(' ')
 
-    strList = list(filter(lambda x: x != "", strList))
+    return list(filter(lambda x: x != "", strList))
+
+
+def canonicalEquation(hmlEqStr: str) -> str:
+    '''
+    The tokens of a hml equation string joined by single spaces.
+
+    hmlEquation2latex only sees the tokens, so the spellings of an equation
+    which differ in runs of spaces, "`" and "~" spacers, or in spaces around
+    braces, brackets and "&" ("a + b", "a`+`b", "{a}over{b}") have the same
+    canonical form and convert the same, and it can key a cache of
+    conversions. "a+b" is one token and stays apart from "a + b".
+    Only the verbatim result of an equation over its budget shows the
+    string as written.
+    '''
+    return ' '.join(tokenize(hmlEqStr))
+
 
-    strList = bracketRegularizer(strList)
+def regularizeTokens(hmlEqStr: str, reporter: EquationDiagnostics = None,
+                     meter: BudgetMeter = None,
+                     schedule: bool = True) -> List[str]:
+    '''
+    Split a hml equation string into tokens and apply all regularizers.
+
+    With schedule, a regularizer is skipped if the features of the
+    equation show that it would leave the tokens as they are, and the
+    decision is counted by the reporter. A skipped regularizer does not
+    count rewrite steps in the meter.
+    '''
+    strList = tokenize(hmlEqStr)
+    if meter is not None:
+        meter.step("tokenize", len(strList))
+    features = equationFeatures(hmlEqStr) if schedule else None
+    strList = _regularizeList(strList, features, reporter, meter)
+    return matchBraces(strList)
+
+
+def _regularizeList(strList: List[str], features: int,
+                    reporter: EquationDiagnostics,
+                    meter: BudgetMeter) -> List[str]:
+    '''
+    Apply the regularizers before matchBraces to a token list, only those
+    in features if it is not None.
+    '''
+    def due(stage: str) -> bool:
+        if features is None:
+            return True
+        # every regularizer reports a list over the length limit
+        run = bool(features & passBits[stage]) or \
+            len(strList) > listLengthLimit
+        if reporter is not None:
+            reporter.schedule(stage, not run)
+        return run
+
+    if due("bracketRegularizer"):
+        strList = bracketRegularizer(strList, reporter, meter)
     #strList = fontRegularizer(strList)
 
     strList = matchCurlyBraces(strList)
-    strList = inEqualityRegularizer(strList)
-    strList = textRegularizer(strList)
-
-    strList = sqrtRegularizer(strList)
-    strList = expRegularizer(strList, True)
-    strList = barRegularizer(strList)
-    strList = fracRegularizer(strList)
-    strList = limRegularizer(strList)
-    strList = sumRegularizer(strList)
-    strList = expRegularizer(strList, False)
-    strList = fontRegularizer(strList)
-    strList = matchBraces(strList)
-
-    for key, candidate in enumerate(strList):
-        if candidate in convertMap["convertMap"]:
-            strList[key] = convertMap["convertMap"][candidate]
-        elif candidate in convertMap["middleConvertMap"]:
-            strList[key] = convertMap["middleConvertMap"][candidate]
+    if due("inEqualityRegularizer"):
+        strList = inEqualityRegularizer(strList, reporter, meter)
+    if due("textRegularizer"):
+        strList = textRegularizer(strList, reporter, meter)
+
+    if due("sqrtRegularizer"):
+        strList = sqrtRegularizer(strList, reporter, meter)
+    if due("expRegularizer"):
+        strList = expRegularizer(strList, True, reporter, meter)
+    if due("barRegularizer"):
+        strList = barRegularizer(strList, reporter, meter)
+    if due("fracRegularizer"):
+        strList = fracRegularizer(strList, reporter, meter)
+    if due("limRegularizer"):
+        strList = limRegularizer(strList, reporter, meter)
+    if due("sumRegularizer"):
+        strList = sumRegularizer(strList, reporter, meter)
+    if due("expRegularizer"):
+        strList = expRegularizer(strList, False, reporter, meter)
+    if due("fontRegularizer"):
+        strList = fontRegularizer(strList, reporter, meter)
+    return strList
+
+
+CellResult = Tuple[List[str], int, Counter, Counter]
+
+
+def _convertCell(cell: List[str]) -> CellResult:
+    '''
+    Rendered tokens of a matrix cell converted alone, the length of its
+    regularized token list, and the regularizers run on and skipped for
+    it. The tokens are None if the cell may convert differently in the
+    whole list: it reported a problem, its brackets are not matched, or
+    a marker at its end waits for the token after it.
+    '''
+    scratch = Diagnostics()
+    try:
+        strList = _regularizeList(list(cell), equationFeatures(' '.join(cell)),
+                                  scratch.bind(None), None)
+        if scratch.records or \
+                BraceIndex(strList, "\\left", "\\right").net != 0:
+            return None, 0, scratch.passesRun, scratch.passesSkipped
+        length = len(strList)
+        strList = mapTokens(strList)
+        # "\\left {" loses its brace to replaceBracket
+        offsets = BraceIndex(strList).offsets
+        if any(offset == 0 for elem, offset in zip(strList, offsets)
+               if elem == "{" or elem == "}"):
+            return None, 0, scratch.passesRun, scratch.passesSkipped
+        # the whole list goes on with a separator after the cell
+        strList.append("&")
+        if not plan.markers.isdisjoint(strList):
+            strList = renderStructures(strList)
+    except Exception:
+        # the whole equation decides what to raise
+        return None, 0, scratch.passesRun, scratch.passesSkipped
+    if strList[-1] != "&":
+        return None, 0, scratch.passesRun, scratch.passesSkipped
+    return strList[:-1], length, scratch.passesRun, scratch.passesSkipped
+
+
+def _convertCells(cells: List[List[str]]) -> List[CellResult]:
+    return [_convertCell(cell) for cell in cells]
 
+
+# cells sent to an executor at once
+cellChunkSize = 64
+
+
+def matrixCellsLatex(hmlEqStr: str, reporter: EquationDiagnostics = None,
+                     executor: Executor = None) -> str:
+    '''
+    Convert an equation with large matrix or cases groups cell by cell,
+    with the same result as all passes of hmlEquation2latex. The cells are
+    split by splitMatrixCells, and the rest of the equation is converted
+    with a placeholder for the cells of each group.
+
+    Parameters
+    ----------------------
+    hmlEqStr : str
+        A hml equation string to be converted.
+    reporter : EquationDiagnostics, optional
+        Receives the pass counts of the equation and its cells.
+    executor : concurrent.futures.Executor, optional
+        Converts chunks of cellChunkSize cells in parallel.
+
+    Returns
+    ----------------------
+    out : str
+        A converted latex string, None if the equation has no such group,
+        or if it reports a problem and needs all passes on the whole list.
+    '''
+    if "matrix" not in hmlEqStr and "cases" not in hmlEqStr:
+        return None
+    strList = tokenize(hmlEqStr)
+    # lists only grow, this one would be reported
+    if len(strList) > listLengthLimit:
+        return None
+    split = splitMatrixCells(strList)
+    if split is None:
+        return None
+    outer, groups = split
+
+    scratch = Diagnostics()
+    outer = _regularizeList(outer, equationFeatures(' '.join(outer)),
+                            scratch.bind(None), None)
+    if scratch.records:
+        return None
+    passesRun, passesSkipped = scratch.passesRun, scratch.passesSkipped
+
+    cells = [cell for groupCells, _ in groups for cell in groupCells]
+    chunks = [cells[start:start+cellChunkSize]
+              for start in range(0, len(cells), cellChunkSize)]
+    convertChunks = map if executor is None else executor.map
+    # the length of the whole list, without the placeholders
+    length = len(outer) - len(groups) + \
+        sum(len(separators) for _, separators in groups)
+    results = []  # type: List[List[str]]
+    for chunk in convertChunks(_convertCells, chunks):
+        for tokens, cellLength, cellRun, cellSkipped in chunk:
+            length = length + cellLength
+            if tokens is None or length > listLengthLimit:
+                return None
+            results.append(tokens)
+            passesRun.update(cellRun)
+            passesSkipped.update(cellSkipped)
+
+    latex = ' '.join(renderStructures(mapTokens(matchBraces(outer))))
+    matrixTemplates = plan.matrixTemplates.values()
+    for groupIdx, (groupCells, separators) in enumerate(groups):
+        tokens = list(results[0])
+        for separator, cellTokens in zip(separators, results[1:]):
+            tokens.append(separator)
+            tokens.extend(cellTokens)
+        del results[:len(groupCells)]
+        # the group must be rendered as the element of a matrix marker
+        marker = placeholder(groupIdx)
+        if latex.count(marker) != 1 or \
+                not any(begin + ' ' + marker + ' ' + end in latex
+                        for begin, end, _ in matrixTemplates):
+            return None
+        matrix = ' ' + ' '.join(tokens) + ' ' if tokens else ' '
+        matrix = matrix.replace(r'#', r' \\ ').replace(r'&amp;', r'&')
+        latex = latex.replace(' ' + marker + ' ', matrix)
+
+    if reporter is not None:
+        for stage, count in passesRun.items():
+            reporter.schedule(stage, False, count)
+        for stage, count in passesSkipped.items():
+            reporter.schedule(stage, True, count)
+    return replaceRootOf(latex)
+
+
+def replaceBracket(strList: List[str]) -> List[str]:
+    '''
+    "\\left {"  -> "\\left \\{"
+    "\\right }" -> "\\right \\}"
+    '''
+    for i, string in enumerate(strList):
+        if string == r'{':
+            if i > 0 and strList[i-1] == r'\left':
+                strList[i] = r'\{'
+        if string == r'}':
+            if i > 0 and strList[i-1] == r'\right':
+                strList[i] = r'\}'
+    return strList
+
+
+def mapTokens(strList: List[str]) -> List[str]:
+    '''
+    Replace regularized tokens with their latex form.
+    '''
+    tokenMap = plan.tokenMap
+    strList = [tokenMap.get(string, string) for string in strList]
     strList = [string for string in strList if len(string) != 0]
     strList = replaceBracket(strList)
     strList = backslashRemover(strList)
+    return strList
+
+
+def renderTokens(strList: List[str], meter: BudgetMeter = None,
+                 partner: List[int] = None) -> str:
+    '''
+    Render markers of mapped tokens and join them into the latex string.
+    `partner` is passed on to renderStructures.
+    '''
+    if not plan.markers.isdisjoint(strList):
+        strList = renderStructures(strList, meter, partner)
 
     strConverted = ' '.join(strList)
 
 
     #strConverted = replaceFrac(strConverted)
-    strConverted = replaceRootOf(strConverted)
-    strConverted = replaceAllMatrix(strConverted)
-    strConverted = replaceAllBar(strConverted)
-    strConverted = replaceAllBrace(strConverted)
+    strConverted = replaceRootOf(strConverted, meter)
 
     return strConverted
+
+
+def benchmark(equations: List[str], repeat: int = 3) -> dict:
+    '''
+    Time trivialLatex and all passes of hmlEquation2latex on the equations
+    trivialLatex accepts, best of repeat runs, and check that they give
+    the same result without any diagnostic.
+    '''
+    trivial = [equation for equation in equations
+               if trivialLatex(equation) is not None]
+
+    def fullPath(equation: str) -> str:
+        return renderTokens(mapTokens(regularizeTokens(equation, reporter)))
+
+    def best(function) -> float:
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for equation in trivial:
+                function(equation)
+            seconds.append(time.perf_counter() - start)
+        return min(seconds)
+
+    diagnostics = Diagnostics()
+    reporter = diagnostics.bind(None)
+    fullSeconds = best(fullPath)
+    trivialSeconds = best(trivialLatex)
+    identical = all(trivialLatex(equation) == fullPath(equation)
+                    for equation in trivial)
+    return {"equations": len(equations),
+            "trivial": len(trivial),
+            "fullSeconds": fullSeconds,
+            "trivialSeconds": trivialSeconds,
+            "speedup": fullSeconds / trivialSeconds if trivialSeconds
+            else None,
+            "identical": identical and not diagnostics.records}
+
+
+if __name__ == '__main__':
+    from .batch import readEquations
+    from .fuzz import generateTrivialEquation
+
+    parser = argparse.ArgumentParser(
+        description="Convert hml equations, or compare the trivial-equation "
+                    "path with all passes.")
+    parser.add_argument("files", nargs="*",
+                        help=".hml documents, corpus files or files of one "
+                             "equation per line")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="time trivialLatex against all passes")
+    parser.add_argument("--generate", type=int, default=0,
+                        help="add this many random strings of the "
+                             "characters of trivial equations")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    equations = readEquations(args.files)
+    rng = random.Random(args.seed)
+    equations.extend(generateTrivialEquation(rng, rng.randint(1, 40))
+                     for _ in range(args.generate))
+    if args.benchmark:
+        print(json.dumps(benchmark(equations, args.repeat)))
+    else:
+        for equation in equations:
+            print(hmlEquation2latex(equation))
@@ -1,15 +1,13 @@
-from typing import Dict, Tuple
-import json
-import codecs
-import os
+from typing import Dict, List, Tuple
+from .braceIndex import BraceIndex
+from .budget import BudgetMeter
+from .convertPlan import loadPlan
 
-with codecs.open(os.path.join(os.path.dirname(__file__), "convertMap.json"),
-                 "r", "utf8") as f:
-    convertMap = json.load(f)
+plan = loadPlan()
 
-barDict = convertMap["BarConvertMap"]
-matDict = convertMap["MatrixConvertMap"]
-braceDict = convertMap["BraceConvertMap"]
+barDict = plan.barTemplates
+matDict = plan.matrixTemplates
+braceDict = plan.braceTemplates
 
 
 def _findOutterBrackets(eqString: str, startIdx: int) -> Tuple[int, int]:
@@ -67,13 +65,15 @@ def _findBrackets(eqString: str, startIdx: int,
     raise ValueError("cannot find bracket")
 
 
-def replaceAllBar(eqString: str) -> str:
+def replaceAllBar(eqString: str, budget: BudgetMeter = None) -> str:
     '''
     replace hat-like equation string.
     '''
     def replaceBar(eqString: str, barStr: str, barElem: str) -> str:
         cursor = 0
         while True:
+            if budget is not None:
+                budget.step("replaceAllBar")
             cursor = eqString.find(barStr)
             if cursor == -1:
                 break
@@ -99,7 +99,7 @@ def replaceAllBar(eqString: str) -> str:
     return eqString
 
 
-def replaceAllMatrix(eqString: str) -> str:
+def replaceAllMatrix(eqString: str, budget: BudgetMeter = None) -> str:
     '''
     replace matrix-like equation
     '''
@@ -115,9 +115,11 @@ def replaceAllMatrix(eqString: str) -> str:
         return bracketStr
 
     def replaceMatrix(eqString: str, matStr: str,
-                      matElem: Dict[str, object]) -> str:
+                      matElem: Tuple[str, str, bool]) -> str:
         cursor = 0
         while True:
+            if budget is not None:
+                budget.step("replaceAllMatrix")
             cursor = eqString.find(matStr)
             if cursor == -1:
                 break
@@ -125,7 +127,8 @@ def replaceAllMatrix(eqString: str) -> str:
                 eStart, eEnd = _findBrackets(eqString, cursor, direction=1)
                 elem = replaceElementsOfMatrix(eqString[eStart:eEnd])
 
-                if matElem['removeOutterBrackets']:
+                begin, end, removeOutterBrackets = matElem
+                if removeOutterBrackets:
                     bStart, bEnd = _findOutterBrackets(eqString, cursor)
                     beforeMat = eqString[0:bStart]
                     afterMat = eqString[bEnd:]
@@ -133,8 +136,7 @@ def replaceAllMatrix(eqString: str) -> str:
                     beforeMat = eqString[0:cursor]
                     afterMat = eqString[eEnd:]
 
-                eqString = beforeMat + matElem['begin'] + \
-                    elem + matElem['end'] + afterMat
+                eqString = beforeMat + begin + elem + end + afterMat
             except ValueError:
                 return eqString
         return eqString
@@ -144,7 +146,7 @@ def replaceAllMatrix(eqString: str) -> str:
     return eqString
 
 
-def replaceRootOf(eqString: str) -> str:
+def replaceRootOf(eqString: str, budget: BudgetMeter = None) -> str:
     '''
     `root {1} of {2}` -> `\sqrt[1]{2}`
     '''
@@ -152,6 +154,8 @@ def replaceRootOf(eqString: str) -> str:
     ofStr = r"of"
 
     while True:
+        if budget is not None:
+            budget.step("replaceRootOf")
         rootCursor = eqString.find(rootStr)
         if rootCursor == -1:
             break
@@ -171,7 +175,7 @@ def replaceRootOf(eqString: str) -> str:
     return eqString
 
 
-def replaceFrac(eqString: str) -> str:
+def replaceFrac(eqString: str, budget: BudgetMeter = None) -> str:
     '''
     `{1} over {2}` -> `\frac{1}{2}`
     '''
@@ -179,6 +183,8 @@ def replaceFrac(eqString: str) -> str:
     latexFracString = r"\frac"
 
     while True:
+        if budget is not None:
+            budget.step("replaceFrac")
         cursor = eqString.find(hmlFracString)
 
         if cursor == -1:
@@ -197,7 +203,7 @@ def replaceFrac(eqString: str) -> str:
     return eqString
 
 
-def replaceAllBrace(eqString: str) -> str:
+def replaceAllBrace(eqString: str, budget: BudgetMeter = None) -> str:
     '''
     replace (over, under)brace equation string.
     '''
@@ -205,6 +211,8 @@ def replaceAllBrace(eqString: str) -> str:
         cursor = 0
 
         while True:
+            if budget is not None:
+                budget.step("replaceAllBrace")
             cursor = eqString.find(braceStr)
             if cursor == -1:
                 break
@@ -226,3 +234,112 @@ def replaceAllBrace(eqString: str) -> str:
     for braceKey, braceElem in braceDict.items():
         eqString = replaceBrace(eqString, braceKey, braceElem)
     return eqString
+
+
+def renderStructures(strList: List[str], budget: BudgetMeter = None,
+                     partner: List[int] = None) -> List[str]:
+    '''
+    Render matrix, bar and brace markers of a token list.
+
+    Brace groups are matched once, so a marker takes the group right after
+    it as its element and knows its enclosing group, instead of searching
+    the joined string for the marker and its brackets again.
+    A bar or brace marker followed by a single token takes that token as
+    its element, and a matrix marker skips such tokens up to its group.
+    A marker at the end of a group takes the next group after it without
+    consuming it, as the search for its brackets did, or an empty one if
+    there is none; tokens a matrix skipped without finding its group are
+    kept after it.
+
+    partner : brace partners as made by BraceIndex.partners, if already known.
+    return:
+        tokens to be joined with spaces.
+    '''
+    if partner is None:
+        partner = BraceIndex(strList).partners()
+
+    def groupString(tokens: List[str]) -> str:
+        return ' '.join([r'{'] + tokens + [r'}'])
+
+    def attach(frame: List, tokens: List[str], group: str) -> None:
+        '''
+        Render the pending marker of `frame` with its element.
+        '''
+        if budget is not None:
+            budget.step("renderStructures")
+        marker, firstGroup = frame[1]
+        frame[1] = None
+        skipped, frame[4] = frame[4], []
+        if marker in barDict:
+            frame[0].append(barDict[marker] + group)
+            frame[2] = True
+        elif marker in matDict:
+            begin, end, removeOutterBrackets = matDict[marker]
+            cells = ' ' + ' '.join(tokens) + ' ' if tokens else ' '
+            cells = cells.replace(r'#', r' \\ ').replace(r'&amp;', r'&')
+            frame[0].append(begin + cells + end)
+            if not tokens:
+                frame[0].extend(skipped)
+            if removeOutterBrackets:
+                frame[3] = True
+        elif firstGroup is None:
+            # brace marker, wait for the second group
+            frame[1] = (marker, group)
+        else:
+            frame[0].append(braceDict[marker] + firstGroup + '^' + group)
+
+    def nextGroup(idx: int) -> List[str]:
+        '''
+        Render the first group after `idx`, or return an empty list.
+        '''
+        for start in range(idx + 1, len(strList)):
+            if strList[start] == r'{' and partner[start] != -1:
+                return renderStructures(strList[start+1:partner[start]],
+                                        budget)
+        return []
+
+    def closePending(frame: List, idx: int = None) -> None:
+        while frame[1] is not None:
+            tokens = nextGroup(idx) if idx is not None else []
+            attach(frame, tokens, groupString(tokens))
+
+    # every frame is [tokens, pending marker, tight, unwrap, skipped] of a
+    # group. pending marker is (marker, first group of a brace marker).
+    # tight groups hold a bar, and are rendered without inner spaces
+    # like "{\overline{ x }}". unwrap groups hold a matrix, and lose their
+    # braces. skipped are the tokens a pending matrix marker passed over.
+    frames = [[[], None, False, False, []]]
+    for idx, elem in enumerate(strList):
+        frame = frames[-1]
+        if elem == r'{' and partner[idx] != -1:
+            frames.append([[], None, False, False, []])
+        elif elem == r'}' and partner[idx] != -1:
+            closePending(frame, idx)
+            frames.pop()
+            tokens, _, tight, unwrap, _ = frame
+            if unwrap:
+                group = ' '.join(tokens)
+            elif tight:
+                group = r'{' + ' '.join(tokens) + r'}'
+            else:
+                group = groupString(tokens)
+            parent = frames[-1]
+            if parent[1] is not None:
+                attach(parent, tokens, group)
+            elif unwrap:
+                parent[0].extend(tokens)
+            else:
+                parent[0].append(group)
+        elif elem in plan.markers:
+            closePending(frame)
+            frame[1] = (elem, None)
+        elif frame[1] is not None and frame[1][0] in matDict:
+            # a matrix takes its own group, skipping "\\frac" and the like
+            # put before it, as the search for its brackets did
+            frame[4].append(elem)
+        elif frame[1] is not None:
+            attach(frame, [elem], groupString([elem]))
+        else:
+            frame[0].append(elem)
+    closePending(frames[0])
+    return frames[0][0]
@@ -0,0 +1,134 @@
+'''
+Cells of large `matrix{...}` and `cases{...}` groups.
+
+A table of answers is one matrix with hundreds of cells, and every
+regularizer scans its whole token list once per keyword. The cells are
+independent of each other: a regularizer rewrites a keyword with the
+tokens next to it, or the brace group before or after it, so a cell whose
+first token takes nothing before it (like `over` does) and whose last token
+takes nothing after it (like `sqrt` does) is regularized alone the same as
+in the whole list. hmlEquation2latex converts the cells of such groups one
+at a time, and puts them back into the matrix template.
+
+This module only splits token lists, the conversion is in hulkEqParser.
+'''
+from typing import List, Tuple
+import re
+
+from .EqRegularizer import bigOperators
+
+# groups with fewer cells are converted as a whole
+minMatrixCells = 8
+
+Cells = Tuple[List[List[str]], List[str]]
+
+# "matrix", "pmatrix", "cases", ... as fontRegularizer finds them
+_matrixKeywordRegex = re.compile(r"(?:matrix|cases)$")
+_matrixNameRegex = re.compile(r"matrix|cases")
+_barKeywords = r"vec|dyad|acute|grave|dot|ddot|bar|hat|check|arch|tilde|BOX"
+# tokens a regularizer rewrites together with the token before them
+_takesBefore = re.compile(r"^[)\]]$|over|OVER|^(?:" + _barKeywords + ")")
+# tokens a regularizer rewrites together with the tokens after them
+_takesAfter = re.compile(
+    r"(?:left|LEFT|right|RIGHT|[\^_]|sqrt|root)$|over|OVER|lim|"
+    r"^(?:rm|RM|bold|BOLD|it|IT|" + _barKeywords + ")$|" +
+    "|".join(bigOperators))
+_separators = frozenset(["&", "#"])
+
+
+def placeholder(groupIdx: int) -> str:
+    '''
+    Token standing for the cells of a split group, which no regularizer or
+    convertMap entry changes.
+    '''
+    return "\x00" + str(groupIdx) + "\x00"
+
+
+def _partners(strList: List[str]) -> List[int]:
+    partner = [-1] * len(strList)
+    stack = []  # type: List[int]
+    for idx, elem in enumerate(strList):
+        if elem == "{":
+            stack.append(idx)
+        elif elem == "}" and stack:
+            openIdx = stack.pop()
+            partner[openIdx] = idx
+            partner[idx] = openIdx
+    return partner
+
+
+def _closedCell(cell: List[str]) -> bool:
+    '''
+    Whether no rewrite of the whole list reaches over the edges of a cell.
+    '''
+    return not cell or (_takesBefore.search(cell[0]) is None and
+                        _takesAfter.search(cell[-1]) is None)
+
+
+def _groupCells(tokens: List[str]) -> Cells:
+    '''
+    Cells of the content of a matrix group, split at its top-level "&"
+    and "#" tokens. A "#" written without spaces stays in its token, and
+    in the cell of that token. None if it can not be split.
+    '''
+    cells = [[]]  # type: List[List[str]]
+    separators = []  # type: List[str]
+    depth = 0
+    for elem in tokens:
+        # a nested matrix looks for its group over the cells
+        if _matrixNameRegex.search(elem) is not None:
+            return None
+        if depth == 0 and elem in _separators:
+            cells.append([])
+            separators.append(elem)
+            continue
+        if elem == "{":
+            depth = depth + 1
+        elif elem == "}":
+            depth = depth - 1
+        cells[-1].append(elem)
+    if len(cells) < minMatrixCells or \
+            not all(_closedCell(cell) for cell in cells):
+        return None
+    return cells, separators
+
+
+def splitMatrixCells(strList: List[str]) -> Tuple[List[str], List[Cells]]:
+    '''
+    Split the cells out of the matrix groups of a token list.
+
+    Parameters
+    ----------------------
+    strList : List[str]
+        Tokens of a hml equation string, before regularizing.
+
+    Returns
+    ----------------------
+    out : (List[str], List[(List[List[str]], List[str])])
+        The token list with the content of every split group replaced by
+        its placeholder, and the (cells, separators) of each group.
+        None if no group has minMatrixCells cells that convert alone.
+    '''
+    if any("\x00" in elem for elem in strList):
+        return None
+    partner = _partners(strList)
+    outer = []  # type: List[str]
+    groups = []  # type: List[Cells]
+    idx = 0
+    while idx < len(strList):
+        elem = strList[idx]
+        outer.append(elem)
+        if _matrixKeywordRegex.search(elem) is not None and \
+                idx + 1 < len(strList) and partner[idx+1] != -1 and \
+                strList[idx+1] == "{":
+            close = partner[idx+1]
+            cells = _groupCells(strList[idx+2:close])
+            if cells is not None:
+                outer.extend(["{", placeholder(len(groups)), "}"])
+                groups.append(cells)
+                idx = close + 1
+                continue
+        idx = idx + 1
+    if not groups:
+        return None
+    return outer, groups
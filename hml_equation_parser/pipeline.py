@@ -0,0 +1,239 @@
+'''
+Staged conversion of documents from files to files.
+
+Reading a document, converting it and writing its outputs wait on
+different things: the disk, the CPU and the disk again. Instead of doing
+the three one after the other for every document, reader threads read
+and hash the documents ahead, converter threads hand them to a process
+pool (or convert them in this process with one worker), and writer
+threads write the outputs. The stages are connected by bounded queues, so
+a stage which falls behind blocks the one before it instead of letting
+documents pile up in memory.
+
+Every stage counts its documents and bytes, and the time its threads were
+busy, waiting for input and blocked on a full queue. The stage whose
+threads are busy most of the time is the bottleneck: with a busy convert
+stage and readers blocked on its queue the build is CPU-bound, with busy
+readers and an idle convert stage it is I/O-bound.
+'''
+from typing import Iterable, Iterator, List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import queue
+import threading
+import time
+
+from .hmlParser import convertDocument, writeDocument
+from .diagnostics import Diagnostics, DiagnosticRecord
+from .budget import EquationBudget
+
+# (source, destination name, known hash, tag)
+Task = Tuple[str, str, str, object]
+# (tag, hash or None if failed, converted, records)
+Result = Tuple[object, str, bool, List[DiagnosticRecord]]
+
+_done = object()
+
+
+class StageCounters:
+    '''
+    Documents, bytes and thread time of one stage.
+    '''
+    def __init__(self, name: str, threads: int) -> None:
+        self.name = name
+        self.threads = threads
+        self.items = 0
+        self.bytes = 0
+        self.busySeconds = 0.0
+        self.waitSeconds = 0.0
+        self.blockedSeconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items: int = 0, size: int = 0, busy: float = 0.0,
+            wait: float = 0.0, blocked: float = 0.0) -> None:
+        with self._lock:
+            self.items += items
+            self.bytes += size
+            self.busySeconds += busy
+            self.waitSeconds += wait
+            self.blockedSeconds += blocked
+
+    def report(self, seconds: float) -> dict:
+        '''
+        Counts and throughput over a run of `seconds`. utilization is the
+        share of the time of all threads spent busy.
+        '''
+        return {"threads": self.threads,
+                "items": self.items,
+                "bytes": self.bytes,
+                "busySeconds": self.busySeconds,
+                "waitSeconds": self.waitSeconds,
+                "blockedSeconds": self.blockedSeconds,
+                "itemsPerSecond": self.items / seconds if seconds else 0.0,
+                "MBPerSecond": self.bytes / seconds / 1e6 if seconds else 0.0,
+                "utilization": self.busySeconds / self.threads / seconds
+                if seconds else 0.0}
+
+
+def _convertContent(content: bytes, source: str, budget: EquationBudget
+                    ) -> Tuple[dict, List[DiagnosticRecord]]:
+    diagnostics = Diagnostics()
+    return convertDocument(content, diagnostics, budget, source), \
+        diagnostics.records
+
+
+def _failure(tag: object, source: str, e: Exception) -> Result:
+    return tag, None, False, [DiagnosticRecord(
+        source, "build", None, "{}: {}".format(type(e).__name__, e))]
+
+
+class _Stage:
+    '''
+    Threads taking items from inbox, handing what `handle` makes of each
+    to outbox, and results to the result queue. When all of them have
+    taken _done, one _done is put in outbox for each next thread.
+    '''
+    def __init__(self, name: str, threads: int, handle, inbox: queue.Queue,
+                 outbox: queue.Queue, nextThreads: int,
+                 results: queue.Queue) -> None:
+        self.counters = StageCounters(name, threads)
+        self.handle = handle
+        self.inbox = inbox
+        self.outbox = outbox
+        self.nextThreads = nextThreads
+        self.results = results
+        self._alive = threads
+        self._lock = threading.Lock()
+        for _ in range(threads):
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self) -> None:
+        counters = self.counters
+        while True:
+            start = time.perf_counter()
+            item = self.inbox.get()
+            ready = time.perf_counter()
+            if item is _done:
+                counters.add(wait=ready - start)
+                break
+            task = item[0]
+            try:
+                nextItem, result, size = self.handle(item)
+            except Exception as e:
+                nextItem, result, size = None, _failure(task[3], task[0], e), 0
+            handled = time.perf_counter()
+            if result is not None:
+                self.results.put(result)
+            if nextItem is not None:
+                self.outbox.put(nextItem)
+            counters.add(1, size, handled - ready, ready - start,
+                         time.perf_counter() - handled)
+        with self._lock:
+            self._alive -= 1
+            last = self._alive == 0
+        if last:
+            for _ in range(self.nextThreads):
+                self.outbox.put(_done)
+
+
+class DocumentPipeline:
+    '''
+    Read, convert and write documents in stages, see the module.
+
+    Parameters
+    ----------------------
+    readers : int
+        Threads reading and hashing documents.
+    workers : int
+        Processes converting documents. With 1, documents are converted
+        by a thread of this process.
+    writers : int
+        Threads writing outputs.
+    queueSize : int
+        Capacity of the queues between stages, in documents.
+    budget : EquationBudget, optional
+        Budget for each equation.
+    '''
+    def __init__(self, readers: int = 2, workers: int = 1, writers: int = 2,
+                 queueSize: int = 16, budget: EquationBudget = None) -> None:
+        self.readers = readers
+        self.workers = workers
+        self.writers = writers
+        self.queueSize = queueSize
+        self.budget = budget
+        self.stages = []  # type: List[_Stage]
+        self.seconds = 0.0
+
+    def run(self, tasks: Iterable[Task]) -> Iterator[Result]:
+        '''
+        Convert the documents of tasks, skipping those with their known
+        hash, and write the outputs to "<destination>.xml" and ".html" as
+        writeDocument does. Results come in the order they are done.
+        '''
+        start = time.perf_counter()
+        budget = self.budget
+        executor = None
+        if self.workers > 1:
+            executor = ProcessPoolExecutor(self.workers)
+
+        def read(item: Tuple[Task]) -> tuple:
+            task, = item
+            with open(task[0], "rb") as f:
+                content = f.read()
+            digest = hashlib.sha1(content).hexdigest()
+            if digest == task[2]:
+                return None, (task[3], digest, False, []), len(content)
+            return (task, content, digest), None, len(content)
+
+        def convert(item: Tuple[Task, bytes, str]) -> tuple:
+            task, content, digest = item
+            if executor is None:
+                outputs, records = _convertContent(content, task[0], budget)
+            else:
+                outputs, records = executor.submit(
+                    _convertContent, content, task[0], budget).result()
+            return (task, outputs, digest, records), None, len(content)
+
+        def write(item: Tuple[Task, dict, str, list]) -> tuple:
+            task, outputs, digest, records = item
+            writeDocument(outputs, task[1])
+            size = len(outputs["xml"]) + len(outputs["html"].encode("utf8"))
+            return None, (task[3], digest, True, records), size
+
+        taskQueue = queue.Queue(self.queueSize)
+        convertQueue = queue.Queue(self.queueSize)
+        writeQueue = queue.Queue(self.queueSize)
+        results = queue.Queue()
+        converters = max(self.workers, 1)
+        self.stages = [
+            _Stage("read", self.readers, read, taskQueue, convertQueue,
+                   converters, results),
+            _Stage("convert", converters, convert, convertQueue, writeQueue,
+                   self.writers, results),
+            _Stage("write", self.writers, write, writeQueue, results, 1,
+                   results)]
+
+        def feed() -> None:
+            for task in tasks:
+                taskQueue.put((task,))
+            for _ in range(self.readers):
+                taskQueue.put(_done)
+        threading.Thread(target=feed, daemon=True).start()
+
+        try:
+            while True:
+                result = results.get()
+                if result is _done:
+                    break
+                yield result
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            self.seconds = time.perf_counter() - start
+
+    def report(self) -> dict:
+        '''
+        Counters of every stage over the last run.
+        '''
+        return {stage.counters.name: stage.counters.report(self.seconds)
+                for stage in self.stages}
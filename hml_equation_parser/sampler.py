@@ -0,0 +1,122 @@
+'''
+Sample the stack of a running conversion, for flame graphs.
+
+A profiling timer (setitimer ITIMER_PROF, on the CPU time of the process)
+interrupts the process every `interval` seconds, and the SIGPROF handler
+counts the stack the main thread was running, from the function which
+started the sampler. Only the interrupted stack is walked, so the cost is
+one walk per sample rather than a hook per call as in cProfile, and long
+production batches can be profiled as they run.
+
+Frames are labelled "module:function" without line numbers, e.g.
+"EqRegularizer:fracRegularizer" or "hulkReplaceMethod:replaceFrac", so that
+every sample of a function adds up. The samples are written in the
+collapsed stack format of flamegraph.pl, inferno and speedscope: one line
+per stack, its frames from the root separated by ";", and its number of
+samples. As the stacks start at the same function in every process, the
+samples of worker processes merge with those of the caller.
+
+    python -m hml_equation_parser.batch --profile batch.folded docs/*.hml
+    flamegraph.pl batch.folded > batch.svg
+'''
+from typing import Dict, Iterable
+from collections import Counter
+from types import CodeType
+import os
+import signal
+import sys
+
+
+def frameLabel(code: CodeType) -> str:
+    '''
+    "module:function" label of a code object, the module being the file
+    name without extension, or its package for an __init__.py.
+    '''
+    path, fileName = os.path.split(code.co_filename)
+    module = os.path.splitext(fileName)[0]
+    if module == "__init__":
+        module = os.path.basename(path)
+    return "{}:{}".format(module, code.co_name)
+
+
+class StackSampler:
+    '''
+    Count the stacks of the main thread every `interval` seconds of CPU
+    time, between start and stop, from the function calling start (or
+    entering the with block). Unix only.
+
+    Parameters
+    ----------------------
+    interval : float
+        Seconds of CPU time between samples.
+    '''
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.samples = Counter()  # type: Counter
+        self._labels = {}  # type: Dict[CodeType, str]
+        self._previous = None
+        self._root = None
+
+    def _sample(self, signum: int, frame) -> None:
+        labels = self._labels
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            label = labels.get(code)
+            if label is None:
+                label = labels[code] = frameLabel(code)
+            stack.append(label)
+            if frame is self._root:
+                break
+            frame = frame.f_back
+        stack.reverse()
+        self.samples[";".join(stack)] += 1
+
+    def _start(self, root) -> None:
+        if not hasattr(signal, "setitimer"):
+            raise OSError("stack sampling needs signal.setitimer")
+        self._root = root
+        self._previous = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def start(self) -> None:
+        '''
+        Start sampling. Must be called from the main thread.
+        '''
+        self._start(sys._getframe(1))
+
+    def stop(self) -> None:
+        '''
+        Stop sampling, keeping the samples taken.
+        '''
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self._previous or signal.SIG_DFL)
+        self._root = None
+
+    def __enter__(self) -> 'StackSampler':
+        self._start(sys._getframe(1))
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def merge(self, samples: Dict[str, int]) -> None:
+        '''
+        Add the samples of another sampler, e.g. of a worker process.
+        '''
+        self.samples.update(samples)
+
+    def collapsed(self) -> Iterable[str]:
+        '''
+        Collapsed stack lines of the samples, sorted by stack.
+        '''
+        for stack in sorted(self.samples):
+            yield "{} {}".format(stack, self.samples[stack])
+
+    def write(self, fileName: str) -> None:
+        '''
+        Write the samples in collapsed stack format.
+        '''
+        with open(fileName, "w", encoding="utf8") as f:
+            for line in self.collapsed():
+                f.write(line + "\n")
@@ -0,0 +1,193 @@
+'''
+Serialize the trees of parseHml, after convertEquation, without the
+generic ElementTree serializer.
+
+The trees have a fixed schema from config.json NodeNames: a root holding
+paragraphs, each holding Char and Equation leaves with text only. For
+them the XML is a join of escaped texts between fixed tags, written to a
+buffered stream at once, with the same bytes as ElementTree.write. A tree
+with anything else (attributes, text around the paragraphs, nested
+elements) is written by ElementTree.
+
+The compact form is JSON Lines: one line per paragraph, a list of
+[tag, text] pairs.
+
+    python -m hml_equation_parser.serializer test.hml
+'''
+from typing import BinaryIO, Iterator, List, Union
+from xml.etree.ElementTree import Element, ElementTree, tostring
+import argparse
+import io
+import json
+import time
+
+Tree = Union[ElementTree, Element]
+Destination = Union[str, BinaryIO]
+
+# encodings ElementTree.write writes without a declaration
+encodings = ["us-ascii", "utf-8"]
+
+
+def _escape(text: str) -> str:
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+
+def _root(tree: Tree) -> Element:
+    return tree.getroot() if isinstance(tree, ElementTree) else tree
+
+
+def _isPlain(elem: Element) -> bool:
+    return not elem.attrib and not elem.text and not elem.tail
+
+
+def _pieces(root: Element) -> List[str]:
+    '''
+    Pieces of the XML of a tree of the schema, None if it is not one.
+    '''
+    if not _isPlain(root):
+        return None
+    if not len(root):
+        return ["<", root.tag, " />"]
+    pieces = ["<", root.tag, ">"]
+    append = pieces.append
+    for paragraph in root:
+        if not _isPlain(paragraph):
+            return None
+        tag = paragraph.tag
+        if not len(paragraph):
+            pieces.extend(["<", tag, " />"])
+            continue
+        append("<" + tag + ">")
+        for leaf in paragraph:
+            if len(leaf) or leaf.attrib:
+                # ElementTree writes the tail too
+                append(tostring(leaf, encoding="unicode"))
+                continue
+            text = leaf.text
+            if text:
+                append("<" + leaf.tag + ">")
+                append(_escape(text))
+                append("</" + leaf.tag + ">")
+            else:
+                append("<" + leaf.tag + " />")
+            if leaf.tail:
+                append(_escape(leaf.tail))
+        append("</" + tag + ">")
+    append("</" + root.tag + ">")
+    return pieces
+
+
+def xmlBytes(tree: Tree, encoding: str = "us-ascii") -> bytes:
+    '''
+    XML of a tree as ElementTree.write writes it with encoding
+    ("us-ascii" or "utf-8"). With "us-ascii", characters outside ASCII
+    are character references.
+    '''
+    if encoding not in encodings:
+        raise ValueError("unsupported encoding: {}".format(encoding))
+    root = _root(tree)
+    pieces = _pieces(root)
+    if pieces is None:
+        return tostring(root, encoding=encoding)
+    return "".join(pieces).encode(encoding, "xmlcharrefreplace")
+
+
+def xmlString(tree: Tree) -> str:
+    '''
+    XML of a tree as ElementTree.write writes it by default, as str.
+    '''
+    return xmlBytes(tree).decode("ascii")
+
+
+def writeXml(tree: Tree, dst: Destination,
+             encoding: str = "us-ascii") -> None:
+    '''
+    Write a tree to a file name or binary stream, as
+    ElementTree.write(dst, encoding) does.
+    '''
+    data = xmlBytes(tree, encoding)
+    if isinstance(dst, str):
+        with open(dst, "wb") as f:
+            f.write(data)
+    else:
+        dst.write(data)
+
+
+def iterJsonLines(tree: Tree) -> Iterator[str]:
+    '''
+    Compact JSON line of every paragraph, a list of [tag, text] pairs.
+    '''
+    for paragraph in _root(tree):
+        yield json.dumps([[leaf.tag, leaf.text or ""] for leaf in paragraph],
+                         ensure_ascii=False, separators=(",", ":"))
+
+
+def writeJsonLines(tree: Tree, dst: Destination) -> None:
+    '''
+    Write the JSON lines of a tree in UTF-8 to a file name or binary stream.
+    '''
+    data = "".join(line + "\n" for line in iterJsonLines(tree)) \
+        .encode("utf8")
+    if isinstance(dst, str):
+        with open(dst, "wb") as f:
+            f.write(data)
+    else:
+        dst.write(data)
+
+
+def benchmark(fileNames: List[str], repeat: int = 5) -> dict:
+    '''
+    Time ElementTree.write, writeXml and writeJsonLines on the converted
+    trees of documents, in memory, and check that the XML is the same.
+    '''
+    from .hmlParser import parseHml, convertEquation
+    from .diagnostics import Diagnostics
+
+    trees = []  # type: List[ElementTree]
+    for fileName in fileNames:
+        for tree in parseHml(fileName, Diagnostics()):
+            trees.append(convertEquation(tree, Diagnostics()))
+
+    def timed(write) -> float:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for tree in trees:
+                write(tree, io.BytesIO())
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        return best
+
+    stats = {"trees": len(trees)}
+    identical = True
+    for encoding in encodings:
+        for tree in trees:
+            expected, written = io.BytesIO(), io.BytesIO()
+            tree.write(expected, encoding)
+            writeXml(tree, written, encoding)
+            identical = identical and \
+                expected.getvalue() == written.getvalue()
+        stats[encoding] = {
+            "elementTreeSeconds": timed(
+                lambda tree, f: tree.write(f, encoding)),
+            "writeXmlSeconds": timed(
+                lambda tree, f: writeXml(tree, f, encoding))}
+    stats["jsonLinesSeconds"] = timed(writeJsonLines)
+    stats["identical"] = identical
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Compare writeXml with ElementTree.write.")
+    parser.add_argument("files", nargs="+", help=".hml documents")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(json.dumps(benchmark(args.files, args.repeat)))
@@ -1,6 +1,8 @@
 from setuptools import setup
+from setuptools.command.build_py import build_py
 from codecs import open
 from os import path
+import runpy
 
 desc = 'Convert eqaution string in hml to latex string.'
 
@@ -13,12 +15,26 @@ try:
 except:
     long_description = desc
 
+
+class BuildPyWithConvertPlan(build_py):
+    '''
+    Generate hml_equation_parser/_convertPlan.py from convertMap.json
+    before building.
+    '''
+    def run(self):
+        # run by path, as the package cannot be imported before it is built
+        script = path.join(path.dirname(path.abspath(__file__)),
+                           'hml_equation_parser', 'buildConvertPlan.py')
+        runpy.run_path(script)['writePlanModule']()
+        build_py.run(self)
+
 setup (
         name                    = 'hml_equation_parser',
         version                 = '1.0.12',
         packages                = ['hml_equation_parser'],
         package_data            = {'': ['*.json']},
         install_requires        = ['pypandoc'],
+        extras_require          = {'numpy': ['numpy']},
         author                  = 'Hyeongseok.Oh.hulk',
         author_email            = 'snuboy89@gmail.com',
         url                     = "https://github.com/OpenBapul/hml-equation-parser",
@@ -31,4 +47,5 @@ setup (
         ],
         description             = desc,
         long_description        = long_description,
+        cmdclass                = {'build_py': BuildPyWithConvertPlan},
     )
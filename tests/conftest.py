@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+_document = '<?xml version="1.0" encoding="UTF-8"?><HWPML><HEAD/><BODY>' \
+    '<SECTION><P><TEXT><EQUATION><SCRIPT>{}</SCRIPT></EQUATION></TEXT></P>' \
+    '</SECTION></BODY></HWPML>'
+
+
+def _hmlDocument(script: str) -> str:
+    '''
+    A .hml document holding one equation, or, for None, a truncated one
+    which cannot be parsed.
+    '''
+    if script is None:
+        return _document[:60]
+    return _document.format(script)
+
+
+@pytest.fixture
+def hmlDocument():
+    return _hmlDocument
+
+
+@pytest.fixture
+def writeDocuments(tmp_path, monkeypatch):
+    '''
+    Write documents of {name: script} into a temporary working directory.
+    '''
+    monkeypatch.chdir(tmp_path)
+
+    def write(scripts: dict) -> None:
+        for name, script in scripts.items():
+            if os.path.dirname(name):
+                os.makedirs(os.path.dirname(name), exist_ok=True)
+            with open(name, "w", encoding="utf8") as f:
+                f.write(_hmlDocument(script))
+    return write
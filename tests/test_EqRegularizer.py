@@ -0,0 +1,43 @@
+import pytest
+
+from hml_equation_parser import Diagnostics, eq2latex
+
+
+@pytest.mark.parametrize("hmlEqStr, latex", [
+    # big operators without limits, alone or at the end
+    ("prod", r"\prod"),
+    ("a + SMALLPROD", r"a + \prod"),
+    ("BIGOTIMES", r"\bigotimes"),
+    ("a TIMES BIGOTIMES", r"a \times \bigotimes"),
+    ("BIGUPLUS", r"\biguplus"),
+    ("sum", r"\sum"),
+    ("sum _", r"\sum _"),
+    # lower limit without upper limit
+    ("prod _{i} x", r"\prod _ { i } x"),
+    ("coprod _{i} x", r"\coprod _ { i } x"),
+    ("BIGOPLUS _{i} A_i", r"\bigoplus _ { i } { A _ { i } }"),
+    ("sum _i x", r"\sum _ { i } x"),
+    ("sum _ {i}", r"\sum _ { i }"),
+    # both limits
+    ("sum _{i} ^{n} x", r"\sum _ { i } ^ { n } x"),
+    ("sum _i ^n x", r"\sum _ { i } ^ { n } x"),
+    ("sum_i^n x", r"\sum _ { i } ^ { n } x"),
+    ("prod _ {i} ^n x", r"\prod _ { i } ^ { n } x"),
+    ("int _0 ^1 f", r"\int _ { 0 } ^ { 1 } f"),
+    # text glued before the operator is kept
+    ("M=prod _{k}^{n} k", r"M= \prod _ { k } ^ { n } k"),
+    ("y=BIGOPLUS _{i}^{n} V", r"y= \bigoplus _ { i } ^ { n } V"),
+    ("M=sum _k ^n k", r"M= \sum _ { k } ^ { n } k"),
+    ("M=sum _ {k} ^n k", r"M= \sum _ { k } ^ { n } k"),
+    ("M=sum x", r"M= \sum x"),
+])
+def test_sumRegularizer(hmlEqStr, latex):
+    assert eq2latex(hmlEqStr) == latex
+
+
+def test_length_limit_reported_once():
+    diagnostics = Diagnostics()
+    eq2latex(" ".join("x_{{{}}}".format(i) for i in range(150)), diagnostics,
+             equationId=1)
+    assert len(diagnostics.records) == 1
+    assert sum(diagnostics.counters.values()) == 1
@@ -0,0 +1,21 @@
+import zipfile
+
+import pytest
+
+from hml_equation_parser import Diagnostics
+from hml_equation_parser.archive import parseArchive
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_parseArchive_failed_member(tmp_path, workers, hmlDocument):
+    bundle = str(tmp_path / "bundle.zip")
+    with zipfile.ZipFile(bundle, "w") as zf:
+        zf.writestr("a.hml", hmlDocument("a over b"))
+        zf.writestr("broken.hml", hmlDocument(None))
+        zf.writestr("c.hml", hmlDocument("over"))
+    diagnostics = Diagnostics()
+    members = list(parseArchive(bundle, diagnostics, workers, convert=True))
+    assert [name for name, _ in members] == ["a.hml", "c.hml"]
+    assert [(record.equationId, record.stage)
+            for record in diagnostics.records] == [
+        ("broken.hml", "archive"), (("c.hml", 0, 0), "fracRegularizer")]
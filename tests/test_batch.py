@@ -0,0 +1,47 @@
+import itertools
+
+import pytest
+
+from hml_equation_parser import Diagnostics, EquationBudget, eq2latex
+from hml_equation_parser import budget as budgetModule
+from hml_equation_parser.batch import convertBatch
+
+equations = ["{{a_{}}} over {{b+{}}} + sqrt {{x^2}}".format(i, i)
+             for i in range(300)]
+
+
+class FakeClock:
+    '''
+    A clock advancing a millisecond every time it is read, so the time
+    spent on an equation does not depend on the machine.
+    '''
+    def __init__(self) -> None:
+        self.ticks = itertools.count()
+
+    def monotonic(self) -> float:
+        return next(self.ticks) * 0.001
+
+
+@pytest.mark.parametrize("backend", ["python", "numpy"])
+def test_convertBatch_time_budget(backend, monkeypatch):
+    if backend == "numpy":
+        pytest.importorskip("numpy")
+    monkeypatch.setattr(budgetModule, "time", FakeClock())
+    # one equation reads the clock about 150 times, the batch far more
+    budget = EquationBudget(maxTime=1.0)
+    results = convertBatch(equations, Diagnostics(), budget, backend=backend)
+    assert results == [eq2latex(equation, Diagnostics(), budget=budget)
+                       for equation in equations]
+    assert not any(latex.startswith(r"\text") for latex in results)
+
+
+@pytest.mark.parametrize("backend", ["python", "numpy"])
+def test_convertBatch_failed_equation(backend):
+    if backend == "numpy":
+        pytest.importorskip("numpy")
+    batch = ["a over b", "over", "x^", "hat {x}"]
+    diagnostics = Diagnostics()
+    results = convertBatch(batch, diagnostics, backend=backend)
+    assert results == [eq2latex(equation) for equation in batch]
+    assert results[1] == r"\text{over}"
+    assert [record.equationId for record in diagnostics.records] == [1, 2]
@@ -0,0 +1,49 @@
+import os
+
+from hml_equation_parser import Diagnostics
+from hml_equation_parser.build import buildDocuments
+
+sources = ["a.hml", "b.hml"]
+
+
+def counts(report: dict) -> tuple:
+    return tuple(report[key] for key in ("unchanged", "rehashed",
+                                         "converted", "failed"))
+
+
+def test_buildDocuments_rerun(writeDocuments):
+    writeDocuments({"a.hml": "a over b", "b.hml": "x^2"})
+    assert counts(buildDocuments(sources, "out")) == (0, 0, 2, 0)
+    assert counts(buildDocuments(sources, "out")) == (2, 0, 0, 0)
+    # same content with a new modification time is only hashed again
+    stat = os.stat("b.hml")
+    os.utime("b.hml", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert counts(buildDocuments(sources, "out")) == (1, 1, 0, 0)
+    assert counts(buildDocuments(sources, "out")) == (2, 0, 0, 0)
+
+
+def test_buildDocuments_changed(writeDocuments):
+    writeDocuments({"a.hml": "a over b", "b.hml": "x^2"})
+    buildDocuments(sources, "out")
+    writeDocuments({"b.hml": "sqrt {y}"})
+    assert counts(buildDocuments(sources, "out")) == (1, 0, 1, 0)
+    with open(os.path.join("out", "b.hml.xml"), encoding="utf8") as f:
+        assert "sqrt" in f.read()
+    # a missing output is converted again
+    os.remove(os.path.join("out", "a.hml.html"))
+    assert counts(buildDocuments(sources, "out")) == (1, 0, 1, 0)
+    assert os.path.exists(os.path.join("out", "a.hml.html"))
+
+
+def test_buildDocuments_failed(writeDocuments):
+    writeDocuments({"a.hml": "a over b", "b.hml": None})
+    diagnostics = Diagnostics()
+    assert counts(buildDocuments(sources, "out", diagnostics)) == \
+        (0, 0, 1, 1)
+    assert [(record.equationId, record.stage)
+            for record in diagnostics.records] == [("b.hml", "build")]
+    # a failed document is left out of the manifest, and retried
+    assert counts(buildDocuments(sources, "out", Diagnostics())) == \
+        (1, 0, 0, 1)
+    writeDocuments({"b.hml": "x^2"})
+    assert counts(buildDocuments(sources, "out")) == (1, 0, 1, 0)
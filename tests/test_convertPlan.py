@@ -0,0 +1,19 @@
+import os
+import runpy
+
+from hml_equation_parser.convertPlan import loadPlan
+
+script = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                      "hml_equation_parser", "buildConvertPlan.py")
+
+
+def test_plan_module_from_script(tmp_path):
+    # run by path, as setup.py does
+    build = runpy.run_path(script)
+    path = str(tmp_path / "_convertPlan.py")
+    build["writePlanModule"](path)
+    generated = runpy.run_path(path)
+    assert generated["tables"] == build["planTables"](build["readMaps"]())
+    plan = loadPlan()
+    assert generated["fingerprint"] == plan.fingerprint
+    assert dict(plan.tokenMap) == generated["tables"]["tokenMap"]
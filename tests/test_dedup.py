@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+from hml_equation_parser import Diagnostics
+from hml_equation_parser.build import buildDocuments
+from hml_equation_parser.dedup import (convertDocuments, equationKey,
+                                       outputName)
+
+
+def test_outputName():
+    assert outputName("a/b.hml") != outputName("a_b.hml")
+    assert outputName("/data/a.hml") == os.path.join("data", "a.hml")
+    assert outputName("../a.hml") == os.path.join("__", "a.hml")
+    assert outputName("bundle.zip/sub/a.hml") == \
+        os.path.join("bundle.zip", "sub", "a.hml")
+
+
+def test_equationKey():
+    assert equationKey("a`+`b") == equationKey("a + b") == "a + b"
+    assert equationKey("a`+`b", canonical=False) == "a`+`b"
+
+
+# build names its outputs as dedup does
+@pytest.mark.parametrize("convert", [convertDocuments, buildDocuments])
+def test_distinct_outputs(convert, writeDocuments):
+    writeDocuments({"a/b.hml": "a over b", "a_b.hml": "x^2"})
+    convert(["a/b.hml", "a_b.hml"], "out")
+    with open(os.path.join("out", "a", "b.hml.xml"), encoding="utf8") as f:
+        assert "frac" in f.read()
+    with open(os.path.join("out", "a_b.hml.xml"), encoding="utf8") as f:
+        assert "x ^ { 2 }" in f.read()
+
+
+def test_convertDocuments_failed_equation(writeDocuments):
+    writeDocuments({"a.hml": "over", "b.hml": "a over b"})
+    diagnostics = Diagnostics(strict=True)
+    report = convertDocuments(["a.hml", "b.hml"], "out", diagnostics)
+    assert report["unique"] == 2
+    assert report["failed"] == 1
+    assert len(diagnostics.records) == 1
+    with open(os.path.join("out", "a.hml.xml"), encoding="utf8") as f:
+        assert r"\text{over}" in f.read()
+    with open(os.path.join("out", "b.hml.xml"), encoding="utf8") as f:
+        assert "frac" in f.read()
@@ -0,0 +1,78 @@
+import pytest
+
+from hml_equation_parser.equationScan import (iterEquationScripts,
+                                              _parsedScripts)
+
+equation = "<EQUATION><SCRIPT>{}</SCRIPT></EQUATION>"
+paragraph = "<P><TEXT>{}<CHAR>t</CHAR></TEXT></P>"
+
+
+def endnote(*paragraphs: str) -> str:
+    return "<ENDNOTE><PARALIST>{}</PARALIST></ENDNOTE>".format(
+        "".join(paragraphs))
+
+
+def table(*paragraphs: str) -> str:
+    return "<TABLE><ROW><CELL><PARALIST>{}</PARALIST></CELL></ROW>" \
+        "</TABLE>".format("".join(paragraphs))
+
+
+def document(*paragraphs: str) -> str:
+    return "<HWPML><HEAD/><BODY><SECTION>{}</SECTION></BODY><TAIL/>" \
+        "</HWPML>".format("".join(paragraphs))
+
+
+def streams(scripts) -> dict:
+    '''
+    Scripts by stream, in order. The scan yields a solution paragraph
+    before the question paragraph holding it, while the parsed trees
+    yield all questions first.
+    '''
+    out = {"question": [], "solution": []}
+    for location, script in scripts:
+        out[location[0]].append((location, script))
+    return out
+
+
+@pytest.mark.parametrize("source", [
+    "<HWPML><BODY><SECTION>{}{}</SECTION></BODY><TAIL/></HWPML>".format(
+        paragraph.format(equation.format("a")),
+        paragraph.format(equation.format("b"))),
+    # only the first SECTION of BODY is read
+    "<HWPML><HEAD><SECTION/></HEAD><BODY><SECTION>{}</SECTION></BODY>"
+    "</HWPML>".format(paragraph.format(equation.format("a over b"))),
+    "<HWPML><HEAD><SECTION>{}</SECTION></HEAD><BODY><SECTION>{}</SECTION>"
+    "<SECTION>{}</SECTION></BODY></HWPML>".format(
+        paragraph.format(equation.format("x")),
+        paragraph.format(equation.format("a over b")),
+        paragraph.format(equation.format("z"))),
+    # solutions interleaved with questions
+    document(
+        paragraph.format(equation.format("q1") + endnote(
+            paragraph.format(equation.format("s1")),
+            paragraph.format(equation.format("s2")))),
+        paragraph.format(equation.format("q2")),
+        paragraph.format(endnote(paragraph.format(equation.format("s3"))) +
+                         equation.format("q3"))),
+    # a solution inside a solution comes before its paragraph
+    document(
+        paragraph.format(equation.format("q1") + endnote(
+            paragraph.format(equation.format("s1") + endnote(
+                paragraph.format(equation.format("t1")))),
+            paragraph.format(equation.format("s2"))))),
+    # paragraphs of tables are in neither stream, and neither are their
+    # solutions
+    document(
+        paragraph.format(equation.format("q1") + table(
+            paragraph.format(equation.format("c1")),
+            paragraph.format(equation.format("c2") + endnote(
+                paragraph.format(equation.format("c3")))))),
+        paragraph.format(table(paragraph.format(equation.format("c4"))) +
+                         equation.format("q2") + endnote(
+            paragraph.format(equation.format("s1"))))),
+])
+def test_scan_matches_parse(source):
+    source = source.encode("utf8")
+    scripts = list(iterEquationScripts(source))
+    assert scripts
+    assert streams(scripts) == streams(_parsedScripts(source))
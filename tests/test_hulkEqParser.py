@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from hml_equation_parser import (Diagnostics, DiagnosticRecord,
+                                 EquationParseError)
+from hml_equation_parser.fuzz import generateTrivialEquation
+from hml_equation_parser.hulkEqParser import (trivialLatex, regularizeTokens,
+                                              mapTokens, renderTokens,
+                                              hmlEquation2latex,
+                                              escapeVerbatim,
+                                              matrixCellsLatex)
+
+
+def test_trivialLatex_matches_all_passes():
+    rng = random.Random(0)
+    diagnostics = Diagnostics()
+    reporter = diagnostics.bind(None)
+    trivial = 0
+    for _ in range(20000):
+        equation = generateTrivialEquation(rng, rng.randint(1, 40))
+        latex = trivialLatex(equation)
+        if latex is None:
+            continue
+        trivial += 1
+        assert latex == renderTokens(mapTokens(
+            regularizeTokens(equation, reporter))), equation
+    assert not diagnostics.records
+    assert trivial > 1000
+
+
+@pytest.mark.parametrize("hmlEqStr, stage, tokenIndex", [
+    ("over", "fracRegularizer", 0),
+    ("a over", "fracRegularizer", 1),
+    ("x^", "expRegularizer", 0),
+    ("lim", "limRegularizer", 0),
+])
+def test_failed_equation_lenient(hmlEqStr, stage, tokenIndex):
+    diagnostics = Diagnostics()
+    assert hmlEquation2latex(hmlEqStr, diagnostics, 7) == \
+        escapeVerbatim(hmlEqStr)
+    assert diagnostics.records == [DiagnosticRecord(
+        7, stage, tokenIndex, "IndexError: list index out of range")]
+    assert hmlEquation2latex(hmlEqStr) == escapeVerbatim(hmlEqStr)
+    with pytest.raises(EquationParseError):
+        hmlEquation2latex(hmlEqStr, Diagnostics(strict=True))
+
+
+# cells which convert alone, and cells which keep their group whole
+matrixCells = ["a", "x^2", "{a over b}", "sqrt {x}", "{1} over {2}",
+               "a_{i}", "alpha", "LEFT ( x RIGHT )", "{ {a} over {b} }",
+               "-1", "rm {AB}", "x &amp; y", "{ {a} ^{2} }", "", "f(x)=2x",
+               "{bar {AB}}"]
+wholeCells = ["bar {AB}", "{matrix{a&b}}"]
+
+
+@pytest.mark.parametrize("keyword", ["matrix", "pmatrix", "cases",
+                                     "eqalign"])
+@pytest.mark.parametrize("size", [10, 60, 300, 1000])
+@pytest.mark.parametrize("whole", [False, True])
+def test_matrixCellsLatex_matches_all_passes(keyword, size, whole):
+    rng = random.Random(size)
+    # large groups have mostly single letters, to stay within the length
+    # limit up to 300 cells; 1000 cells go over it on both paths
+    cells = [rng.choice(matrixCells) if size < 300 or idx % 4 == 0 else
+             rng.choice("abxyz") for idx in range(size)]
+    if whole:
+        cells[rng.randrange(size)] = rng.choice(wholeCells)
+    separators = ["#" if idx % 4 == 3 else "&" for idx in range(size - 1)]
+    equation = "y = " + keyword + "{" + " ".join([cells[0]] + [
+        separator + " " + cell for separator, cell in
+        zip(separators, cells[1:])]) + "} + 1"
+    expected = Diagnostics()
+    latex = renderTokens(mapTokens(regularizeTokens(equation,
+                                                    expected.bind(None))))
+    diagnostics = Diagnostics()
+    assert hmlEquation2latex(equation, diagnostics) == latex
+    assert diagnostics.records == expected.records
+    split = matrixCellsLatex(equation) is not None
+    # only matrix and cases groups are split, within the length limit
+    assert split == (keyword != "eqalign" and not whole and
+                     not expected.records)
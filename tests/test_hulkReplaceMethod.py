@@ -0,0 +1,26 @@
+import pytest
+
+from hml_equation_parser import eq2latex
+
+
+@pytest.mark.parametrize("hmlEqStr, latex", [
+    ("matrix{a} x", r"\begin{matrix} a \end{matrix} x"),
+    ("pmatrix{a&b#c&d}",
+     r"{ p \begin{matrix} a & b \\ c & d \end{matrix} }"),
+    # a matrix marker takes its group, not the "\frac" put before it
+    ("matrix{a & b} over c", r"\begin{matrix} a & b \end{matrix} { c }"),
+    ("cases{a # b} over c", r"\begin{cases} a  \\  b \end{cases} { c }"),
+    ("{matrix{a&b}} over c",
+     r"\frac \begin{matrix} a & b \end{matrix} { c }"),
+    # tokens a matrix passed over without finding its group are kept
+    ("{ cases x }", r"\begin{cases} \end{cases} x"),
+    ("eqalign DEG eqalign PHI",
+     r"\eqalign{ }  ^\circ \eqalign{ } \Phi"),
+    ("omega eqalign omega eqalign omega",
+     r"\omega \eqalign{ } \omega \eqalign{ } \omega"),
+    # a marker at the end of a group takes the next group after it
+    ("over hat {a} {a} over {b}",
+     r"{ {\widehat{ a }} { a } } \frac { a } { \frac } { b }"),
+])
+def test_renderStructures_matrix(hmlEqStr, latex):
+    assert eq2latex(hmlEqStr) == latex